@@ -71,7 +71,7 @@ class TradingDiscordBot(commands.Bot):
             
             total_in_positions = 0
             for position in open_positions:
-                total_in_positions += float(position.get('collateral', 0))
+                total_in_positions += float(position.collateral_usd or 0)
             
             embed = discord.Embed(
                 title="💰 Portfolio Balance",
@@ -155,9 +155,9 @@ class TradingDiscordBot(commands.Bot):
                 
                 embed.add_field(
                     name=f"{i+1}. {pair_name} {side}",
-                    value=f"Size: ${float(position.get('collateral', 0)):.2f}\n"
-                          f"Leverage: {float(position.get('leverage', 0)):.1f}x\n"
-                          f"Entry: ${float(position.get('openPrice', 0)):.5f}\n"
+                    value=f"Size: ${float(position.collateral_usd or 0):.2f}\n"
+                          f"Leverage: {float(position.leverage_x or 0):.1f}x\n"
+                          f"Entry: ${float(position.open_price or 0):.5f}\n"
                           f"P&L: {value}",
                     inline=True
                 )
@@ -178,7 +178,8 @@ class TradingDiscordBot(commands.Bot):
             
             # Get recent history
             trader_address = self.trading_bot.sdk.ostium.get_public_address()
-            history = await self.trading_bot.sdk.subgraph.get_recent_history(trader_address, last_n_orders=10)
+            # (only orders executed since the last /history are pulled from the subgraph)
+            history = await self.trading_bot.history_store.get_recent_history(trader_address, last_n_orders=10)
             
             if not history:
                 embed = discord.Embed(
@@ -216,8 +217,8 @@ class TradingDiscordBot(commands.Bot):
                 
                 embed.add_field(
                     name=f"{i+1}. {pair_name} {side} ({status})",
-                    value=f"Size: ${float(trade.get('collateral', 0)):.2f}\n"
-                          f"Entry: ${float(trade.get('openPrice', 0)):.5f}\n"
+                    value=f"Size: ${float(trade.collateral_usd or 0):.2f}\n"
+                          f"Price: ${float(trade.execution_price or 0):.5f}\n"
                           f"{pnl_info}",
                     inline=True
                 )
@@ -264,8 +265,8 @@ class TradingDiscordBot(commands.Bot):
                     name=f"Trade ID: `{trade_id}`",
                     value=f"Pair: {pair_name}\n"
                           f"Side: {side}\n"
-                          f"Size: ${float(position.get('collateral', 0)):.2f}\n"
-                          f"Entry: ${float(position.get('openPrice', 0)):.5f}",
+                          f"Size: ${float(position.collateral_usd or 0):.2f}\n"
+                          f"Entry: ${float(position.open_price or 0):.5f}",
                     inline=True
                 )
             
@@ -302,7 +303,7 @@ class TradingDiscordBot(commands.Bot):
                 return
             
             # Close the trade
-            close_result = self.trading_bot.sdk.ostium.close_trade(int(pair_id), int(trade_index))
+            close_result = await self.trading_bot.sdk.async_ostium.close_trade(int(pair_id), int(trade_index))
             
             if close_result:
                 embed = discord.Embed(
@@ -6,36 +6,38 @@ Sends notifications to Discord via webhook
 
 import os
 import asyncio
-import aiohttp
 import logging
 from datetime import datetime
 from typing import Dict, Optional
 
+from ostium_python_sdk.http_pool import HttpPool, get_default_http_pool
+
 logger = logging.getLogger(__name__)
 
 class DiscordNotifier:
     """Discord webhook notifier for trading bot"""
     
-    def __init__(self, webhook_url: str):
+    def __init__(self, webhook_url: str, http: Optional[HttpPool] = None):
         """Initialize Discord notifier with webhook URL"""
         self.webhook_url = webhook_url
+        # Reuse the SDK's keep-alive connections instead of a new session per notification
+        self.http = http or get_default_http_pool()
         logger.info("Discord notifier initialized")
     
     async def send_webhook(self, embed_data: Dict) -> bool:
         """Send webhook to Discord"""
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    self.webhook_url,
-                    json={'embeds': [embed_data]},
-                    headers={'Content-Type': 'application/json'}
-                ) as response:
-                    if response.status == 204:
-                        logger.info("Discord notification sent successfully")
-                        return True
-                    else:
-                        logger.error(f"Discord webhook failed: {response.status}")
-                        return False
+            async with self.http.session().post(
+                self.webhook_url,
+                json={'embeds': [embed_data]},
+                headers={'Content-Type': 'application/json'}
+            ) as response:
+                if response.status == 204:
+                    logger.info("Discord notification sent successfully")
+                    return True
+                else:
+                    logger.error(f"Discord webhook failed: {response.status}")
+                    return False
         except Exception as e:
             logger.error(f"Error sending Discord webhook: {e}")
             return False
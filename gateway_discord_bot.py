@@ -200,7 +200,7 @@ class GatewayDiscordBot:
             
             total_in_positions = 0
             for position in open_positions:
-                total_in_positions += float(position.get('collateral', 0))
+                total_in_positions += float(position.collateral_usd or 0)
             
             fields = [
                 {
@@ -266,9 +266,9 @@ class GatewayDiscordBot:
                 
                 embed['fields'].append({
                     'name': f"{i+1}. {pair_name} {side}",
-                    'value': f"Size: ${float(position.get('collateral', 0)):.2f}\n"
-                             f"Leverage: {float(position.get('leverage', 0)):.1f}x\n"
-                             f"Entry: ${float(position.get('openPrice', 0)):.5f}",
+                    'value': f"Size: ${float(position.collateral_usd or 0):.2f}\n"
+                             f"Leverage: {float(position.leverage_x or 0):.1f}x\n"
+                             f"Entry: ${float(position.open_price or 0):.5f}",
                     'inline': True
                 })
             
@@ -0,0 +1,96 @@
+import threading
+
+# USDC base units (6 decimals)
+DEFAULT_APPROVE_AMOUNT = 1000000 * 10 ** 6
+DEFAULT_TOP_UP_BELOW = 250000 * 10 ** 6
+
+
+class AllowanceTracker:
+    """
+    USDC allowance granted to the trading storage contract, cached per owner.
+
+    The allowance of an owner is read from the chain once (and again after a reset); every
+    trade then reserves its collateral from the cached value, so the trade path needs no
+    allowance() call. Approvals are sent by the clients (see Ostium._reserve_allowance),
+    the tracker only keeps the count.
+
+    Policy:
+        approve_amount: allowance set by every approve (base units)
+        top_up_below: once the remaining allowance drops below this, it is topped up
+            with a new approve - at startup (prepare_allowance) or, with background=True,
+            in the background after the trade that crossed it
+        background: top up in the background, without holding up the trade
+
+    An approve sets the allowance outright, and it is sent with the next nonce of the
+    account: trades sent after it spend the new allowance, so the count is reset to
+    approve_amount as soon as the approve is sent. A trade that needs more than the cached
+    allowance re-reads it and, if it's still short, approves inline and waits for the receipt.
+    """
+
+    def __init__(self, approve_amount=DEFAULT_APPROVE_AMOUNT, top_up_below=DEFAULT_TOP_UP_BELOW, background=True,
+                 verbose=False):
+        self.approve_amount = approve_amount
+        self.top_up_below = top_up_below
+        self.background = background
+        self.verbose = verbose
+
+        self._remaining = {}  # owner -> allowance left
+        self._topping_up = set()  # owners with an approve in flight
+        self._lock = threading.Lock()
+
+        self.top_ups = 0
+
+    def log(self, message):
+        if self.verbose:
+            print(message)
+
+    def is_synced(self, owner):
+        return owner in self._remaining
+
+    def remaining(self, owner):
+        return self._remaining.get(owner)
+
+    def sync(self, owner, allowance):
+        """Sets the allowance of owner as read from the chain"""
+        with self._lock:
+            self._remaining[owner] = allowance
+
+    def reserve(self, owner, amount):
+        """Takes amount from the cached allowance, False when unknown or short (nothing is taken)"""
+        with self._lock:
+            remaining = self._remaining.get(owner)
+            if remaining is None or remaining < amount:
+                return False
+            self._remaining[owner] = remaining - amount
+            return True
+
+    def start_top_up(self, owner):
+        """True when the allowance of owner is below top_up_below and no approve is in flight yet"""
+        with self._lock:
+            remaining = self._remaining.get(owner)
+            if remaining is None or remaining >= self.top_up_below or owner in self._topping_up:
+                return False
+            self._topping_up.add(owner)
+        self.log(f"AllowanceTracker: allowance of {owner} below {self.top_up_below}, topping up")
+        return True
+
+    def approved(self, owner):
+        """An approve of approve_amount was sent for owner"""
+        with self._lock:
+            self._remaining[owner] = self.approve_amount
+            self.top_ups += 1
+
+    def finish_top_up(self, owner, succeeded):
+        """The approve of owner was mined (or failed: the allowance is read again next time)"""
+        with self._lock:
+            self._topping_up.discard(owner)
+        if not succeeded:
+            self.reset(owner)
+
+    def reset(self, owner=None):
+        """Forgets the allowance of owner (of everyone with None), the next trade reads it from the chain"""
+        with self._lock:
+            if owner is None:
+                self._remaining.clear()
+            else:
+                self._remaining.pop(owner, None)
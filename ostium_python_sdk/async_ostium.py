@@ -0,0 +1,415 @@
+import asyncio
+import threading
+import traceback
+from typing import Optional
+
+from web3 import AsyncWeb3, HTTPProvider, Web3
+from web3.exceptions import TimeExhausted
+
+from .allowance import AllowanceTracker
+from .gas import FeeOracle, GasProfileCache
+from .nonce_manager import NonceManager
+from .ostium import Ostium, OstiumBase
+from .receipt_watcher import ReceiptWatcher
+from .utils import convert_to_scaled_integer, fromErrorCodeToMessage, to_base_units
+
+
+class AsyncOstium(OstiumBase):
+    """
+    Coroutine-based counterpart of Ostium on AsyncWeb3 / AsyncHTTPProvider.
+
+    Same methods, arguments and results as Ostium, but every RPC call - including the
+    wait for the receipt - is awaited instead of blocking, so many orders can be in flight
+    at once on one event loop. Signing, the trade arguments, orderId extraction and
+    track_order_and_trade are shared with Ostium (OstiumBase).
+
+    Nonces come from the shared NonceManager, so concurrent calls - on this loop or in
+    other threads - never collide and don't wait on each other's receipts.
+
+    Usage:
+        w3 = AsyncWeb3(AsyncHTTPProvider(rpc_url))
+        ostium = AsyncOstium(w3, usdc_address, trading_storage_address, trading_address, private_key)
+        result = await ostium.perform_trade(trade_params, at_price=price)
+    """
+
+    def __init__(self, w3: AsyncWeb3, usdc_address: str, ostium_trading_storage_address: str,
+                 ostium_trading_address: str, private_key: str, verbose=False, use_delegation=False,
+                 nonce_manager: Optional[NonceManager] = None,
+                 allowance_tracker: Optional[AllowanceTracker] = None,
+                 gas_profiles: Optional[GasProfileCache] = None, fee_oracle: Optional[FeeOracle] = None,
+                 receipt_watcher: Optional[ReceiptWatcher] = None) -> None:
+        super().__init__(w3, usdc_address, ostium_trading_storage_address, ostium_trading_address,
+                         private_key, verbose=verbose, use_delegation=use_delegation, nonce_manager=nonce_manager,
+                         allowance_tracker=allowance_tracker, gas_profiles=gas_profiles, fee_oracle=fee_oracle,
+                         receipt_watcher=receipt_watcher)
+        self._blocking = None  # see _blocking_client
+
+    async def get_block_number(self):
+        return (await self.web3.eth.get_block('latest'))['number']
+
+    async def get_nonce(self, address):
+        return await self.web3.eth.get_transaction_count(address)
+
+    async def _allocate_nonce(self, address):
+        if not self.nonces.is_synced(address):
+            self.nonces.sync(address, await self.web3.eth.get_transaction_count(address, 'pending'))
+        return self.nonces.allocate(address)
+
+    async def _build_transaction(self, function, account, trader_address=None, action="trade"):
+        """Transaction calling a Trading function, wrapped in delegatedAction when delegating"""
+        if self.use_delegation and trader_address:
+            function = self._delegated(function, trader_address, action)
+        if self._chain_id is None:
+            self._chain_id = await self.web3.eth.chain_id
+        return await function.build_transaction(self._transaction_params(account, function))
+
+    async def _submit(self, tx, account, private_key=None):
+        """Signs tx with a locally allocated nonce and sends it, returns the transaction hash"""
+        for attempt in range(2):
+            nonce = tx['nonce'] = await self._allocate_nonce(account.address)
+            signed_tx = self.web3.eth.account.sign_transaction(tx, private_key=private_key or self.private_key)
+            try:
+                tx_hash = await self.web3.eth.send_raw_transaction(signed_tx.raw_transaction)
+            except Exception as e:
+                tx_hash = self._known_hash(signed_tx, e)
+                if tx_hash is None:
+                    # Retried once, with a nonce resynced from the chain, when only the nonce was wrong
+                    if not self._nonce_failed(account.address, nonce, e) or attempt:
+                        raise
+                    continue
+            except BaseException:
+                self._send_interrupted(account.address, nonce)
+                raise
+            self._submitted(tx, tx_hash)
+            return tx_hash
+
+    async def _wait_for_receipt(self, tx_hash, address):
+        try:
+            receipt = await self.web3.eth.wait_for_transaction_receipt(tx_hash)
+        except TimeExhausted:
+            self.gas_profiles.observe(tx_hash, None)
+            self._transaction_dropped(address)
+            raise
+        self.gas_profiles.observe(tx_hash, receipt)
+        if receipt['status'] == 0:
+            raise self._reverted(tx_hash, receipt, await self._replay_error(tx_hash, receipt))
+        return receipt
+
+    async def _replay_error(self, tx_hash, receipt):
+        try:
+            tx = await self.web3.eth.get_transaction(tx_hash)
+        except Exception as e:
+            self.log(f"Could not fetch reverted transaction {tx_hash.hex()}: {e}")
+            return None
+        try:
+            await self.web3.eth.call(*self._replay_call(tx, receipt))
+        except Exception as e:
+            return e
+        return None
+
+    async def _send_transaction(self, tx, account, label, private_key=None):
+        """Signs and sends tx from account, returns its receipt"""
+        tx_hash = await self._submit(tx, account, private_key)
+        self.log(f"{label} TX Hash: {tx_hash.hex()}")
+        return await self._wait_for_receipt(tx_hash, account.address)
+
+    def _default_receipt_watcher(self):
+        # The watcher polls from its own thread, on a blocking Web3 to the same node
+        return ReceiptWatcher(Web3(HTTPProvider(self.web3.provider.endpoint_uri)), verbose=self.verbose)
+
+    async def perform_trade(self, trade_params, at_price):
+        self.log(f"Performing trade with params: {trade_params}")
+        account = self._get_account()
+        amount = to_base_units(trade_params['collateral'], decimals=6)
+        owner = await self._reserve_allowance(account, amount, self.use_delegation, trade_params.get('trader_address'))
+
+        try:
+            self.log(f"Final trade parameters being sent: {trade_params}")
+            trade, order_type, slippage = self._open_trade_args(trade_params, at_price, account.address)
+            trade_tx = await self._build_transaction(
+                self.ostium_trading_contract.functions.openTrade(trade, order_type, slippage),
+                account, trade_params.get('trader_address'))
+
+            trade_receipt = await self._send_transaction(trade_tx, account, "Trade")
+            return {
+                'receipt': trade_receipt,
+                'order_id': self._get_order_id(trade_receipt)
+            }
+
+        except Exception as e:
+            self.allowances.reset(owner)
+            reason_string, suggestion = fromErrorCodeToMessage(e, verbose=self.verbose)
+            print(f"An error ({str(e)}) occurred during the trading process - parsed as {reason_string}")
+            raise Exception(f'{reason_string}\n\n{suggestion}' if suggestion is not None else reason_string)
+
+    async def submit_trade(self, trade_params, at_price):
+        """Same trade as perform_trade, returning a PendingTransaction once sent, see Ostium.submit_trade"""
+        self.log(f"Submitting trade with params: {trade_params}")
+        account = self._get_account()
+        amount = to_base_units(trade_params['collateral'], decimals=6)
+        owner = await self._reserve_allowance(account, amount, self.use_delegation, trade_params.get('trader_address'))
+        try:
+            trade, order_type, slippage = self._open_trade_args(trade_params, at_price, account.address)
+            trade_tx = await self._build_transaction(
+                self.ostium_trading_contract.functions.openTrade(trade, order_type, slippage),
+                account, trade_params.get('trader_address'))
+            trade_tx_hash = await self._submit(trade_tx, account)
+        except Exception as e:
+            self.allowances.reset(owner)
+            raise self._parsed_error(e, "trading")
+        return self._pending_transaction(trade_tx_hash, account.address)
+
+    async def cancel_limit_order(self, pair_id, trade_index, trader_address=None):
+        account = self._get_account()
+        try:
+            trade_tx = await self._build_transaction(
+                self.ostium_trading_contract.functions.cancelOpenLimitOrder(int(pair_id), int(trade_index)),
+                account, trader_address, action="cancel limit order")
+            trade_receipt = await self._send_transaction(trade_tx, account, "Cancel Limit Order")
+            self.log(f"Cancel Limit Order Receipt: {trade_receipt}")
+            return trade_receipt
+
+        except Exception as e:
+            raise self._parsed_error(e, "cancel limit order")
+
+    async def close_trade(self, pair_id, trade_index, close_percentage=100, trader_address=None):
+        """
+        Close a trade partially or completely, see Ostium.close_trade
+
+        Returns:
+            A dictionary containing the transaction receipt and order ID
+        """
+        self.log(f"Closing trade for pair {pair_id}, index {trade_index}")
+        account = self._get_account()
+
+        trade_tx = await self._close_trade_tx(account, pair_id, trade_index, close_percentage, trader_address)
+        trade_receipt = await self._send_transaction(trade_tx, account, "Trade")
+        return {
+            'receipt': trade_receipt,
+            'order_id': self._get_order_id(trade_receipt)
+        }
+
+    async def submit_close_trade(self, pair_id, trade_index, close_percentage=100, trader_address=None):
+        """Same close as close_trade, returning a PendingTransaction once sent, see Ostium.submit_trade"""
+        self.log(f"Submitting close of trade for pair {pair_id}, index {trade_index}")
+        account = self._get_account()
+        trade_tx = await self._close_trade_tx(account, pair_id, trade_index, close_percentage, trader_address)
+        return self._pending_transaction(await self._submit(trade_tx, account), account.address)
+
+    async def close_trades(self, positions, close_percentage=100, trader_address=None):
+        """
+        Close several trades at once, see Ostium.close_trades: the closes are sent back to back
+        and their receipts awaited concurrently
+
+        Returns:
+            One dictionary per position, in order, with the transaction receipt and order ID -
+            or receipt None and the error when that close failed
+        """
+        account = self._get_account()
+        positions = list(positions)
+        # Built concurrently (gas estimation while a function has no profile), then signed and sent in order
+        built = await asyncio.gather(*[
+            self._close_trade_tx(account, pair_id, trade_index, close_percentage, trader_address)
+            for pair_id, trade_index in positions], return_exceptions=True)
+
+        tx_hashes = []
+        for trade_tx in built:
+            if isinstance(trade_tx, Exception):
+                tx_hashes.append(trade_tx)
+                continue
+            try:
+                tx_hashes.append(await self._submit(trade_tx, account))
+            except Exception as e:
+                tx_hashes.append(e)
+
+        async def close_result(tx_hash):
+            try:
+                if isinstance(tx_hash, Exception):
+                    raise tx_hash
+                trade_receipt = await self._wait_for_receipt(tx_hash, account.address)
+                return {'receipt': trade_receipt, 'order_id': self._get_order_id(trade_receipt)}
+            except Exception as e:
+                return {'receipt': None, 'order_id': None, 'error': str(e)}
+
+        return list(await asyncio.gather(*[close_result(tx_hash) for tx_hash in tx_hashes]))
+
+    def _close_trade_tx(self, account, pair_id, trade_index, close_percentage, trader_address):
+        close_percentage = to_base_units(close_percentage, decimals=2)
+        return self._build_transaction(
+            self.ostium_trading_contract.functions.closeTradeMarket(
+                int(pair_id), int(trade_index), int(close_percentage)),
+            account, trader_address, action="close trade")
+
+    async def remove_collateral(self, pair_id, trade_index, remove_amount):
+        self.log(
+            f"Remove collateral for trade for pair {pair_id}, index {trade_index}: {remove_amount} USDC")
+        account = self._get_account()
+
+        amount = to_base_units(remove_amount, decimals=6)
+        trade_tx = await self._build_transaction(
+            self.ostium_trading_contract.functions.removeCollateral(int(pair_id), int(trade_index), int(amount)),
+            account)
+
+        remove_receipt = await self._send_transaction(trade_tx, account, "Remove Collateral")
+        self.log(f"Remove Collateral Receipt: {remove_receipt}")
+        return remove_receipt
+
+    async def add_collateral(self, pairID, index, collateral, trader_address=None):
+        """Add collateral to an existing position, see Ostium.add_collateral"""
+        account = self._get_account()
+        try:
+            amount = to_base_units(collateral, decimals=6)
+            await self._reserve_allowance(account, amount, self.use_delegation, trader_address)
+
+            add_collateral_tx = await self._build_transaction(
+                self.ostium_trading_contract.functions.topUpCollateral(int(pairID), int(index), amount),
+                account, trader_address, action="add collateral")
+
+            add_collateral_receipt = await self._send_transaction(add_collateral_tx, account, "Add Collateral")
+            self.log(f"Add Collateral Receipt: {add_collateral_receipt}")
+            return add_collateral_receipt
+
+        except Exception as e:
+            self.allowances.reset(self._allowance_owner(account, self.use_delegation, trader_address))
+            print("An error occurred during the add collateral process:")
+            traceback.print_exc()
+            raise e
+
+    async def update_tp(self, pair_id, trade_index, tp_price, trader_address=None):
+        """Update take profit price for an existing position, see Ostium.update_tp"""
+        self.log(
+            f"Updating TP for pair {pair_id}, index {trade_index} to {tp_price}")
+        account = self._get_account()
+        try:
+            tp_value = to_base_units(tp_price, decimals=18)
+            update_tp_tx = await self._build_transaction(
+                self.ostium_trading_contract.functions.updateTp(int(pair_id), int(trade_index), tp_value),
+                account, trader_address, action="update TP")
+            return await self._send_transaction(update_tp_tx, account, "Update TP")
+
+        except Exception as e:
+            print("An error occurred during the update tp process:")
+            traceback.print_exc()
+            raise e
+
+    async def update_sl(self, pairID, index, sl, trader_address=None):
+        """Update stop loss price for an existing position, see Ostium.update_sl"""
+        account = self._get_account()
+        try:
+            sl_value = to_base_units(sl, decimals=18)
+            update_sl_tx = await self._build_transaction(
+                self.ostium_trading_contract.functions.updateSl(int(pairID), int(index), sl_value),
+                account, trader_address, action="update SL")
+            return await self._send_transaction(update_sl_tx, account, "Update SL")
+
+        except Exception as e:
+            raise self._parsed_error(e, "update sl")
+
+    async def prepare_allowance(self, trader_address=None):
+        """Reads the USDC allowance and tops it up now if it's below the threshold, see Ostium.prepare_allowance"""
+        account = self._get_account()
+        owner = self._allowance_owner(account, self.use_delegation, trader_address)
+        await self._read_allowance(owner)
+        if owner == account.address and self.allowances.start_top_up(owner):
+            await self._top_up_allowance(account)
+        return self.allowances.remaining(owner)
+
+    async def _read_allowance(self, owner):
+        allowance = await self.usdc_contract.functions.allowance(
+            owner, self.ostium_trading_storage_address).call()
+        self.allowances.sync(owner, allowance)
+
+    async def _reserve_allowance(self, account, collateral, use_delegation, trader_address=None):
+        """Takes collateral from the cached allowance, see Ostium._reserve_allowance"""
+        owner = self._allowance_owner(account, use_delegation, trader_address)
+        if not self.allowances.is_synced(owner):
+            await self._read_allowance(owner)
+
+        if not self.allowances.reserve(owner, collateral):
+            await self._read_allowance(owner)
+            if not self.allowances.reserve(owner, collateral):
+                if use_delegation:
+                    raise self._missing_allowance(owner)
+                await self._top_up_allowance(account)
+                if not self.allowances.reserve(owner, collateral):
+                    raise self._missing_allowance(owner)
+
+        if owner == account.address and self.allowances.background and self.allowances.start_top_up(owner):
+            # Not on the caller's loop, which may be gone (e.g. per-request loops) before the approve is
+            # mined: the blocking client sends it from a thread of its own, as Ostium does
+            threading.Thread(target=self._blocking_client()._top_up_allowance, args=(account,),
+                             name="ostium-allowance-top-up", daemon=True).start()
+        return owner
+
+    def _blocking_client(self):
+        """Ostium on the receipt watcher's blocking Web3, sharing this client's nonces, allowances and gas"""
+        if self._blocking is None:
+            self._blocking = Ostium(
+                self.receipt_watcher.web3, self.usdc_address, self.ostium_trading_storage_address,
+                self.ostium_trading_address, self.private_key, verbose=self.verbose,
+                use_delegation=self.use_delegation, nonce_manager=self.nonces, allowance_tracker=self.allowances,
+                gas_profiles=self.gas_profiles, fee_oracle=self.fee_oracle, receipt_watcher=self.receipt_watcher)
+        return self._blocking
+
+    async def _top_up_allowance(self, account):
+        """Approves allowances.approve_amount and waits for the receipt, returns whether it succeeded"""
+        succeeded = False
+        try:
+            approve_tx = await self.usdc_contract.functions.approve(
+                self.ostium_trading_storage_address,
+                self.allowances.approve_amount
+            ).build_transaction({'from': account.address})
+
+            approve_tx_hash = await self._submit(approve_tx, account)
+            self.allowances.approved(account.address)
+            self.log(f"Approval TX Hash: {approve_tx_hash.hex()}")
+
+            approve_receipt = await self._wait_for_receipt(approve_tx_hash, account.address)
+            self.log(f"Approval Receipt: {approve_receipt}")
+            succeeded = approve_receipt['status'] == 1
+        except Exception as e:
+            print(f"An error occurred during the approval process: {e}")
+        finally:
+            self.allowances.finish_top_up(account.address, succeeded)
+        return succeeded
+
+    async def withdraw(self, amount, receiving_address):
+        account = self._get_account()
+        try:
+            amount_in_base_units = to_base_units(amount, decimals=6)
+
+            if not self.web3.is_address(receiving_address):
+                raise ValueError("Invalid Arbitrum address format")
+
+            transfer_tx = await self.usdc_contract.functions.transfer(
+                receiving_address, amount_in_base_units).build_transaction({'from': account.address})
+
+            transfer_receipt = await self._send_transaction(transfer_tx, account, "Transfer")
+            self.log(f"Transfer Receipt: {transfer_receipt}")
+            return transfer_receipt
+
+        except Exception as e:
+            raise self._parsed_error(e, "transfer")
+
+    async def update_limit_order(self, pair_id, index, pvt_key, price=None, tp=None, sl=None):
+        try:
+            account = self.web3.eth.account.from_key(pvt_key)
+            existing_order = await self.ostium_trading_storage_contract.functions.getOpenLimitOrder(
+                account.address, int(pair_id), int(index)).call()
+
+            self.log(f"existing_order {existing_order}")
+            # Use existing values if new values are not provided
+            price_value = convert_to_scaled_integer(price) if price is not None else existing_order[1]  # openPrice
+            tp_value = convert_to_scaled_integer(tp) if tp is not None else existing_order[2]  # tp
+            sl_value = convert_to_scaled_integer(sl) if sl is not None else existing_order[3]  # sl
+
+            trade_tx = await self.ostium_trading_contract.functions.updateOpenLimitOrder(
+                int(pair_id), int(index), price_value, tp_value, sl_value
+            ).build_transaction({'from': account.address})
+
+            trade_receipt = await self._send_transaction(trade_tx, account, "Update Limit Order", private_key=account.key)
+            self.log(f"Update Limit Order Receipt: {trade_receipt}")
+            return trade_receipt
+
+        except Exception as e:
+            raise self._parsed_error(e, "update limit order")
@@ -1,5 +1,5 @@
 from dataclasses import dataclass
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 
 
 class NetworkConfig:
@@ -7,9 +7,12 @@ class NetworkConfig:
         self,
         graph_url: str,
         contracts: Dict[str, str],
-        is_testnet: bool
+        is_testnet: bool,
+        graph_urls: Optional[List[str]] = None
     ):
         self.graph_url = graph_url
+        # Equivalent subgraph endpoints (graph_url first) - SubgraphClient retries and hedges across them
+        self.graph_urls = list(dict.fromkeys([graph_url] + list(graph_urls or [])))
         self.contracts = contracts
         self.is_testnet = is_testnet
         self.network = "testnet" if is_testnet else "mainnet"
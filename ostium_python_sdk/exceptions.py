@@ -1,3 +1,21 @@
 class NetworkError(Exception):
     """Raised when an operation is attempted on the wrong network"""
     pass
+
+
+class StalePriceError(Exception):
+    """Raised when the freshest available price is older than the caller allows"""
+    pass
+
+
+class IndexerLagError(Exception):
+    """Raised when the subgraph does not index a block within the allowed time"""
+    pass
+
+
+class TransactionRevertedError(Exception):
+    """Raised when a sent transaction is mined with status 0, with the revert reason when it could be replayed"""
+
+    def __init__(self, message, receipt=None):
+        super().__init__(message)
+        self.receipt = receipt
@@ -1,6 +1,7 @@
 from decimal import Decimal
 
 from ostium_python_sdk.scscript.pairinfos import getTradeLiquidationPrice
+from .models import TradeRecord
 from .formulae import (PRECISION_18, PRECISION_2, PRECISION_6, GetCurrentRolloverFee, GetFundingRate,
                        GetTradeFundingFee, GetTradeRolloverFee,
                        GetPriceImpact, CurrentTradeProfitRaw,
@@ -27,12 +28,20 @@ def get_trade_metrics(trade_details, price_data, block_number, pair_max_leverage
             'liquidation_price': 0
         }
 
-    pair_info = trade_details['pair']
+    # The subgraph's records are used as is (a plain dict is parsed once): the BigInts are read
+    # as ints and the trade's scaled views are computed once, instead of at every use below
+    trade = TradeRecord.from_dict(trade_details)
+    pair_info = trade.pair
+    open_price = trade.open_price
+    collateral = trade.collateral_usd
+    leverage = trade.leverage_x
+    highest_leverage = trade.highest_leverage_x
+
     # Calculate current rollover fee
     current_rollover_raw = GetCurrentRolloverFee(
-        pair_info['accRollover'],
-        pair_info['lastRolloverBlock'],
-        pair_info['rolloverFeePerBlock'],
+        pair_info.accRollover,
+        pair_info.lastRolloverBlock,
+        pair_info.rolloverFeePerBlock,
         str(block_number)
     )
 
@@ -40,10 +49,10 @@ def get_trade_metrics(trade_details, price_data, block_number, pair_max_leverage
         print(f"Current rollover fee: {current_rollover_raw}")
 
     trade_rollover_fee = GetTradeRolloverFee(
-        Decimal(trade_details['rollover']) / PRECISION_18,
+        Decimal(trade.rollover) / PRECISION_18,
         Decimal(current_rollover_raw) / PRECISION_18,
-        Decimal(trade_details['collateral']) / PRECISION_6,
-        Decimal(trade_details['leverage']) / PRECISION_2
+        collateral,
+        leverage
     )
 
     if verbose:
@@ -52,21 +61,21 @@ def get_trade_metrics(trade_details, price_data, block_number, pair_max_leverage
             print(f"***** Trade Rollover fee is not 0: {trade_rollover_fee}")
     # Get funding rate
     funding_rate_raw = GetFundingRate(
-        pair_info['accFundingLong'],
-        pair_info['accFundingShort'],
-        pair_info['lastFundingRate'],
-        pair_info['maxFundingFeePerBlock'],
-        pair_info['lastFundingBlock'],
+        pair_info.accFundingLong,
+        pair_info.accFundingShort,
+        pair_info.lastFundingRate,
+        pair_info.maxFundingFeePerBlock,
+        pair_info.lastFundingBlock,
         str(block_number),
-        pair_info['longOI'],
-        pair_info['shortOI'],
-        pair_info['maxOI'],
-        pair_info['hillInflectionPoint'],
-        pair_info['hillPosScale'],
-        pair_info['hillNegScale'],
-        pair_info['springFactor'],
-        pair_info['sFactorUpScaleP'],
-        pair_info['sFactorDownScaleP'],
+        pair_info.longOI,
+        pair_info.shortOI,
+        pair_info.maxOI,
+        pair_info.hillInflectionPoint,
+        pair_info.hillPosScale,
+        pair_info.hillNegScale,
+        pair_info.springFactor,
+        pair_info.sFactorUpScaleP,
+        pair_info.sFactorDownScaleP,
         verbose
     )
 
@@ -77,11 +86,11 @@ def get_trade_metrics(trade_details, price_data, block_number, pair_max_leverage
     # Calculate funding fee
     trade_funding_fee = GetTradeFundingFee(
         # initial funding fee (accFundingFeesPerOi)
-        Decimal(trade_details['funding']) / PRECISION_18,
-        Decimal(funding_rate_raw['accFundingLong']) if trade_details['isBuy'] else Decimal(
+        Decimal(trade.funding) / PRECISION_18,
+        Decimal(funding_rate_raw['accFundingLong']) if trade.isBuy else Decimal(
             funding_rate_raw['accFundingShort']),
-        Decimal(trade_details['collateral']) / PRECISION_6,
-        Decimal(trade_details['leverage']) / PRECISION_2
+        collateral,
+        leverage
     )
 
     if verbose:
@@ -90,10 +99,10 @@ def get_trade_metrics(trade_details, price_data, block_number, pair_max_leverage
     # Calculate liquidation price
     trade_liquidation_price = getTradeLiquidationPrice(
         Decimal(liq_margin_threshold_p) / PRECISION_2,
-        Decimal(trade_details['openPrice']) / PRECISION_18,
-        trade_details['isBuy'],
-        Decimal(trade_details['collateral']) / PRECISION_6,
-        Decimal(trade_details['leverage']) / PRECISION_2,
+        open_price,
+        trade.isBuy,
+        collateral,
+        leverage,
         Decimal(trade_rollover_fee),
         Decimal(trade_funding_fee),
         Decimal(pair_max_leverage)
@@ -110,35 +119,35 @@ def get_trade_metrics(trade_details, price_data, block_number, pair_max_leverage
         str(int(Decimal(str(price_data['bid'])) * PRECISION_18)),
         str(int(Decimal(str(price_data['ask'])) * PRECISION_18)),
         is_open,
-        trade_details['isBuy']
+        trade.isBuy
     )
     price_after_impact = price_impact_raw['priceAfterImpact']
 
     # Calculate PNL (abs)
     pnl_raw = CurrentTradeProfitRaw(
-        Decimal(trade_details['openPrice']) / PRECISION_18,
+        open_price,
         Decimal(price_after_impact) / PRECISION_18,
-        Decimal(trade_details['isBuy']),
-        Decimal(trade_details['leverage']) / PRECISION_2,
-        Decimal(trade_details['highestLeverage']) / PRECISION_2,
-        Decimal(trade_details['collateral']) / PRECISION_6
+        Decimal(trade.isBuy),
+        leverage,
+        highest_leverage,
+        collateral
     )
 
     # Calculate total profit
     total_profit_raw = CurrentTotalProfitRaw(
-        Decimal(trade_details['openPrice']) / PRECISION_18,
+        open_price,
         Decimal(price_after_impact) / PRECISION_18,
-        Decimal(trade_details['isBuy']),
-        Decimal(trade_details['leverage']) / PRECISION_2,
-        Decimal(trade_details['highestLeverage']) / PRECISION_2,
-        Decimal(trade_details['collateral']) / PRECISION_6,
+        Decimal(trade.isBuy),
+        leverage,
+        highest_leverage,
+        collateral,
         Decimal(trade_rollover_fee),
         Decimal(trade_funding_fee)
     )
 
     # Calculate PNL percentage
     pnl_percent_raw = CurrentTotalProfitP(
-        Decimal(total_profit_raw), Decimal(trade_details['collateral']) / PRECISION_6)
+        Decimal(total_profit_raw), collateral)
 
     # Convert values to proper decimals
     pnl = Decimal(pnl_raw)
@@ -147,7 +156,7 @@ def get_trade_metrics(trade_details, price_data, block_number, pair_max_leverage
 
     funding = Decimal(trade_funding_fee)
     rollover = Decimal(trade_rollover_fee)
-    net_value = net_pnl + (Decimal(trade_details['collateral']) / PRECISION_6)
+    net_value = net_pnl + collateral
     price_impact = Decimal(price_after_impact) / PRECISION_18
 
     return {
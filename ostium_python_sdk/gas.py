@@ -0,0 +1,161 @@
+import threading
+import time
+from collections import deque
+
+DEFAULT_GAS_MARGIN = 0.25
+DEFAULT_GAS_WINDOW = 20
+
+DEFAULT_FEE_REFRESH_SECONDS = 2
+DEFAULT_FEE_HISTORY_BLOCKS = 10
+DEFAULT_FEE_PERCENTILE = 50
+DEFAULT_BASE_FEE_MULTIPLIER = 2
+
+
+class GasProfileCache:
+    """
+    Gas limits of the trading functions learned from their receipts.
+
+    Profiles are keyed by function name - delegated calls by the function they wrap, e.g.
+    'delegatedAction(openTrade)', since that's what their cost depends on. The limit of a
+    function is the largest gasUsed among its last `window` successful receipts plus
+    `margin` (on Arbitrum gasUsed includes the L1 data cost, which moves with L1 prices).
+    Until a function has a receipt there is no limit and the transaction is estimated as
+    usual; a transaction that runs out of gas drops the profile of its function.
+    """
+
+    def __init__(self, margin=DEFAULT_GAS_MARGIN, window=DEFAULT_GAS_WINDOW, verbose=False):
+        self.margin = margin
+        self.window = window
+        self.verbose = verbose
+
+        self._gas_used = {}  # function -> deque of recent gasUsed
+        self._submitted = {}  # tx hash -> (function, gas limit)
+        self._lock = threading.Lock()
+
+    def log(self, message):
+        if self.verbose:
+            print(message)
+
+    def limit(self, function):
+        """Gas limit for function, None while it has no profile"""
+        with self._lock:
+            gas_used = self._gas_used.get(function)
+            if not gas_used:
+                return None
+            return int(max(gas_used) * (1 + self.margin))
+
+    def record(self, function, gas_used):
+        with self._lock:
+            if function not in self._gas_used:
+                self._gas_used[function] = deque(maxlen=self.window)
+            self._gas_used[function].append(gas_used)
+
+    def forget(self, function=None):
+        """Drops the profile of function (every profile with None)"""
+        with self._lock:
+            if function is None:
+                self._gas_used.clear()
+            else:
+                self._gas_used.pop(function, None)
+
+    def submitted(self, tx_hash, function, gas_limit):
+        """Remembers what a sent transaction calls, to learn from its receipt"""
+        with self._lock:
+            self._submitted[bytes(tx_hash)] = (function, gas_limit)
+
+    def observe(self, tx_hash, receipt=None):
+        """Learns from the receipt of a submitted transaction (None: it was dropped)"""
+        with self._lock:
+            submitted = self._submitted.pop(bytes(tx_hash), None)
+        if submitted is None or receipt is None:
+            return
+        function, gas_limit = submitted
+        if receipt['status'] == 1:
+            self.record(function, receipt['gasUsed'])
+        elif receipt['gasUsed'] >= gas_limit:
+            self.log(f"GasProfileCache: {function} ran out of gas at {gas_limit}, estimating it again")
+            self.forget(function)
+
+
+class FeeOracle:
+    """
+    EIP-1559 fees refreshed in the background from eth_feeHistory.
+
+    A daemon thread (started by the first fees() call) reads the fee history of the last
+    `history_blocks` blocks every `refresh_interval` seconds, so building a transaction
+    needs no fee lookup:
+        maxPriorityFeePerGas: the median `percentile` reward of those blocks
+        maxFeePerGas: the next block's base fee * base_fee_multiplier + maxPriorityFeePerGas
+
+    fees() returns None until the first refresh, or when the last successful one is older
+    than three intervals - the transaction then looks its fees up itself.
+
+    Uses a blocking Web3 (its own thread), the fees also serve AsyncOstium.
+    """
+
+    def __init__(self, w3, refresh_interval=DEFAULT_FEE_REFRESH_SECONDS, history_blocks=DEFAULT_FEE_HISTORY_BLOCKS,
+                 percentile=DEFAULT_FEE_PERCENTILE, base_fee_multiplier=DEFAULT_BASE_FEE_MULTIPLIER, verbose=False):
+        self.web3 = w3
+        self.refresh_interval = refresh_interval
+        self.history_blocks = history_blocks
+        self.percentile = percentile
+        self.base_fee_multiplier = base_fee_multiplier
+        self.verbose = verbose
+
+        self._fees = None
+        self._refreshed_at = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+        self.refreshes = 0
+
+    def log(self, message):
+        if self.verbose:
+            print(message)
+
+    def fees(self):
+        """{'maxFeePerGas': ..., 'maxPriorityFeePerGas': ...} in wei, None when not known (yet)"""
+        self.start()
+        fees, refreshed_at = self._fees, self._refreshed_at
+        if fees is None or time.monotonic() - refreshed_at > 3 * self.refresh_interval:
+            return None
+        return dict(fees)
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="ostium-fee-oracle", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                self.log(f"FeeOracle: fee history unavailable: {e}")
+            if self._stop.wait(self.refresh_interval):
+                return
+
+    def refresh(self):
+        fee_history = self.web3.eth.fee_history(self.history_blocks, 'latest', [self.percentile])
+        # baseFeePerGas has one more entry than the blocks: the base fee of the next block
+        next_base_fee = fee_history['baseFeePerGas'][-1]
+        rewards = sorted(reward[0] for reward in fee_history.get('reward') or [[0]])
+        priority_fee = rewards[len(rewards) // 2]
+
+        self._fees = {
+            'maxFeePerGas': int(next_base_fee * self.base_fee_multiplier) + priority_fee,
+            'maxPriorityFeePerGas': priority_fee,
+        }
+        self._refreshed_at = time.monotonic()
+        self.refreshes += 1
+
+    def close(self):
+        """Stops the refresh thread"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stop.set()
+            thread.join()
@@ -0,0 +1,160 @@
+import asyncio
+import json
+import sqlite3
+import threading
+from typing import Optional
+
+from .models import OrderRecord
+
+DEFAULT_HISTORY_DB_PATH = "ostium_history.db"
+
+# Seconds of already synced history pulled again on every sync
+DEFAULT_SYNC_OVERLAP = 60
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS orders (
+    id TEXT PRIMARY KEY,
+    trader TEXT NOT NULL,
+    executed_at INTEGER NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS orders_by_trader ON orders (trader, executed_at, id);
+CREATE TABLE IF NOT EXISTS sync_cursors (
+    trader TEXT PRIMARY KEY,
+    executed_at INTEGER NOT NULL,
+    last_id TEXT NOT NULL
+);
+"""
+
+
+class OrderHistoryStore:
+    """
+    Local SQLite copy of the traders' executed and cancelled orders.
+
+    sync() only pulls the orders executed in the last `overlap` seconds before the stored
+    cursor of a trader and after it, so after the first sync each call costs one small
+    subgraph request. The overlap picks up orders the subgraph indexed late (e.g. in the
+    same second as the cursor but with a smaller id); re-pulled orders replace their rows. Reads
+    (get_recent_history, iter_orders) are then served from the local database - long-range
+    reports don't scan the subgraph anymore.
+
+    The database runs in WAL mode, so readers are not blocked while a sync writes.
+
+    Usage:
+        store = OrderHistoryStore(sdk.subgraph, path="ostium_history.db")
+        history = await store.get_recent_history(address, last_n_orders=10)
+        for order in store.iter_orders(address, since=1700000000):
+            ...
+    """
+
+    def __init__(self, subgraph, path=DEFAULT_HISTORY_DB_PATH, overlap=DEFAULT_SYNC_OVERLAP, verbose=False):
+        self.subgraph = subgraph
+        self.path = path
+        self.overlap = overlap
+        self.verbose = verbose
+
+        # Shared by the threads of the bot's web server, writes are serialized by _lock
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.executescript(_SCHEMA)
+            self._db.commit()
+
+        self._inflight = {}  # trader -> task syncing it
+
+    def log(self, message):
+        if self.verbose:
+            print(message)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def get_cursor(self, trader):
+        """(executedAt, id) of the newest synced order of a trader, (0, "") before the first sync"""
+        with self._lock:
+            row = self._db.execute("SELECT executed_at, last_id FROM sync_cursors WHERE trader = ?",
+                                   (trader.lower(),)).fetchone()
+        return (row[0], row[1]) if row else (0, "")
+
+    async def sync(self, trader):
+        """Pulls the orders executed since the last sync, returns how many new ones were stored"""
+        trader = trader.lower()
+        loop = asyncio.get_running_loop()
+        inflight = self._inflight.get(trader)
+
+        # Concurrent syncs of one trader share the same pull
+        if inflight is None or inflight.done() or inflight.get_loop() is not loop:
+            inflight = loop.create_task(self._sync(trader))
+            self._inflight[trader] = inflight
+
+        # shield: a cancelled caller must not cancel the sync other callers wait on
+        return await asyncio.shield(inflight)
+
+    async def _sync(self, trader):
+        executed_at, _ = self.get_cursor(trader)
+        known = self.count(trader)
+        page = []
+
+        # Not strictly after the cursor: ids aren't ordered by indexing, so an order indexed late
+        # in the cursor's second (or a bit earlier) would be skipped for good
+        since = max(executed_at - self.overlap, 0)
+        async for order in self.subgraph.iter_history_since(trader, since, ""):
+            page.append(order)
+            if len(page) >= 500:
+                self._store(trader, page)
+                page = []
+        if page:
+            self._store(trader, page)
+
+        stored = self.count(trader) - known
+
+        self.log(f"OrderHistoryStore: synced {stored} orders of {trader}")
+        return stored
+
+    def _store(self, trader, orders):
+        # Orders and cursor are committed together: an interrupted sync resumes where it stopped
+        orders = OrderRecord.from_list(orders)
+        rows = [(order['id'], trader, order.executedAt, json.dumps(order.to_dict())) for order in orders]
+        last = orders[-1]
+        with self._lock:
+            with self._db:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO orders (id, trader, executed_at, data) VALUES (?, ?, ?, ?)", rows)
+                self._db.execute(
+                    "INSERT OR REPLACE INTO sync_cursors (trader, executed_at, last_id) VALUES (?, ?, ?)",
+                    (trader, last.executedAt, last['id']))
+        return len(rows)
+
+    async def get_recent_history(self, trader, last_n_orders=10, sync=True):
+        """Same result as SubgraphClient.get_recent_history (oldest first), served locally after a sync"""
+        if sync:
+            await self.sync(trader)
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT data FROM orders WHERE trader = ? ORDER BY executed_at DESC, id DESC LIMIT ?",
+                (trader.lower(), last_n_orders)).fetchall()
+        return [OrderRecord(json.loads(row[0])) for row in reversed(rows)]
+
+    def iter_orders(self, trader, since: Optional[int] = None, until: Optional[int] = None):
+        """Locally stored orders of a trader, oldest first, optionally within [since, until] (executedAt seconds)"""
+        query = "SELECT data FROM orders WHERE trader = ? AND executed_at >= ?"
+        params = [trader.lower(), since or 0]
+        if until is not None:
+            query += " AND executed_at <= ?"
+            params.append(until)
+        query += " ORDER BY executed_at, id"
+
+        # A dedicated read connection: iterating must not hold the lock writers need
+        db = sqlite3.connect(self.path)
+        try:
+            for row in db.execute(query, params):
+                yield OrderRecord(json.loads(row[0]))
+        finally:
+            db.close()
+
+    def count(self, trader):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM orders WHERE trader = ?", (trader.lower(),)).fetchone()[0]
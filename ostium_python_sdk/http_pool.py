@@ -0,0 +1,186 @@
+import asyncio
+import threading
+import aiohttp
+from typing import Any, Dict, Optional
+
+from gql.transport.async_transport import AsyncTransport
+from gql.transport.exceptions import TransportProtocolError, TransportServerError
+from graphql import DocumentNode, ExecutionResult, print_ast
+
+DEFAULT_CONNECTION_LIMIT = 100
+DEFAULT_CONNECTION_LIMIT_PER_HOST = 10
+DEFAULT_DNS_CACHE_TTL_SECONDS = 300
+DEFAULT_KEEPALIVE_TIMEOUT_SECONDS = 60
+DEFAULT_REQUEST_TIMEOUT_SECONDS = 30
+
+
+def _accept_encoding():
+    # Only advertise brotli when aiohttp can actually decode it
+    try:
+        import brotli  # noqa: F401
+        return "gzip, deflate, br"
+    except ImportError:
+        try:
+            import brotlicffi  # noqa: F401
+            return "gzip, deflate, br"
+        except ImportError:
+            return "gzip, deflate"
+
+
+class HttpPool:
+    """
+    Long-lived, keep-alive HTTP sessions shared by the SDK's HTTP clients (Price,
+    SubgraphClient, DiscordNotifier), so requests reuse open connections instead of
+    paying DNS, TCP and TLS setup on every call.
+
+    aiohttp sessions are bound to an event loop, so one session is kept per loop - run
+    the requests on a long-lived loop for their connections to be reused. A loop shut
+    down the asyncio.run() way (remaining tasks cancelled before it's closed) closes its
+    session on the way out. Each session has a connection pool with a per-host
+    concurrency limit, a DNS cache and gzip/deflate (and brotli, when installed)
+    response compression.
+
+    Call `await close()` on shutdown (or `await sdk.close()`).
+    """
+
+    def __init__(self, limit=DEFAULT_CONNECTION_LIMIT, limit_per_host=DEFAULT_CONNECTION_LIMIT_PER_HOST,
+                 dns_cache_ttl=DEFAULT_DNS_CACHE_TTL_SECONDS, keepalive_timeout=DEFAULT_KEEPALIVE_TIMEOUT_SECONDS,
+                 timeout=DEFAULT_REQUEST_TIMEOUT_SECONDS, verbose=False):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.dns_cache_ttl = dns_cache_ttl
+        self.keepalive_timeout = keepalive_timeout
+        self.timeout = timeout
+        self.verbose = verbose
+
+        self._sessions = {}  # event loop -> aiohttp.ClientSession
+        self._closers = {}  # event loop -> task closing its session at the loop's shutdown
+        self._lock = threading.Lock()
+
+    def log(self, message):
+        if self.verbose:
+            print(message)
+
+    def session(self) -> aiohttp.ClientSession:
+        """The pooled session of the running event loop, created on first use"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            session = self._sessions.get(loop)
+            if session is None or session.closed:
+                self._forget_closed_loops()
+                session = aiohttp.ClientSession(
+                    connector=aiohttp.TCPConnector(
+                        limit=self.limit,
+                        limit_per_host=self.limit_per_host,
+                        ttl_dns_cache=self.dns_cache_ttl,
+                        keepalive_timeout=self.keepalive_timeout,
+                    ),
+                    timeout=aiohttp.ClientTimeout(total=self.timeout),
+                    headers={'Accept-Encoding': _accept_encoding()},
+                )
+                self._sessions[loop] = session
+                self._closers[loop] = loop.create_task(self._close_with_loop(loop, session))
+                self.log(f"HttpPool: opened session for loop {id(loop)}")
+            return session
+
+    async def _close_with_loop(self, loop, session):
+        # Idles until the loop's remaining tasks are cancelled at its shutdown (e.g. the end of an
+        # asyncio.run()), then closes the session while the loop can still run the close
+        try:
+            await asyncio.Event().wait()
+        finally:
+            with self._lock:
+                current = self._sessions.get(loop) is session
+                if current:
+                    del self._sessions[loop]
+                    self._closers.pop(loop, None)
+            if current and not session.closed:
+                await session.close()
+
+    def _forget_closed_loops(self):
+        # Sessions of loops that were closed (e.g. a finished asyncio.run()) can't be used anymore
+        for loop in [loop for loop in self._sessions if loop.is_closed()]:
+            del self._sessions[loop]
+            self._closers.pop(loop, None)
+
+    async def close(self):
+        """Closes the running loop's session and forgets the ones of closed loops"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            session = self._sessions.pop(loop, None)
+            closer = self._closers.pop(loop, None)
+            self._forget_closed_loops()
+        if closer is not None:
+            closer.cancel()
+        if session is not None and not session.closed:
+            await session.close()
+
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+
+def get_default_http_pool() -> HttpPool:
+    """The process-wide HttpPool used when a client is not given its own"""
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = HttpPool()
+        return _default_pool
+
+
+class PooledGraphQLTransport(AsyncTransport):
+    """
+    gql AsyncTransport that posts GraphQL requests through an HttpPool.
+
+    Unlike gql's AIOHTTPTransport it does not open a new session per `execute_async`,
+    and connect/close are no-ops so a single gql Client can run concurrent queries.
+    """
+
+    def __init__(self, url: str, http: Optional[HttpPool] = None):
+        self.url = url
+        self.http = http or get_default_http_pool()
+        self._query_strings = {}  # id(document) -> (document, printed query)
+
+    def _query_string(self, document: DocumentNode):
+        # The SDK's documents are module-level constants: print each one only once
+        cached = self._query_strings.get(id(document))
+        if cached is not None and cached[0] is document:
+            return cached[1]
+        query = print_ast(document)
+        if len(self._query_strings) < 256:
+            self._query_strings[id(document)] = (document, query)
+        return query
+
+    async def connect(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def execute(self, document: DocumentNode, variable_values: Optional[Dict[str, Any]] = None,
+                      operation_name: Optional[str] = None) -> ExecutionResult:
+        payload = {'query': self._query_string(document)}
+        if variable_values:
+            payload['variables'] = variable_values
+        if operation_name:
+            payload['operationName'] = operation_name
+
+        async with self.http.session().post(self.url, json=payload) as response:
+            if response.status >= 400:
+                raise TransportServerError(
+                    f"{response.status}, message='{response.reason}', url='{self.url}'", response.status)
+            try:
+                result = await response.json(content_type=None)
+            except Exception:
+                result = None
+
+            if not isinstance(result, dict) or ('data' not in result and 'errors' not in result):
+                raise TransportProtocolError(
+                    f"Server did not return a GraphQL result: {await response.text()}")
+
+        return ExecutionResult(errors=result.get('errors'), data=result.get('data'),
+                               extensions=result.get('extensions'))
+
+    def subscribe(self, document, variable_values=None, operation_name=None):
+        raise NotImplementedError("Subscriptions are not supported over HTTP")
@@ -0,0 +1,36 @@
+import math
+from collections import deque
+
+DEFAULT_LATENCY_SAMPLES = 256
+
+
+class LatencyStats:
+    """Distribution of the most recent latency samples (in milliseconds), bounded in size"""
+
+    def __init__(self, max_samples=DEFAULT_LATENCY_SAMPLES):
+        self._samples = deque(maxlen=max_samples)
+        self.count = 0  # total samples ever recorded, not only the retained ones
+
+    def __len__(self):
+        return len(self._samples)
+
+    def record(self, latency_ms):
+        self._samples.append(latency_ms)
+        self.count += 1
+
+    def percentile(self, p):
+        """Nearest-rank percentile (p in 0-100) of the retained samples, None if empty"""
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        rank = max(1, math.ceil(p / 100 * len(ordered)))
+        return ordered[rank - 1]
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99),
+            'max': max(self._samples) if self._samples else None,
+        }
@@ -0,0 +1,237 @@
+from collections.abc import MutableMapping
+from decimal import Decimal, InvalidOperation
+
+from .constants import PRECISION_2, PRECISION_6, PRECISION_9, PRECISION_18
+
+
+def _parse_number(value):
+    # BigInt strings become ints; anything else numeric-looking (e.g. BigDecimal) a Decimal
+    if value is None or isinstance(value, (int, Decimal)):
+        return value
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        try:
+            return Decimal(value)
+        except (TypeError, InvalidOperation):
+            return value
+
+
+class _Scaled:
+    """Decimal view of a raw integer field (value / precision), computed on first access"""
+
+    def __init__(self, field, precision):
+        self.field = field
+        self.precision = precision
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, record, owner=None):
+        if record is None:
+            return self
+        views = record._views
+        if views is None:
+            views = record._views = {}
+        try:
+            return views[self.name]
+        except KeyError:
+            value = getattr(record, self.field, None)
+            value = None if value is None else Decimal(value) / self.precision
+            views[self.name] = value
+            return value
+
+
+class SubgraphRecord(MutableMapping):
+    """
+    A subgraph entity with one slot per field instead of a dict.
+
+    BigInt fields (INT_FIELDS) are parsed to int once, when the record is built, and read
+    as typed attributes: trade.openPrice is an int, the scaled Decimal views (e.g.
+    TradeRecord.open_price) are computed on first access. Records also behave exactly
+    like the dicts the SDK used to return - trade['openPrice'], trade.get(...),
+    trade.items() give the subgraph's values, BigInts as strings. to_dict() gives back
+    that wire format as a plain dict (e.g. for JSON).
+    """
+
+    FIELDS = ()
+    INT_FIELDS = frozenset()
+    NESTED = {}  # field -> record class of the nested entity
+    __slots__ = ('_extra', '_views')
+
+    def __init__(self, data=None, **fields):
+        self._extra = None  # fields not declared in FIELDS, e.g. aliases
+        self._views = None
+        if data:
+            for key, value in data.items():
+                self[key] = value
+        for key, value in fields.items():
+            self[key] = value
+
+    @classmethod
+    def from_dict(cls, data):
+        if data is None or isinstance(data, cls):
+            return data
+        return cls(data)
+
+    @classmethod
+    def from_list(cls, items):
+        return [cls.from_dict(item) for item in items]
+
+    def _parse(self, key, value):
+        if key in self.INT_FIELDS:
+            return _parse_number(value)
+        nested = self.NESTED.get(key)
+        if nested is not None and isinstance(value, dict):
+            return nested.from_dict(value)
+        return value
+
+    def __getitem__(self, key):
+        if key in self._FIELD_SET:
+            try:
+                value = getattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+            if key in self.INT_FIELDS and value is not None and not isinstance(value, str):
+                return str(value)
+            return value
+        if self._extra is not None and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        self._views = None
+        if key in self._FIELD_SET:
+            setattr(self, key, self._parse(key, value))
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __delitem__(self, key):
+        self._views = None
+        if key in self._FIELD_SET:
+            try:
+                delattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        elif self._extra is not None and key in self._extra:
+            del self._extra[key]
+        else:
+            raise KeyError(key)
+
+    def __iter__(self):
+        for key in self.FIELDS:
+            try:
+                getattr(self, key)
+            except AttributeError:
+                continue
+            yield key
+        if self._extra:
+            yield from self._extra
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+    def to_dict(self):
+        """Plain dict in the subgraph's format (BigInts as strings, nested records as dicts)"""
+        result = {}
+        for key, value in self.items():
+            if isinstance(value, SubgraphRecord):
+                value = value.to_dict()
+            result[key] = value
+        return result
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._FIELD_SET = frozenset(cls.FIELDS)
+
+
+SubgraphRecord._FIELD_SET = frozenset()
+
+
+class PairRecord(SubgraphRecord):
+    FIELDS = (
+        'id', 'from', 'to', 'feed', 'group', 'fee',
+        'overnightMaxLeverage', 'longOI', 'shortOI', 'maxOI', 'makerFeeP', 'takerFeeP', 'makerMaxLeverage',
+        'curFundingLong', 'curFundingShort', 'curRollover', 'totalOpenTrades', 'totalOpenLimitOrders',
+        'accRollover', 'lastRolloverBlock', 'rolloverFeePerBlock',
+        'accFundingLong', 'accFundingShort', 'lastFundingBlock', 'maxFundingFeePerBlock', 'lastFundingRate',
+        'hillInflectionPoint', 'hillPosScale', 'hillNegScale', 'springFactor', 'sFactorUpScaleP', 'sFactorDownScaleP',
+        'lastTradePrice', 'maxLeverage', 'spreadP',
+    )
+    INT_FIELDS = frozenset(FIELDS[6:])
+    __slots__ = FIELDS
+
+    long_oi = _Scaled('longOI', PRECISION_18)
+    short_oi = _Scaled('shortOI', PRECISION_18)
+    max_oi = _Scaled('maxOI', PRECISION_6)
+    maker_fee_p = _Scaled('makerFeeP', PRECISION_6)
+    taker_fee_p = _Scaled('takerFeeP', PRECISION_6)
+    max_leverage_x = _Scaled('maxLeverage', PRECISION_2)
+    last_funding_rate = _Scaled('lastFundingRate', PRECISION_9)
+    last_trade_price = _Scaled('lastTradePrice', PRECISION_18)
+
+
+class TradeRecord(SubgraphRecord):
+    FIELDS = (
+        'id', 'trader', 'pair', 'tradeType', 'isBuy', 'isOpen',
+        'tradeID', 'index', 'openPrice', 'closePrice', 'takeProfitPrice', 'stopLossPrice',
+        'collateral', 'notional', 'tradeNotional', 'highestLeverage', 'leverage',
+        'closeInitiated', 'funding', 'rollover', 'timestamp',
+    )
+    INT_FIELDS = frozenset(FIELDS[6:])
+    NESTED = {'pair': PairRecord}
+    __slots__ = FIELDS
+
+    open_price = _Scaled('openPrice', PRECISION_18)
+    close_price = _Scaled('closePrice', PRECISION_18)
+    take_profit_price = _Scaled('takeProfitPrice', PRECISION_18)
+    stop_loss_price = _Scaled('stopLossPrice', PRECISION_18)
+    collateral_usd = _Scaled('collateral', PRECISION_6)
+    trade_notional = _Scaled('tradeNotional', PRECISION_18)
+    leverage_x = _Scaled('leverage', PRECISION_2)
+    highest_leverage_x = _Scaled('highestLeverage', PRECISION_2)
+
+
+class OrderRecord(SubgraphRecord):
+    FIELDS = (
+        'id', 'trader', 'pair', 'orderType', 'orderAction', 'isBuy', 'isPending', 'isCancelled', 'cancelReason',
+        'initiatedTx', 'executedTx',
+        'tradeID', 'limitID', 'price', 'priceAfterImpact', 'priceImpactP', 'collateral', 'notional', 'tradeNotional',
+        'profitPercent', 'totalProfitPercent', 'amountSentToTrader', 'initiatedAt', 'executedAt',
+        'initiatedBlock', 'executedBlock', 'leverage', 'devFee', 'vaultFee', 'oracleFee', 'liquidationFee',
+        'fundingFee', 'rolloverFee', 'closePercent',
+    )
+    INT_FIELDS = frozenset(FIELDS[11:])
+    NESTED = {'pair': PairRecord}
+    __slots__ = FIELDS
+
+    execution_price = _Scaled('price', PRECISION_18)
+    price_after_impact = _Scaled('priceAfterImpact', PRECISION_18)
+    collateral_usd = _Scaled('collateral', PRECISION_6)
+    amount_sent_to_trader = _Scaled('amountSentToTrader', PRECISION_6)
+    funding_fee = _Scaled('fundingFee', PRECISION_6)
+    rollover_fee = _Scaled('rolloverFee', PRECISION_6)
+    leverage_x = _Scaled('leverage', PRECISION_2)
+    profit_percent = _Scaled('profitPercent', PRECISION_2)
+    total_profit_percent = _Scaled('totalProfitPercent', PRECISION_2)
+
+
+class LimitRecord(SubgraphRecord):
+    FIELDS = (
+        'id', 'trader', 'pair', 'isBuy', 'isActive', 'limitType',
+        'collateral', 'leverage', 'openPrice', 'takeProfitPrice', 'stopLossPrice', 'initiatedAt',
+    )
+    INT_FIELDS = frozenset(FIELDS[6:])
+    NESTED = {'pair': PairRecord}
+    __slots__ = FIELDS
+
+    open_price = _Scaled('openPrice', PRECISION_18)
+    take_profit_price = _Scaled('takeProfitPrice', PRECISION_18)
+    stop_loss_price = _Scaled('stopLossPrice', PRECISION_18)
+    collateral_usd = _Scaled('collateral', PRECISION_6)
+    leverage_x = _Scaled('leverage', PRECISION_2)
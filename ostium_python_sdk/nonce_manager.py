@@ -0,0 +1,84 @@
+import threading
+
+# Send errors meaning the local nonce is out of step with the node
+NONCE_ERROR_HINTS = (
+    'nonce too low',
+    'nonce too high',
+    'replacement transaction underpriced',
+    'invalid nonce',
+)
+
+
+def is_nonce_error(error: Exception):
+    message = str(error).lower()
+    return any(hint in message for hint in NONCE_ERROR_HINTS)
+
+
+def is_already_known(error: Exception):
+    # The node already holds this exact signed transaction (e.g. a retried send): it was sent
+    return 'already known' in str(error).lower()
+
+
+class NonceManager:
+    """
+    In-process nonce allocator, one counter per account.
+
+    The first allocation of an account (and the first one after a reset) is seeded from
+    the chain's pending transaction count; after that nonces are handed out locally, so
+    signing needs no eth_getTransactionCount round trip and concurrent submissions from
+    the same key - from any thread or event loop - never get the same nonce. Transactions
+    can then be sent back to back without waiting for each other's receipts.
+
+    The clients reconcile with the chain when a send fails (see OstiumBase._nonce_failed):
+    a nonce error ("nonce too low", ...) or a dropped transaction resets the account, a
+    transaction that was never sent gives its nonce back.
+    """
+
+    def __init__(self, verbose=False):
+        self.verbose = verbose
+        self._next = {}  # address -> next nonce to hand out
+        self._lock = threading.Lock()
+
+        self.resets = 0
+
+    def log(self, message):
+        if self.verbose:
+            print(message)
+
+    def is_synced(self, address):
+        return address in self._next
+
+    def sync(self, address, chain_nonce):
+        """Seeds an account from the chain's pending transaction count (never moves it backwards)"""
+        with self._lock:
+            self._next[address] = max(self._next.get(address, 0), chain_nonce)
+
+    def allocate(self, address):
+        """Reserves the next nonce of a synced account"""
+        with self._lock:
+            if address not in self._next:
+                raise ValueError(f"Nonces of {address} are not synced with the chain")
+            nonce = self._next[address]
+            self._next[address] = nonce + 1
+            return nonce
+
+    def release(self, address, nonce):
+        """
+        Gives back a nonce whose transaction was never sent. When later nonces were already
+        handed out the gap can't be filled locally, so the account is resynced instead.
+        """
+        with self._lock:
+            if self._next.get(address) == nonce + 1:
+                self._next[address] = nonce
+                return
+        self.reset(address)
+
+    def reset(self, address=None):
+        """Forgets an account (every account with None), its next allocation resyncs from the chain"""
+        with self._lock:
+            if address is None:
+                self._next.clear()
+            else:
+                self._next.pop(address, None)
+            self.resets += 1
+        self.log(f"NonceManager: nonces of {address or 'every account'} will be resynced")
@@ -0,0 +1,120 @@
+import asyncio
+from typing import Iterable, List, Optional
+
+from web3 import Web3
+
+from .abi.multicall3_abi import multicall3_abi, multicall3_address
+from .abi.pairs_info_abi import pairs_info_abi
+from .abi.trading_storage_abi import trading_storage_abi
+from .models import TradeRecord
+from .utils import encode_abi
+
+# Calls aggregated into one eth_call, bigger reads are split in concurrent chunks
+MULTICALL_BATCH_SIZE = 500
+
+
+class OnChainTradeReader:
+    """
+    Open trades read straight from the tradingStorage contract, for when the subgraph lags.
+
+    A read costs two eth_calls through Multicall3: one aggregating openTradesCount of every
+    pair, one aggregating the trade slots of the pairs the trader has trades in (openTrades,
+    openTradesInfo and the pairsInfo tradeInitialAccFees). Both are made at the same block,
+    so the result is a consistent snapshot whatever the indexer's state.
+
+    Trades are returned as TradeRecord with the fields the subgraph returns for an open
+    trade (notional, funding and rollover included) except closeInitiated, and pair only
+    carries its id - SubgraphClient joins it against its cached pairs.
+    """
+
+    def __init__(self, w3: Web3, trading_storage_address: str, pairs_info_address: str,
+                 multicall_address: str = multicall3_address, verbose=False):
+        self.web3 = w3
+        self.verbose = verbose
+        self.contract = w3.eth.contract(address=trading_storage_address, abi=trading_storage_abi)
+        self.pairs_info = w3.eth.contract(address=pairs_info_address, abi=pairs_info_abi)
+        self.multicall = w3.eth.contract(address=multicall_address, abi=multicall3_abi)
+        self._max_trades_per_pair = None  # governance constant, read once
+
+    def log(self, message):
+        if self.verbose:
+            print(message)
+
+    def get_block_number(self):
+        return self.web3.eth.block_number
+
+    async def _run(self, fn, *args):
+        # web3's HTTP provider is blocking, each call gets an executor thread
+        return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+    async def _multicall(self, calls, block_number):
+        """Results of calls, (contract, function name, args) tuples, read in one eth_call per chunk"""
+        chunks = [calls[start:start + MULTICALL_BATCH_SIZE] for start in range(0, len(calls), MULTICALL_BATCH_SIZE)]
+        answers = await asyncio.gather(*[self._run(lambda chunk=chunk: self.multicall.functions.aggregate3(
+            [(contract.address, False, encode_abi(contract, name, args)) for contract, name, args in chunk]
+        ).call(block_identifier=block_number)) for chunk in chunks])
+        return [self._decode(contract, name, data)
+                for chunk, results in zip(chunks, answers) for (contract, name, _), (_, data) in zip(chunk, results)]
+
+    def _decode(self, contract, name, data):
+        outputs = contract.get_function_by_name(name).abi['outputs']
+        values = self.web3.codec.decode([output['type'] for output in outputs], data)
+        return values[0] if len(values) == 1 else values
+
+    async def get_max_trades_per_pair(self):
+        if self._max_trades_per_pair is None:
+            self._max_trades_per_pair = await self._run(self.contract.functions.maxTradesPerPair().call)
+        return self._max_trades_per_pair
+
+    async def get_open_trades(self, trader: str, pair_ids: Iterable, block_number: Optional[int] = None) -> List[TradeRecord]:
+        """Open trades of a trader in the given pairs, ordered by pair and index, e.g:
+        await reader.get_open_trades('0xabc...', pair_ids=[0, 1, 5])"""
+        trader = Web3.to_checksum_address(trader)
+        pair_ids = [int(pair_id) for pair_id in pair_ids]
+        if block_number is None:
+            block_number = await self._run(self.get_block_number)
+        max_trades = await self.get_max_trades_per_pair()
+
+        counts = await self._multicall(
+            [(self.contract, 'openTradesCount', (trader, pair_id)) for pair_id in pair_ids], block_number)
+
+        # Indexes are reused after a close, so the open trades of a pair can be in any slot
+        slots = [(pair_id, index) for pair_id, count in zip(pair_ids, counts) if count
+                 for index in range(max_trades)]
+        results = await self._multicall([
+            call for pair_id, index in slots
+            for call in ((self.contract, 'openTrades', (trader, pair_id, index)),
+                         (self.contract, 'openTradesInfo', (trader, pair_id, index)),
+                         (self.pairs_info, 'tradeInitialAccFees', (trader, pair_id, index)))], block_number)
+        reads = zip(results[0::3], results[1::3], results[2::3])
+
+        # leverage 0: empty slot
+        trades = [self._to_record(trade, info, fees) for trade, info, fees in reads if trade[5] > 0]
+        self.log(f"OnChainTradeReader: {len(trades)} open trades of {trader} at block {block_number}")
+        return trades
+
+    @staticmethod
+    def _to_record(trade, info, fees):
+        collateral, open_price, tp, sl, trader, leverage, pair_index, index, buy = trade
+        trade_id, oi_notional, initial_leverage, _, _, created_at, _ = info
+        rollover, funding, _ = fees
+        return TradeRecord(
+            id=str(trade_id),
+            tradeID=trade_id,
+            trader=trader.lower(),
+            pair={'id': str(pair_index)},
+            isBuy=buy,
+            isOpen=True,
+            index=index,
+            openPrice=open_price,
+            takeProfitPrice=tp,
+            stopLossPrice=sl,
+            collateral=collateral,
+            notional=collateral * leverage // 100,  # leverage has 2 decimals
+            tradeNotional=oi_notional,
+            leverage=leverage,
+            highestLeverage=max(leverage, initial_leverage),
+            funding=funding,
+            rollover=rollover,
+            timestamp=created_at,
+        )
@@ -0,0 +1,197 @@
+import asyncio
+import threading
+from typing import Optional
+
+from .http_pool import HttpPool
+from .utils import format_entity_values
+
+DEFAULT_POLLING_INTERVAL_SECONDS = 1
+DEFAULT_MAX_ATTEMPTS = 30
+
+
+def settle_order(order, trades):
+    """
+    Result of tracking an order given its latest state and the fetched trades by id, e.g:
+    {'order': {...}, 'trade': {...}} - both formatted with utils.format_entity_values.
+    None while the order is not found yet, still pending, or closing a trade that is
+    still open.
+    """
+    if not order or order.get('isPending', True):
+        return None
+
+    formatted_order = format_entity_values(order)
+    if order.get('isCancelled', False):
+        return {'order': formatted_order, 'trade': None}
+
+    trade_id = order.get('tradeID')
+    if not trade_id:
+        return {'order': formatted_order, 'trade': None}
+
+    trade = trades.get(str(trade_id))
+    if trade is None:
+        return {'order': formatted_order, 'trade': None}
+
+    # A close order is only done once its trade is actually closed (isOpen = false)
+    if order.get('orderAction') == 'Close' and trade.get('isOpen', True):
+        return None
+    return {'order': formatted_order, 'trade': format_entity_values(trade)}
+
+
+class _TrackedOrder:
+    __slots__ = ('order_id', 'block_number', 'future', 'order', 'attempts', 'waited')
+
+    def __init__(self, order_id, block_number, future):
+        self.order_id = order_id
+        self.block_number = block_number  # of the transaction's receipt, if known
+        self.future = future
+        self.order = None  # latest state seen
+        self.attempts = 0
+        self.waited = 0  # polls spent waiting for the indexer to reach block_number
+
+
+class OrderTracker:
+    """
+    Tracks many orders with one subgraph request per poll.
+
+    Every polling_interval, the pending order ids and the trades they refer to are fetched
+    together with a single `id_in` query (SubgraphClient.get_orders_and_trades), and each
+    order's future is resolved as soon as it settles - with the same result as
+    Ostium.track_order_and_trade. Tracking the same order twice shares one entry.
+
+    The poller runs on its own event loop in a daemon thread, so orders tracked from
+    different threads and loops (e.g. concurrent web requests) share the same polls. It
+    stops when nothing is pending and starts again with the next track().
+
+    Usage:
+        tracker = OrderTracker(sdk.subgraph)
+        result = await tracker.track(order_id, block_number=receipt['blockNumber'])
+    """
+
+    def __init__(self, subgraph, polling_interval=DEFAULT_POLLING_INTERVAL_SECONDS, max_attempts=DEFAULT_MAX_ATTEMPTS,
+                 http: Optional[HttpPool] = None, verbose=False):
+        self.subgraph = subgraph
+        self.polling_interval = polling_interval
+        self.max_attempts = max_attempts
+        self.http = http  # its session on the tracker loop is closed by close()
+        self.verbose = verbose
+
+        self._pending = {}  # order id -> _TrackedOrder, only touched on the tracker loop
+        self._task = None
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+        self.polls = 0
+
+    def log(self, message):
+        if self.verbose:
+            print(message)
+
+    def _get_loop(self):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(
+                    target=self._loop.run_forever, name="ostium-order-tracker", daemon=True)
+                self._thread.start()
+            return self._loop
+
+    async def track(self, order_id, block_number=None):
+        """
+        Waits until the order settles, returns {'order': {...}, 'trade': {...}} (formatted).
+        With block_number (the receipt's block), polls while the subgraph hasn't indexed it
+        yet don't count as attempts, for up to max_attempts polls.
+        """
+        if not order_id:
+            raise ValueError("Order ID is required")
+        future = asyncio.run_coroutine_threadsafe(self._track(str(order_id), block_number), self._get_loop())
+        return await asyncio.wrap_future(future)
+
+    def pending_count(self):
+        return len(self._pending)
+
+    async def _track(self, order_id, block_number):
+        entry = self._pending.get(order_id)
+        if entry is None:
+            entry = _TrackedOrder(order_id, block_number, asyncio.get_running_loop().create_future())
+            self._pending[order_id] = entry
+            self.log(f"OrderTracker: tracking order {order_id}")
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        # shield: a cancelled caller must not cancel the entry other callers wait on
+        return await asyncio.shield(entry.future)
+
+    async def _run(self):
+        while self._pending:
+            # Sleeping first lets a burst of orders (e.g. after a signal storm) join the same poll,
+            # a just-sent order is never indexed right away anyway
+            await asyncio.sleep(self.polling_interval)
+            try:
+                await self.poll_once()
+            except Exception as e:
+                self.log(f"OrderTracker: poll failed: {e}")
+                for entry in list(self._pending.values()):
+                    self._count_attempt(entry)
+
+    async def poll_once(self):
+        """Fetches every pending order (and known trade) in one request and resolves the settled ones"""
+        entries = list(self._pending.values())
+        trade_ids = {str(entry.order['tradeID']) for entry in entries
+                     if entry.order is not None and entry.order.get('tradeID')}
+        orders, trades = await self.subgraph.get_orders_and_trades([entry.order_id for entry in entries], trade_ids)
+        self.polls += 1
+
+        for entry in entries:
+            order = orders.get(entry.order_id)
+            if order is not None:
+                entry.order = order
+            result = settle_order(order, trades)
+            if result is not None:
+                self.log(f"OrderTracker: order {entry.order_id} settled")
+                self._resolve(entry, result)
+            elif order is None and self._is_unindexed(entry):
+                entry.waited += 1
+            else:
+                self._count_attempt(entry)
+
+    def _is_unindexed(self, entry):
+        indexed_block = self.subgraph.indexed_block
+        return (entry.block_number is not None and entry.waited < self.max_attempts
+                and (indexed_block is None or indexed_block < entry.block_number))
+
+    def _count_attempt(self, entry):
+        entry.attempts += 1
+        if entry.attempts >= self.max_attempts:
+            self.log(f"OrderTracker: max polling attempts reached for order {entry.order_id}")
+            self._resolve(entry, {'order': format_entity_values(entry.order), 'trade': None})
+
+    def _resolve(self, entry, result):
+        self._pending.pop(entry.order_id, None)
+        if not entry.future.done():
+            entry.future.set_result(result)
+
+    def close(self):
+        """Stops the tracker thread, orders still pending are cancelled"""
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop = self._thread = None
+        if loop is None:
+            return
+
+        async def shutdown():
+            if self._task is not None:
+                self._task.cancel()
+                try:
+                    await self._task
+                except asyncio.CancelledError:
+                    pass
+            for entry in self._pending.values():
+                entry.future.cancel()
+            self._pending.clear()
+            if self.http is not None:
+                await self.http.close()
+
+        asyncio.run_coroutine_threadsafe(shutdown(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
@@ -1,49 +1,42 @@
 import traceback
 import asyncio
+import threading
 from decimal import Decimal
 from enum import Enum
 from ostium_python_sdk.constants import PRECISION_2
+from typing import Optional
 from web3 import Web3
+from web3.exceptions import TimeExhausted
 from .abi.usdc_abi import usdc_abi
 from .abi.trading_abi import trading_abi
 from .abi.trading_storage_abi import trading_storage_abi
-from .utils import convert_to_scaled_integer, fromErrorCodeToMessage, get_tp_sl_prices, to_base_units
+from .allowance import AllowanceTracker
+from .gas import FeeOracle, GasProfileCache
+from .exceptions import IndexerLagError, TransactionRevertedError
+from .nonce_manager import NonceManager, is_already_known, is_nonce_error
+from .order_tracker import settle_order
+from .receipt_watcher import PendingTransaction, ReceiptWatcher
+from .utils import convert_to_scaled_integer, encode_abi, format_entity_values, fromErrorCodeToMessage, get_tp_sl_prices, to_base_units
 from eth_account.account import Account
 
 
+# topics[0] of the PriceRequested(orderId, feedId, timestamp) event
+PRICE_REQUESTED_TOPIC = Web3.keccak(text="PriceRequested(uint256,bytes32,uint256)").hex()
+
+
 class OpenOrderType(Enum):
     MARKET = 0
     LIMIT = 1
     STOP = 2
 
 
-class Ostium:
+class OstiumBase:
     """
-    Main client for interacting with the Ostium trading platform on the Arbitrum network.
-
-    Supports opening and closing trades, managing positions, and other trading operations.
-    Also supports delegation through the contract's native delegatedAction functionality,
-    which allows an approved address to execute trades on behalf of another address.
-
-    Args:
-        w3: Web3 instance connected to the Arbitrum network
-        usdc_address: Contract address for USDC token
-        ostium_trading_storage_address: Contract address for the Ostium trading storage
-        ostium_trading_address: Contract address for the Ostium trading contract
-        private_key: Private key for transaction signing
-        verbose: Whether to log detailed information
-        use_delegation: Whether to enable the delegatedAction functionality
-
-    Delegation Usage:
-        1. Initialize the SDK with the delegate's private key
-        2. Set use_delegation=True when initializing or set the use_delegation property to True later
-        3. When calling trade methods, specify the trader_address parameter which is the address
-           on whose behalf the transaction will be executed
-        4. The delegate address must be approved at the contract level to act on behalf of the trader
-        5. The trader address must have approved enough USDC allowance for the trading contract
+    Contracts, account and helpers shared by the blocking Ostium client and AsyncOstium.
+    The contracts are created from w3, so they are async contracts for an AsyncWeb3.
     """
 
-    def __init__(self, w3: Web3, usdc_address: str, ostium_trading_storage_address: str, ostium_trading_address: str, private_key: str, verbose=False, use_delegation=False) -> None:
+    def __init__(self, w3, usdc_address: str, ostium_trading_storage_address: str, ostium_trading_address: str, private_key: str, verbose=False, use_delegation=False, nonce_manager: Optional[NonceManager] = None, allowance_tracker: Optional[AllowanceTracker] = None, gas_profiles: Optional[GasProfileCache] = None, fee_oracle: Optional[FeeOracle] = None, receipt_watcher: Optional[ReceiptWatcher] = None) -> None:
         self.web3 = w3
         self.verbose = verbose
         self.private_key = private_key
@@ -60,6 +53,18 @@ class Ostium:
             address=self.ostium_trading_address, abi=trading_abi)
 
         self.slippage_percentage = 2  # 2%
+        # Nonces are allocated locally, share one manager between the clients of a key
+        self.nonces = nonce_manager or NonceManager(verbose=verbose)
+        # USDC allowance cached and spent locally, topped up according to its policy
+        self.allowances = allowance_tracker or AllowanceTracker(verbose=verbose)
+        # Gas limits learned from receipts and (optionally) fees refreshed in the background,
+        # with both a transaction is built without any RPC
+        self.gas_profiles = gas_profiles or GasProfileCache(verbose=verbose)
+        self.fee_oracle = fee_oracle
+        self._chain_id = None
+        self._function_names = {}  # selector -> Trading function name
+        # Settles the PendingTransaction of submit_trade / submit_close_trade in the background
+        self.receipt_watcher = receipt_watcher or self._default_receipt_watcher()
 
     def log(self, message):
         if self.verbose:
@@ -83,110 +88,357 @@ class Ostium:
         """Get account from stored private key"""
         return self.web3.eth.account.from_key(self.private_key)
 
-    def get_block_number(self):
-        return self.web3.eth.get_block('latest')['number']
-
-    def get_nonce(self, address):
-        return self.web3.eth.get_transaction_count(address)
-
     def _check_private_key(self):
         if not self.private_key:
             raise ValueError(
                 "Private key is required for Ostium platform write-operations")
 
-    def perform_trade(self, trade_params, at_price):
-        self.log(f"Performing trade with params: {trade_params}")
-        account = self._get_account()
-        amount = to_base_units(trade_params['collateral'], decimals=6)
-        self.__approve(account, amount, self.use_delegation,
-                       trade_params.get('trader_address'))
-
+    def _gas_key(self, data):
+        """Gas profile of Trading calldata: the function name, e.g. 'openTrade' or 'delegatedAction(openTrade)'"""
+        name = self._function_name(data[:10])
+        if name == 'delegatedAction':
+            # delegatedAction(address, bytes): the wrapped call follows the address, offset and length words
+            name = f"delegatedAction({self._function_name('0x' + data[202:210])})"
+        return name
+
+    def _function_name(self, selector):
+        if selector not in self._function_names:
+            try:
+                name = self.ostium_trading_contract.get_function_by_selector(selector).fn_name
+            except ValueError:
+                name = selector
+            self._function_names[selector] = name
+        return self._function_names[selector]
+
+    def _transaction_params(self, account, function):
+        """build_transaction params, with the cached gas limit and fees when known (no estimation RPC then)"""
+        params = {'from': account.address}
+        if self._chain_id is not None:
+            params['chainId'] = self._chain_id
+        gas = self.gas_profiles.limit(self._gas_key(self._calldata(function)))
+        if gas is not None:
+            params['gas'] = gas
+        fees = self.fee_oracle.fees() if self.fee_oracle is not None else None
+        if fees is not None:
+            params.update(fees)
+        return params
+
+    def _delegated(self, function, trader_address, action):
+        self.log(f"Using delegatedAction to {action} on behalf of {trader_address}")
+        # Only the calldata is needed: encoded locally, not built (which would estimate gas)
+        return self.ostium_trading_contract.functions.delegatedAction(trader_address, self._calldata(function))
+
+    def _calldata(self, function):
+        """Calldata of a Trading contract function call"""
+        return encode_abi(self.ostium_trading_contract, function.fn_name, function.args, function.kwargs)
+
+    def _submitted(self, tx, tx_hash):
+        if str(tx.get('to', '')).lower() == self.ostium_trading_address.lower():
+            self.gas_profiles.submitted(tx_hash, self._gas_key(tx['data']), tx['gas'])
+
+    def _allowance_owner(self, account, use_delegation, trader_address=None):
+        # Delegated trades spend the trader's USDC, which the delegate can't approve
+        return trader_address if trader_address and use_delegation else account.address
+
+    def _missing_allowance(self, owner):
+        return Exception(
+            f"Sufficient allowance for {owner} not present. Please approve the trading contract to spend USDC.")
+
+    @staticmethod
+    def _known_hash(signed_tx, error):
+        """Hash of signed_tx when the node rejected it for already holding it, None otherwise"""
+        if is_already_known(error):
+            return Web3.keccak(signed_tx.raw_transaction)
+        return None
+
+    def _nonce_failed(self, address, nonce, error):
+        """Reconciles the nonce of a failed send, returns whether sending again with a new nonce may succeed"""
+        if is_nonce_error(error):
+            self.log(f"Nonce {nonce} of {address} rejected ({error}), resyncing")
+            self.nonces.reset(address)
+            return True
+        self.nonces.release(address, nonce)
+        return False
+
+    def _send_interrupted(self, address, nonce):
+        # Cancelled mid-send: the node may or may not have the transaction, so neither releasing
+        # the nonce nor keeping the counter is safe
+        self.log(f"Send of nonce {nonce} of {address} interrupted, resyncing")
+        self.nonces.reset(address)
+
+    def _transaction_dropped(self, address):
+        # A transaction that never got mined may have been dropped, leaving its nonce unused
+        self.log(f"Transaction of {address} not mined in time, resyncing nonces")
+        self.nonces.reset(address)
+
+    @staticmethod
+    def _replay_call(tx, receipt):
+        # eth_call of a mined transaction at its block, to recover why it reverted
+        return ({'from': tx['from'], 'to': tx['to'], 'data': tx['input'], 'value': tx['value'], 'gas': tx['gas']},
+                receipt['blockNumber'])
+
+    def _replay_error_on(self, w3, tx_hash, receipt):
+        """Error raised by replaying a reverted transaction on the blocking w3, None if it didn't revert"""
         try:
-            self.log(f"Final trade parameters being sent: {trade_params}")
-            tp_price, sl_price = get_tp_sl_prices(trade_params)
-
-            trade = {
-                'collateral': convert_to_scaled_integer(trade_params['collateral'], precision=5, scale=6),
-                'openPrice': convert_to_scaled_integer(at_price),
-                'tp': convert_to_scaled_integer(tp_price),
-                'sl': convert_to_scaled_integer(sl_price),
-                'trader': account.address,
-                'leverage': to_base_units(trade_params['leverage'], decimals=2),
-                'pairIndex': int(trade_params['asset_type']),
-                'index': 0,
-                'buy': trade_params['direction']
-            }
+            tx = w3.eth.get_transaction(tx_hash)
+        except Exception as e:
+            self.log(f"Could not fetch reverted transaction {tx_hash.hex()}: {e}")
+            return None
+        try:
+            w3.eth.call(*self._replay_call(tx, receipt))
+        except Exception as e:
+            return e
+        return None
+
+    def _reverted(self, tx_hash, receipt, replay_error):
+        """TransactionRevertedError of a status 0 receipt, from the error its replay raised"""
+        if replay_error is not None:
+            message = str(replay_error)
+            # Custom errors are identified by their data (see utils.fromErrorCodeToMessage)
+            data = getattr(replay_error, 'data', None)
+            if isinstance(data, str) and data not in message:
+                message = f"{message}: {data}"
+        else:
+            # Not reproduced by eth_call: state changed within the block, or it ran out of gas
+            message = f"Transaction {tx_hash.hex()} reverted (gas used: {receipt['gasUsed']})"
+        self.log(f"Transaction {tx_hash.hex()} reverted: {message}")
+        return TransactionRevertedError(message, receipt)
+
+    def _default_receipt_watcher(self):
+        return ReceiptWatcher(self.web3, verbose=self.verbose)
+
+    def _pending_transaction(self, tx_hash, address):
+        """PendingTransaction of a sent trade/close, resolving to its receipt and order ID"""
+        def settle(receipt):
+            # Runs on the watcher thread: the revert is replayed on the watcher's blocking Web3
+            self.gas_profiles.observe(tx_hash, receipt)
+            if receipt['status'] == 0:
+                replay_error = self._replay_error_on(self.receipt_watcher.web3, tx_hash, receipt)
+                raise self._reverted(tx_hash, receipt, replay_error)
+            return {'receipt': receipt, 'order_id': self._get_order_id(receipt)}
+
+        def dropped():
+            self.gas_profiles.observe(tx_hash, None)
+            self._transaction_dropped(address)
+
+        self.log(f"Trade TX Hash: {tx_hash.hex()}")
+        return PendingTransaction(tx_hash, self.receipt_watcher.watch(tx_hash, settle, dropped))
+
+    def _parsed_error(self, e, process):
+        reason_string, suggestion = fromErrorCodeToMessage(str(e), verbose=self.verbose)
+        print(f"An error occurred during the {process} process: {reason_string}")
+        return Exception(f'{reason_string}\n\n{suggestion}' if suggestion is not None else reason_string)
+
+    def _open_trade_args(self, trade_params, at_price, trader):
+        """(trade, order type, slippage) arguments of Trading.openTrade"""
+        tp_price, sl_price = get_tp_sl_prices(trade_params)
+
+        trade = {
+            'collateral': convert_to_scaled_integer(trade_params['collateral'], precision=5, scale=6),
+            'openPrice': convert_to_scaled_integer(at_price),
+            'tp': convert_to_scaled_integer(tp_price),
+            'sl': convert_to_scaled_integer(sl_price),
+            'trader': trader,
+            'leverage': to_base_units(trade_params['leverage'], decimals=2),
+            'pairIndex': int(trade_params['asset_type']),
+            'index': 0,
+            'buy': trade_params['direction']
+        }
+
+        order_type = OpenOrderType.MARKET.value
+
+        if 'order_type' in trade_params:
+            if trade_params['order_type'] == 'LIMIT':
+                order_type = OpenOrderType.LIMIT.value
+            elif trade_params['order_type'] == 'STOP':
+                order_type = OpenOrderType.STOP.value
+            elif trade_params['order_type'] == 'MARKET':
+                pass
+            else:
+                raise Exception('Invalid order type')
+
+        slippage = int(self.slippage_percentage * PRECISION_2)
+        return trade, order_type, slippage
+
+    def _get_order_id(self, receipt):
+        """orderId of the PriceRequested event emitted by an open/close market order, None if absent"""
+        for log in receipt.logs:
+            # Look at the event topic to identify the event type
+            if len(log['topics']) > 0 and log['topics'][0].hex() == PRICE_REQUESTED_TOPIC:
+                # orderId is the indexed parameter (second topic)
+                order_id = int(log['topics'][1].hex(), 16)
+                self.log(f"Found orderId from PriceRequested: {order_id}")
+                return order_id
+        return None
+
+    async def track_order_and_trade(self, subgraph_client, order_id, polling_interval=1, max_attempts=30, block_number=None):
+        """
+        Track an order by its ID and get the resulting trade once the order is executed.
+        Formats the blockchain values to proper decimal representation.
+
+        Args:
+            subgraph_client: The SubgraphClient instance to use for queries
+            order_id: The ID of the order to track
+            polling_interval: Time in seconds between polling attempts
+            max_attempts: Maximum number of polling attempts
+            block_number: Block of the transaction's receipt - when given, the order is only queried
+                once the subgraph has indexed that block instead of polling until it shows up
 
-            order_type = OpenOrderType.MARKET.value
+        Returns:
+            A dictionary containing both the order and trade data with formatted values
+        """
+        self.log(f"Tracking order ID: {order_id}")
 
-            if 'order_type' in trade_params:
-                if trade_params['order_type'] == 'LIMIT':
-                    order_type = OpenOrderType.LIMIT.value
-                elif trade_params['order_type'] == 'STOP':
-                    order_type = OpenOrderType.STOP.value
-                elif trade_params['order_type'] == 'MARKET':
-                    pass
-                else:
-                    raise Exception('Invalid order type')
+        if not order_id:
+            raise ValueError("Order ID is required")
+
+        if block_number is not None:
+            try:
+                indexed_block = await subgraph_client.wait_for_indexed_block(
+                    block_number, timeout=polling_interval * max_attempts)
+                self.log(f"Subgraph indexed block {indexed_block} (receipt block {block_number})")
+            except IndexerLagError as e:
+                self.log(f"{e}, polling for the order anyway")
 
-            slippage = int(self.slippage_percentage * PRECISION_2)
+        # The order and its trade are fetched together, once the tradeID is known
+        order = None
+        for attempt in range(max_attempts):
+            trade_ids = [order['tradeID']] if order is not None and order.get('tradeID') else []
+            orders, trades = await subgraph_client.get_orders_and_trades([order_id], trade_ids)
+            order = orders.get(str(order_id), order)
 
-            if self.use_delegation and 'trader_address' in trade_params:
-                # Use delegatedAction when delegation is enabled
-                trader_address = trade_params['trader_address']
+            result = settle_order(orders.get(str(order_id)), trades)
+            if result is not None:
+                self.log(f"Order {order_id} has been processed")
+                return result
+
+            if order is None:
+                self.log(
+                    f"Order {order_id} not found yet, waiting... (attempt {attempt + 1}/{max_attempts})")
+            elif order.get('isPending', True):
                 self.log(
-                    f"Using delegatedAction to trade on behalf of {trader_address}")
-
-                # The correct way to encode the function call in Web3.py
-                # Create the function object for openTrade
-                open_trade_func = self.ostium_trading_contract.functions.openTrade(
-                    trade, order_type, slippage
-                )
-
-                # Get the encoded data for the openTrade function call
-                inner_encoded_data = open_trade_func.build_transaction({'gas': 0})[
-                    'data']
-
-                # Create the outer delegatedAction transaction
-                trade_tx = self.ostium_trading_contract.functions.delegatedAction(
-                    trader_address, inner_encoded_data
-                ).build_transaction({'from': account.address})
+                    f"Order {order_id} is still pending, waiting... (attempt {attempt + 1}/{max_attempts})")
             else:
-                # Standard direct function call (no delegation)
-                trade_tx = self.ostium_trading_contract.functions.openTrade(
-                    trade, order_type, slippage
-                ).build_transaction({'from': account.address})
+                self.log(
+                    f"Trade {order['tradeID']} is closing but not fully closed yet, waiting... (attempt {attempt + 1}/{max_attempts})")
+            await asyncio.sleep(polling_interval)
+
+        self.log(f"Max polling attempts reached for order {order_id}")
+        return {'order': format_entity_values(order), 'trade': None}
+
+    def _format_entity_values(self, entity, price_fields, collateral_fields, percentage_fields):
+        """Kept for callers of the old method, see utils.format_entity_values"""
+        return format_entity_values(entity, price_fields, collateral_fields, percentage_fields)
 
-            trade_tx['nonce'] = self.get_nonce(account.address)
 
+class Ostium(OstiumBase):
+    """
+    Main client for interacting with the Ostium trading platform on the Arbitrum network.
+
+    Supports opening and closing trades, managing positions, and other trading operations.
+    Also supports delegation through the contract's native delegatedAction functionality,
+    which allows an approved address to execute trades on behalf of another address.
+
+    Args:
+        w3: Web3 instance connected to the Arbitrum network
+        usdc_address: Contract address for USDC token
+        ostium_trading_storage_address: Contract address for the Ostium trading storage
+        ostium_trading_address: Contract address for the Ostium trading contract
+        private_key: Private key for transaction signing
+        verbose: Whether to log detailed information
+        use_delegation: Whether to enable the delegatedAction functionality
+
+    Delegation Usage:
+        1. Initialize the SDK with the delegate's private key
+        2. Set use_delegation=True when initializing or set the use_delegation property to True later
+        3. When calling trade methods, specify the trader_address parameter which is the address
+           on whose behalf the transaction will be executed
+        4. The delegate address must be approved at the contract level to act on behalf of the trader
+        5. The trader address must have approved enough USDC allowance for the trading contract
+    """
+
+    def get_block_number(self):
+        return self.web3.eth.get_block('latest')['number']
+
+    def get_nonce(self, address):
+        return self.web3.eth.get_transaction_count(address)
+
+    def _allocate_nonce(self, address):
+        if not self.nonces.is_synced(address):
+            self.nonces.sync(address, self.web3.eth.get_transaction_count(address, 'pending'))
+        return self.nonces.allocate(address)
+
+    def _build_transaction(self, function, account, trader_address=None, action="trade"):
+        """Transaction calling a Trading function, wrapped in delegatedAction when delegating"""
+        if self.use_delegation and trader_address:
+            function = self._delegated(function, trader_address, action)
+        if self._chain_id is None:
+            self._chain_id = self.web3.eth.chain_id
+        return function.build_transaction(self._transaction_params(account, function))
+
+    def _submit(self, tx, account, private_key=None):
+        """Signs tx with a locally allocated nonce and sends it, returns the transaction hash"""
+        for attempt in range(2):
+            nonce = tx['nonce'] = self._allocate_nonce(account.address)
             signed_tx = self.web3.eth.account.sign_transaction(
-                trade_tx, private_key=self.private_key)
-            trade_tx_hash = self.web3.eth.send_raw_transaction(
-                signed_tx.raw_transaction)
-            trade_receipt = self.web3.eth.wait_for_transaction_receipt(
-                trade_tx_hash)
-            # self.log(f"Order Receipt: {trade_receipt}")
+                tx, private_key=private_key or self.private_key)
+            try:
+                tx_hash = self.web3.eth.send_raw_transaction(signed_tx.raw_transaction)
+            except Exception as e:
+                tx_hash = self._known_hash(signed_tx, e)
+                if tx_hash is None:
+                    # Retried once, with a nonce resynced from the chain, when only the nonce was wrong
+                    if not self._nonce_failed(account.address, nonce, e) or attempt:
+                        raise
+                    continue
+            except BaseException:
+                self._send_interrupted(account.address, nonce)
+                raise
+            self._submitted(tx, tx_hash)
+            return tx_hash
+
+    def _wait_for_receipt(self, tx_hash, address):
+        try:
+            receipt = self.web3.eth.wait_for_transaction_receipt(tx_hash)
+        except TimeExhausted:
+            self.gas_profiles.observe(tx_hash, None)
+            self._transaction_dropped(address)
+            raise
+        self.gas_profiles.observe(tx_hash, receipt)
+        if receipt['status'] == 0:
+            raise self._reverted(tx_hash, receipt, self._replay_error(tx_hash, receipt))
+        return receipt
+
+    def _replay_error(self, tx_hash, receipt):
+        return self._replay_error_on(self.web3, tx_hash, receipt)
+
+    def perform_trade(self, trade_params, at_price):
+        self.log(f"Performing trade with params: {trade_params}")
+        account = self._get_account()
+        amount = to_base_units(trade_params['collateral'], decimals=6)
+        owner = self._reserve_allowance(account, amount, self.use_delegation,
+                                        trade_params.get('trader_address'))
+
+        try:
+            self.log(f"Final trade parameters being sent: {trade_params}")
+            trade, order_type, slippage = self._open_trade_args(trade_params, at_price, account.address)
 
-            # Extract orderId from logs
-            order_id = None
-            for log in trade_receipt.logs:
-                # Define PriceRequested event signature
-                price_requested_signature = self.web3.keccak(
-                    text="PriceRequested(uint256,bytes32,uint256)").hex()
+            trade_tx = self._build_transaction(
+                self.ostium_trading_contract.functions.openTrade(trade, order_type, slippage),
+                account, trade_params.get('trader_address'), action="trade")
 
-                # Look at the event topic to identify the event type
-                if len(log['topics']) > 0 and log['topics'][0].hex() == price_requested_signature:
-                    # orderId is the indexed parameter (second topic)
-                    order_id = int(log['topics'][1].hex(), 16)
-                    self.log(f"Found orderId from PriceRequested: {order_id}")
-                    break
+            trade_tx_hash = self._submit(trade_tx, account)
+            trade_receipt = self._wait_for_receipt(trade_tx_hash, account.address)
+            # self.log(f"Order Receipt: {trade_receipt}")
 
             return {
                 'receipt': trade_receipt,
-                'order_id': order_id
+                'order_id': self._get_order_id(trade_receipt)
             }
 
         except Exception as e:
+            # The collateral may or may not have been spent: read the allowance again next time
+            self.allowances.reset(owner)
             reason_string, suggestion = fromErrorCodeToMessage(
                 e, verbose=self.verbose)
             print(
@@ -194,42 +446,42 @@ class Ostium:
             raise Exception(
                 f'{reason_string}\n\n{suggestion}' if suggestion != None else reason_string)
 
+    def submit_trade(self, trade_params, at_price):
+        """
+        Same trade as perform_trade, but returns as soon as the transaction is sent
+
+        Returns:
+            A PendingTransaction: its tx_hash now; result() - or await - gives the
+            transaction receipt and order ID once it's mined
+        """
+        self.log(f"Submitting trade with params: {trade_params}")
+        account = self._get_account()
+        amount = to_base_units(trade_params['collateral'], decimals=6)
+        owner = self._reserve_allowance(account, amount, self.use_delegation,
+                                        trade_params.get('trader_address'))
+        try:
+            trade, order_type, slippage = self._open_trade_args(trade_params, at_price, account.address)
+            trade_tx = self._build_transaction(
+                self.ostium_trading_contract.functions.openTrade(trade, order_type, slippage),
+                account, trade_params.get('trader_address'), action="trade")
+            trade_tx_hash = self._submit(trade_tx, account)
+        except Exception as e:
+            self.allowances.reset(owner)
+            raise self._parsed_error(e, "trading")
+        return self._pending_transaction(trade_tx_hash, account.address)
+
     def cancel_limit_order(self, pair_id, trade_index, trader_address=None):
         account = self._get_account()
 
         try:
-            if self.use_delegation and trader_address:
-                self.log(
-                    f"Using delegatedAction to cancel limit order on behalf of {trader_address}")
-
-                # The correct way to encode the function call in Web3.py
-                # Create the function object for closeTradeMarket
-                cancel_limit_func = self.ostium_trading_contract.functions.cancelOpenLimitOrder(
-                    int(pair_id), int(trade_index)
-                )
-
-                # Get the encoded data for the closeTradeMarket function call
-                inner_encoded_data = cancel_limit_func.build_transaction({'gas': 0})[
-                    'data']
-
-                # Create the outer delegatedAction transaction
-                trade_tx = self.ostium_trading_contract.functions.delegatedAction(
-                    trader_address, inner_encoded_data
-                ).build_transaction({'from': account.address})
-            else:
-                trade_tx = self.ostium_trading_contract.functions.cancelOpenLimitOrder(
-                    int(pair_id), int(trade_index)).build_transaction({'from': account.address})
+            trade_tx = self._build_transaction(
+                self.ostium_trading_contract.functions.cancelOpenLimitOrder(int(pair_id), int(trade_index)),
+                account, trader_address, action="cancel limit order")
 
-            trade_tx['nonce'] = self.get_nonce(account.address)
-
-            signed_tx = self.web3.eth.account.sign_transaction(
-                trade_tx, private_key=self.private_key)
-            trade_tx_hash = self.web3.eth.send_raw_transaction(
-                signed_tx.raw_transaction)
+            trade_tx_hash = self._submit(trade_tx, account)
             self.log(f"Cancel Limit Order TX Hash: {trade_tx_hash.hex()}")
 
-            trade_receipt = self.web3.eth.wait_for_transaction_receipt(
-                trade_tx_hash)
+            trade_receipt = self._wait_for_receipt(trade_tx_hash, account.address)
             self.log(f"Cancel Limit Order Receipt: {trade_receipt}")
             return trade_receipt
 
@@ -257,63 +509,72 @@ class Ostium:
         self.log(f"Closing trade for pair {pair_id}, index {trade_index}")
         account = self._get_account()
 
-        close_percentage = to_base_units(close_percentage, decimals=2)
-
-        if self.use_delegation and trader_address:
-            self.log(
-                f"Using delegatedAction to close trade on behalf of {trader_address}")
-
-            # The correct way to encode the function call in Web3.py
-            # Create the function object for closeTradeMarket
-            close_trade_func = self.ostium_trading_contract.functions.closeTradeMarket(
-                int(pair_id), int(trade_index), int(close_percentage)
-            )
-
-            # Get the encoded data for the closeTradeMarket function call
-            inner_encoded_data = close_trade_func.build_transaction({'gas': 0})[
-                'data']
-
-            # Create the outer delegatedAction transaction
-            trade_tx = self.ostium_trading_contract.functions.delegatedAction(
-                trader_address, inner_encoded_data
-            ).build_transaction({'from': account.address})
-        else:
-            # Standard direct function call (no delegation)
-            trade_tx = self.ostium_trading_contract.functions.closeTradeMarket(
-                int(pair_id), int(trade_index), int(close_percentage)
-            ).build_transaction({'from': account.address})
-
-        trade_tx['nonce'] = self.get_nonce(account.address)
-
-        signed_tx = self.web3.eth.account.sign_transaction(
-            trade_tx, private_key=self.private_key)
-        trade_tx_hash = self.web3.eth.send_raw_transaction(
-            signed_tx.raw_transaction)
+        trade_tx = self._close_trade_tx(account, pair_id, trade_index, close_percentage, trader_address)
+        trade_tx_hash = self._submit(trade_tx, account)
         self.log(f"Trade TX Hash: {trade_tx_hash.hex()}")
 
-        trade_receipt = self.web3.eth.wait_for_transaction_receipt(
-            trade_tx_hash)
+        trade_receipt = self._wait_for_receipt(trade_tx_hash, account.address)
         # self.log(f"Trade Receipt: {trade_receipt}")
 
-        # Extract orderId from logs
-        order_id = None
-        for log in trade_receipt.logs:
-            # Define PriceRequested event signature
-            price_requested_signature = self.web3.keccak(
-                text="PriceRequested(uint256,bytes32,uint256)").hex()
-
-            # Look at the event topic to identify the event type
-            if len(log['topics']) > 0 and log['topics'][0].hex() == price_requested_signature:
-                # orderId is the indexed parameter (second topic)
-                order_id = int(log['topics'][1].hex(), 16)
-                self.log(f"Found orderId from PriceRequested: {order_id}")
-                break
-
         return {
             'receipt': trade_receipt,
-            'order_id': order_id
+            'order_id': self._get_order_id(trade_receipt)
         }
 
+    def submit_close_trade(self, pair_id, trade_index, close_percentage=100, trader_address=None):
+        """
+        Same close as close_trade, but returns as soon as the transaction is sent
+
+        Returns:
+            A PendingTransaction, see submit_trade
+        """
+        self.log(f"Submitting close of trade for pair {pair_id}, index {trade_index}")
+        account = self._get_account()
+        trade_tx = self._close_trade_tx(account, pair_id, trade_index, close_percentage, trader_address)
+        return self._pending_transaction(self._submit(trade_tx, account), account.address)
+
+    def close_trades(self, positions, close_percentage=100, trader_address=None):
+        """
+        Close several trades at once, e.g. on an exit burst: every close is sent back to back
+        (consecutive local nonces) and only then are the receipts awaited
+
+        Args:
+            positions: (pair_id, trade_index) of each trade to close
+            close_percentage: The percentage of each position to close (1-100, default: 100)
+            trader_address: Optional address of the trader if different from the account (for delegation)
+
+        Returns:
+            One dictionary per position, in order, with the transaction receipt and order ID -
+            or, when that close could not be sent or mined, receipt None and the error
+        """
+        account = self._get_account()
+        tx_hashes = []
+        for pair_id, trade_index in positions:
+            self.log(f"Closing trade for pair {pair_id}, index {trade_index}")
+            try:
+                trade_tx = self._close_trade_tx(account, pair_id, trade_index, close_percentage, trader_address)
+                tx_hashes.append(self._submit(trade_tx, account))
+            except Exception as e:
+                tx_hashes.append(e)
+
+        results = []
+        for tx_hash in tx_hashes:
+            try:
+                if isinstance(tx_hash, Exception):
+                    raise tx_hash
+                trade_receipt = self._wait_for_receipt(tx_hash, account.address)
+                results.append({'receipt': trade_receipt, 'order_id': self._get_order_id(trade_receipt)})
+            except Exception as e:
+                results.append({'receipt': None, 'order_id': None, 'error': str(e)})
+        return results
+
+    def _close_trade_tx(self, account, pair_id, trade_index, close_percentage, trader_address):
+        close_percentage = to_base_units(close_percentage, decimals=2)
+        return self._build_transaction(
+            self.ostium_trading_contract.functions.closeTradeMarket(
+                int(pair_id), int(trade_index), int(close_percentage)),
+            account, trader_address, action="close trade")
+
     def remove_collateral(self, pair_id, trade_index, remove_amount):
         self.log(
             f"Remove collateral for trade for pair {pair_id}, index {trade_index}: {remove_amount} USDC")
@@ -321,18 +582,13 @@ class Ostium:
 
         amount = to_base_units(remove_amount, decimals=6)
 
-        trade_tx = self.ostium_trading_contract.functions.removeCollateral(
-            int(pair_id), int(trade_index), int(amount)).build_transaction({'from': account.address})
-        trade_tx['nonce'] = self.get_nonce(account.address)
-
-        signed_tx = self.web3.eth.account.sign_transaction(
-            trade_tx, private_key=self.private_key)
-        trade_tx_hash = self.web3.eth.send_raw_transaction(
-            signed_tx.raw_transaction)
+        trade_tx = self._build_transaction(
+            self.ostium_trading_contract.functions.removeCollateral(int(pair_id), int(trade_index), int(amount)),
+            account)
+        trade_tx_hash = self._submit(trade_tx, account)
         self.log(f"Remove Collateral TX Hash: {trade_tx_hash.hex()}")
 
-        remove_receipt = self.web3.eth.wait_for_transaction_receipt(
-            trade_tx_hash)
+        remove_receipt = self._wait_for_receipt(trade_tx_hash, account.address)
         self.log(f"Remove Collateral Receipt: {remove_receipt}")
         return remove_receipt
 
@@ -352,47 +608,22 @@ class Ostium:
         account = self._get_account()
         try:
             amount = to_base_units(collateral, decimals=6)
-            self.__approve(account, amount,
-                           self.use_delegation, trader_address)
-
-            if self.use_delegation and trader_address:
-                self.log(
-                    f"Using delegatedAction to add collateral on behalf of {trader_address}")
-
-                # The correct way to encode the function call in Web3.py
-                # Create the function object for topUpCollateral
-                top_up_func = self.ostium_trading_contract.functions.topUpCollateral(
-                    int(pairID), int(index), amount
-                )
-
-                # Get the encoded data for the topUpCollateral function call
-                inner_encoded_data = top_up_func.build_transaction({'gas': 0})[
-                    'data']
-
-                # Create the outer delegatedAction transaction
-                add_collateral_tx = self.ostium_trading_contract.functions.delegatedAction(
-                    trader_address, inner_encoded_data
-                ).build_transaction({'from': account.address})
-            else:
-                # Standard direct function call (no delegation)
-                add_collateral_tx = self.ostium_trading_contract.functions.topUpCollateral(
-                    int(pairID), int(index), amount
-                ).build_transaction({'from': account.address})
+            self._reserve_allowance(account, amount,
+                                    self.use_delegation, trader_address)
 
-            add_collateral_tx['nonce'] = self.get_nonce(account.address)
+            add_collateral_tx = self._build_transaction(
+                self.ostium_trading_contract.functions.topUpCollateral(int(pairID), int(index), amount),
+                account, trader_address, action="add collateral")
 
-            signed_tx = self.web3.eth.account.sign_transaction(
-                add_collateral_tx, private_key=self.private_key)
-            add_collateral_tx_hash = self.web3.eth.send_raw_transaction(
-                signed_tx.raw_transaction)
+            add_collateral_tx_hash = self._submit(add_collateral_tx, account)
             self.log(f"Add Collateral TX Hash: {add_collateral_tx_hash.hex()}")
 
-            add_collateral_receipt = self.web3.eth.wait_for_transaction_receipt(
-                add_collateral_tx_hash)
+            add_collateral_receipt = self._wait_for_receipt(add_collateral_tx_hash, account.address)
             self.log(f"Add Collateral Receipt: {add_collateral_receipt}")
             return add_collateral_receipt
 
         except Exception as e:
+            self.allowances.reset(self._allowance_owner(account, self.use_delegation, trader_address))
             print("An error occurred during the add collateral process:")
             traceback.print_exc()
             raise e
@@ -416,40 +647,14 @@ class Ostium:
         try:
             tp_value = to_base_units(tp_price, decimals=18)
 
-            if self.use_delegation and trader_address:
-                self.log(
-                    f"Using delegatedAction to update TP on behalf of {trader_address}")
-
-                # The correct way to encode the function call in Web3.py
-                # Create the function object for updateTp
-                update_tp_func = self.ostium_trading_contract.functions.updateTp(
-                    int(pair_id), int(trade_index), tp_value
-                )
-
-                # Get the encoded data for the updateTp function call
-                inner_encoded_data = update_tp_func.build_transaction({'gas': 0})[
-                    'data']
-
-                # Create the outer delegatedAction transaction
-                update_tp_tx = self.ostium_trading_contract.functions.delegatedAction(
-                    trader_address, inner_encoded_data
-                ).build_transaction({'from': account.address})
-            else:
-                # Standard direct function call (no delegation)
-                update_tp_tx = self.ostium_trading_contract.functions.updateTp(
-                    int(pair_id), int(trade_index), tp_value
-                ).build_transaction({'from': account.address})
+            update_tp_tx = self._build_transaction(
+                self.ostium_trading_contract.functions.updateTp(int(pair_id), int(trade_index), tp_value),
+                account, trader_address, action="update TP")
 
-            update_tp_tx['nonce'] = self.get_nonce(account.address)
-
-            signed_tx = self.web3.eth.account.sign_transaction(
-                update_tp_tx, private_key=self.private_key)
-            update_tp_tx_hash = self.web3.eth.send_raw_transaction(
-                signed_tx.raw_transaction)
+            update_tp_tx_hash = self._submit(update_tp_tx, account)
             self.log(f"Update TP TX Hash: {update_tp_tx_hash.hex()}")
 
-            update_tp_receipt = self.web3.eth.wait_for_transaction_receipt(
-                update_tp_tx_hash)
+            update_tp_receipt = self._wait_for_receipt(update_tp_tx_hash, account.address)
             return update_tp_receipt
 
         except Exception as e:
@@ -474,40 +679,14 @@ class Ostium:
         try:
             sl_value = to_base_units(sl, decimals=18)
 
-            if self.use_delegation and trader_address:
-                self.log(
-                    f"Using delegatedAction to update SL on behalf of {trader_address}")
-
-                # The correct way to encode the function call in Web3.py
-                # Create the function object for updateSl
-                update_sl_func = self.ostium_trading_contract.functions.updateSl(
-                    int(pairID), int(index), sl_value
-                )
-
-                # Get the encoded data for the updateSl function call
-                inner_encoded_data = update_sl_func.build_transaction({'gas': 0})[
-                    'data']
-
-                # Create the outer delegatedAction transaction
-                update_sl_tx = self.ostium_trading_contract.functions.delegatedAction(
-                    trader_address, inner_encoded_data
-                ).build_transaction({'from': account.address})
-            else:
-                # Standard direct function call (no delegation)
-                update_sl_tx = self.ostium_trading_contract.functions.updateSl(
-                    int(pairID), int(index), sl_value
-                ).build_transaction({'from': account.address})
-
-            update_sl_tx['nonce'] = self.get_nonce(account.address)
+            update_sl_tx = self._build_transaction(
+                self.ostium_trading_contract.functions.updateSl(int(pairID), int(index), sl_value),
+                account, trader_address, action="update SL")
 
-            signed_tx = self.web3.eth.account.sign_transaction(
-                update_sl_tx, private_key=self.private_key)
-            update_sl_tx_hash = self.web3.eth.send_raw_transaction(
-                signed_tx.raw_transaction)
+            update_sl_tx_hash = self._submit(update_sl_tx, account)
             self.log(f"Update SL TX Hash: {update_sl_tx_hash.hex()}")
 
-            update_sl_receipt = self.web3.eth.wait_for_transaction_receipt(
-                update_sl_tx_hash)
+            update_sl_receipt = self._wait_for_receipt(update_sl_tx_hash, account.address)
             return update_sl_receipt
 
         except Exception as e:
@@ -518,32 +697,66 @@ class Ostium:
             raise Exception(
                 f'{reason_string}\n\n{suggestion}' if suggestion != None else reason_string)
 
-    def __approve(self, account, collateral, use_delegation, trader_address=None):
-        trader_address = trader_address if trader_address and use_delegation else account.address
+    def prepare_allowance(self, trader_address=None):
+        """
+        Reads the USDC allowance into the allowance cache and, when it is below the top-up
+        threshold, approves now and waits for the receipt - e.g. at startup, so trades
+        don't have to. Returns the remaining allowance (base units).
+        """
+        account = self._get_account()
+        owner = self._allowance_owner(account, self.use_delegation, trader_address)
+        self._read_allowance(owner)
+        if owner == account.address and self.allowances.start_top_up(owner):
+            self._top_up_allowance(account)
+        return self.allowances.remaining(owner)
+
+    def _read_allowance(self, owner):
         allowance = self.usdc_contract.functions.allowance(
-            trader_address, self.ostium_trading_storage_address).call()
-
-        if allowance < collateral:
-            if not use_delegation:
-                approve_tx = self.usdc_contract.functions.approve(
-                    self.ostium_trading_storage_address,
-                    self.web3.to_wei(1000000, 'mwei')
-                ).build_transaction({'from': account.address})
-
-                approve_tx['nonce'] = self.get_nonce(account.address)
-
-                signed_tx = self.web3.eth.account.sign_transaction(
-                    approve_tx, private_key=self.private_key)
-                approve_tx_hash = self.web3.eth.send_raw_transaction(
-                    signed_tx.raw_transaction)
-                self.log(f"Approval TX Hash: {approve_tx_hash.hex()}")
-
-                approve_receipt = self.web3.eth.wait_for_transaction_receipt(
-                    approve_tx_hash)
-                self.log(f"Approval Receipt: {approve_receipt}")
-            else:
-                raise Exception(
-                    f"Sufficient allowance for {trader_address} not present. Please approve the trading contract to spend USDC.")
+            owner, self.ostium_trading_storage_address).call()
+        self.allowances.sync(owner, allowance)
+
+    def _reserve_allowance(self, account, collateral, use_delegation, trader_address=None):
+        """Takes collateral from the cached allowance, approving inline only when it's short. Returns the owner"""
+        owner = self._allowance_owner(account, use_delegation, trader_address)
+        if not self.allowances.is_synced(owner):
+            self._read_allowance(owner)
+
+        if not self.allowances.reserve(owner, collateral):
+            # Short of the cached count: it may have been approved elsewhere
+            self._read_allowance(owner)
+            if not self.allowances.reserve(owner, collateral):
+                if use_delegation:
+                    raise self._missing_allowance(owner)
+                self._top_up_allowance(account)
+                if not self.allowances.reserve(owner, collateral):
+                    raise self._missing_allowance(owner)
+
+        if owner == account.address and self.allowances.background and self.allowances.start_top_up(owner):
+            threading.Thread(target=self._top_up_allowance, args=(account,),
+                             name="ostium-allowance-top-up", daemon=True).start()
+        return owner
+
+    def _top_up_allowance(self, account):
+        """Approves allowances.approve_amount and waits for the receipt, returns whether it succeeded"""
+        succeeded = False
+        try:
+            approve_tx = self.usdc_contract.functions.approve(
+                self.ostium_trading_storage_address,
+                self.allowances.approve_amount
+            ).build_transaction({'from': account.address})
+
+            approve_tx_hash = self._submit(approve_tx, account)
+            self.allowances.approved(account.address)
+            self.log(f"Approval TX Hash: {approve_tx_hash.hex()}")
+
+            approve_receipt = self._wait_for_receipt(approve_tx_hash, account.address)
+            self.log(f"Approval Receipt: {approve_receipt}")
+            succeeded = approve_receipt['status'] == 1
+        except Exception as e:
+            print(f"An error occurred during the approval process: {e}")
+        finally:
+            self.allowances.finish_top_up(account.address, succeeded)
+        return succeeded
 
     def withdraw(self, amount, receiving_address):
         account = self._get_account()
@@ -559,16 +772,10 @@ class Ostium:
                 amount_in_base_units
             ).build_transaction({'from': account.address})
 
-            transfer_tx['nonce'] = self.get_nonce(account.address)
-
-            signed_tx = self.web3.eth.account.sign_transaction(
-                transfer_tx, private_key=self.private_key)
-            transfer_tx_hash = self.web3.eth.send_raw_transaction(
-                signed_tx.raw_transaction)
+            transfer_tx_hash = self._submit(transfer_tx, account)
             self.log(f"Transfer TX Hash: {transfer_tx_hash.hex()}")
 
-            transfer_receipt = self.web3.eth.wait_for_transaction_receipt(
-                transfer_tx_hash)
+            transfer_receipt = self._wait_for_receipt(transfer_tx_hash, account.address)
             self.log(f"Transfer Receipt: {transfer_receipt}")
             return transfer_receipt
 
@@ -607,16 +814,10 @@ class Ostium:
                 sl_value
             ).build_transaction({'from': account.address})
 
-            trade_tx['nonce'] = self.get_nonce(account.address)
-
-            signed_tx = self.web3.eth.account.sign_transaction(
-                trade_tx, private_key=account.key)
-            trade_tx_hash = self.web3.eth.send_raw_transaction(
-                signed_tx.raw_transaction)
+            trade_tx_hash = self._submit(trade_tx, account, private_key=account.key)
             self.log(f"Update Limit Order TX Hash: {trade_tx_hash.hex()}")
 
-            trade_receipt = self.web3.eth.wait_for_transaction_receipt(
-                trade_tx_hash)
+            trade_receipt = self._wait_for_receipt(trade_tx_hash, account.address)
             self.log(f"Update Limit Order Receipt: {trade_receipt}")
             return trade_receipt
 
@@ -627,144 +828,3 @@ class Ostium:
                 f"An error occurred during the update limit order process: {reason_string}")
             raise Exception(
                 f'{reason_string}\n\n{suggestion}' if suggestion != None else reason_string)
-
-    async def track_order_and_trade(self, subgraph_client, order_id, polling_interval=1, max_attempts=30):
-        """
-        Track an order by its ID and get the resulting trade once the order is executed.
-        Formats the blockchain values to proper decimal representation.
-
-        Args:
-            subgraph_client: The SubgraphClient instance to use for queries
-            order_id: The ID of the order to track
-            polling_interval: Time in seconds between polling attempts
-            max_attempts: Maximum number of polling attempts
-
-        Returns:
-            A dictionary containing both the order and trade data with formatted values
-        """
-        self.log(f"Tracking order ID: {order_id}")
-
-        if not order_id:
-            raise ValueError("Order ID is required")
-        # Fields that should be formatted to proper decimal values
-        price_fields = [
-            'price', 'priceAfterImpact', 'openPrice', 'closePrice',
-            'takeProfitPrice', 'stopLossPrice'
-        ]
-        collateral_fields = [
-            'collateral', 'notional', 'tradeNotional', 'amountSentToTrader',
-            'devFee', 'vaultFee', 'oracleFee', 'liquidationFee', 'fundingFee', 'rolloverFee'
-        ]
-        percentage_fields = [
-            'profitPercent', 'totalProfitPercent', 'priceImpactP', 'leverage', 'highestLeverage',
-            'closePercent'
-        ]
-
-        for attempt in range(max_attempts):
-            order = await subgraph_client.get_order_by_id(order_id)
-
-            if not order:
-                self.log(
-                    f"Order {order_id} not found yet, waiting... (attempt {attempt + 1}/{max_attempts})")
-                await asyncio.sleep(polling_interval)
-                continue
-
-            # Format numeric values in order
-            formatted_order = self._format_entity_values(
-                order, price_fields, collateral_fields, percentage_fields)
-
-            if not formatted_order.get('isPending', True):
-                self.log(f"Order {order_id} has been processed")
-
-                # Check if it was cancelled
-                if formatted_order.get('isCancelled', False):
-                    self.log(
-                        f"Order {order_id} was cancelled: {formatted_order.get('cancelReason', 'Unknown reason')}")
-                    return {'order': formatted_order, 'trade': None}
-
-                # If not cancelled, look for the trade using tradeID from the order
-                trade_id = formatted_order.get('tradeID')
-                if trade_id:
-                    self.log(f"Looking for trade with ID: {trade_id}")
-                    trade = await subgraph_client.get_trade_by_id(trade_id)
-
-                    if trade:
-                        # Format numeric values in trade
-                        formatted_trade = self._format_entity_values(
-                            trade, price_fields, collateral_fields, percentage_fields)
-
-                        # Special handling for closing orders - we need to verify the trade is actually closed
-                        if formatted_order.get('orderAction') == 'Close':
-                            # For a close order, we need to check if the trade is actually closed (isOpen = false)
-                            if formatted_trade.get('isOpen', True):
-                                self.log(
-                                    f"Trade {trade_id} is closing but not fully closed yet, waiting... (attempt {attempt + 1}/{max_attempts})")
-                                await asyncio.sleep(polling_interval)
-                                continue
-
-                        self.log(f"Found trade for order {order_id}")
-                        return {'order': formatted_order, 'trade': formatted_trade}
-                    else:
-                        self.log(f"No trade found with ID {trade_id}")
-                        return {'order': formatted_order, 'trade': None}
-                else:
-                    self.log(f"No tradeID found in order {order_id}")
-                    return {'order': formatted_order, 'trade': None}
-
-            self.log(
-                f"Order {order_id} is still pending, waiting... (attempt {attempt + 1}/{max_attempts})")
-            await asyncio.sleep(polling_interval)
-
-        self.log(f"Max polling attempts reached for order {order_id}")
-        order = await subgraph_client.get_order_by_id(order_id)
-        if order:
-            formatted_order = self._format_entity_values(
-                order, price_fields, collateral_fields, percentage_fields)
-            return {'order': formatted_order, 'trade': None}
-        return {'order': None, 'trade': None}
-
-    def _format_entity_values(self, entity, price_fields, collateral_fields, percentage_fields):
-        """
-        Format values in an entity (order or trade) to proper decimal representations
-
-        Args:
-            entity: The entity (order or trade) to format values for
-            price_fields: List of field names that represent prices
-            collateral_fields: List of field names that represent collateral/token amounts
-            percentage_fields: List of field names that represent percentages
-
-        Returns:
-            A new dictionary with formatted values
-        """
-        if not entity:
-            return None
-
-        formatted_entity = {}
-
-        for key, value in entity.items():
-            if value is None:
-                formatted_entity[key] = value
-                continue
-
-            if key in price_fields and isinstance(value, (int, str, Decimal)):
-                # Format prices with 18 decimals
-                try:
-                    formatted_entity[key] = float(value) / 10**18
-                except (ValueError, TypeError):
-                    formatted_entity[key] = value
-            elif key in collateral_fields and isinstance(value, (int, str, Decimal)):
-                # Format collateral values with 6 decimals (USDC-like precision)
-                try:
-                    formatted_entity[key] = float(value) / 10**6
-                except (ValueError, TypeError):
-                    formatted_entity[key] = value
-            elif key in percentage_fields and isinstance(value, (int, str, Decimal)):
-                # Format percentage values with 2 decimals
-                try:
-                    formatted_entity[key] = float(value) / 10**2
-                except (ValueError, TypeError):
-                    formatted_entity[key] = value
-            else:
-                formatted_entity[key] = value
-
-        return formatted_entity
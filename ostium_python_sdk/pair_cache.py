@@ -0,0 +1,121 @@
+import asyncio
+import time
+from typing import Optional
+
+# Pair details (open interest, funding / rollover accumulators) change with every trade
+DEFAULT_PAIR_DETAILS_MAX_AGE_SECONDS = 15
+DEFAULT_PAIR_DETAILS_MAX_BLOCK_LAG = 60  # ~15s of Arbitrum blocks
+# Leverage limits and fees only change with governance updates
+DEFAULT_PAIR_STATIC_MAX_AGE_SECONDS = 3600
+
+STATIC_PAIR_FIELDS = (
+    'id', 'from', 'to',
+    'maxLeverage', 'overnightMaxLeverage', 'makerMaxLeverage',
+    'makerFeeP', 'takerFeeP',
+    'group', 'fee',
+)
+
+
+class _Entry:
+    __slots__ = ('details', 'fetched_at', 'block')
+
+    def __init__(self, details, fetched_at, block):
+        self.details = details
+        self.fetched_at = fetched_at  # time.monotonic() when the query was sent
+        self.block = block  # chain head the details were fetched at, None when unknown
+
+
+class PairDetailsCache:
+    """
+    Pair details from the subgraph, cached per pair id.
+
+    An entry is refetched when it is older than max_age seconds or, when the caller passes
+    the current block number, when the chain head moved more than max_block_lag blocks past
+    the block the entry was fetched at. An entry fetched without a block number only
+    expires with its age. Concurrent misses for the same pair share one query.
+
+    The static fields (leverage limits, fees) are kept separately for static_max_age
+    seconds, so get_static() keeps answering from memory after the dynamic entry expired.
+    """
+
+    def __init__(self, subgraph, max_age=DEFAULT_PAIR_DETAILS_MAX_AGE_SECONDS,
+                 max_block_lag: Optional[int] = DEFAULT_PAIR_DETAILS_MAX_BLOCK_LAG,
+                 static_max_age=DEFAULT_PAIR_STATIC_MAX_AGE_SECONDS, verbose=False):
+        self.subgraph = subgraph
+        self.max_age = max_age
+        self.max_block_lag = max_block_lag
+        self.static_max_age = static_max_age
+        self.verbose = verbose
+
+        self._entries = {}  # pair id -> _Entry
+        self._static = {}  # pair id -> _Entry holding only STATIC_PAIR_FIELDS
+        self._inflight = {}  # pair id -> task fetching it
+
+        self.hits = 0
+        self.misses = 0
+
+    def log(self, message):
+        if self.verbose:
+            print(message)
+
+    def _is_fresh(self, entry, max_age, block_number=None):
+        if entry is None or time.monotonic() - entry.fetched_at >= max_age:
+            return False
+        if block_number is not None and self.max_block_lag is not None and entry.block is not None:
+            return block_number - entry.block <= self.max_block_lag
+        return True
+
+    async def get(self, pair_id, block_number: Optional[int] = None):
+        """Pair details (as SubgraphClient.get_pair_details returns them), e.g:
+        await cache.get(0, block_number=w3.eth.block_number)"""
+        key = str(pair_id)
+        entry = self._entries.get(key)
+        if self._is_fresh(entry, self.max_age, block_number):
+            self.hits += 1
+            return entry.details
+        self.misses += 1
+        return await self._refresh(key, block_number)
+
+    async def get_static(self, pair_id):
+        """Leverage limits and fees of a pair (STATIC_PAIR_FIELDS), cached for static_max_age"""
+        key = str(pair_id)
+        entry = self._static.get(key)
+        if self._is_fresh(entry, self.static_max_age):
+            self.hits += 1
+            return entry.details
+        self.misses += 1
+        await self._refresh(key)
+        return self._static[key].details
+
+    def invalidate(self, pair_id=None):
+        """Drops the cached details of one pair, or of every pair (static fields included)"""
+        if pair_id is None:
+            self._entries.clear()
+            self._static.clear()
+        else:
+            self._entries.pop(str(pair_id), None)
+            self._static.pop(str(pair_id), None)
+
+    async def _refresh(self, key, block_number=None):
+        loop = asyncio.get_running_loop()
+        inflight = self._inflight.get(key)
+
+        # A task can only be awaited from the loop it was created on
+        if inflight is None or inflight.done() or inflight.get_loop() is not loop:
+            inflight = loop.create_task(self._fetch(key, block_number))
+            self._inflight[key] = inflight
+
+        # shield: a cancelled caller must not cancel the fetch other callers wait on
+        return await asyncio.shield(inflight)
+
+    async def _fetch(self, key, block_number):
+        requested_at = time.monotonic()
+        details = await self.subgraph.get_pair_details(key)
+
+        # Not lastFundingBlock / lastRolloverBlock: those lag the head by however long the pair
+        # went without trades, which would make every later get(block_number=...) refetch
+        self._entries[key] = _Entry(details, requested_at, block_number)
+        static = {field: details[field] for field in STATIC_PAIR_FIELDS if field in details}
+        self._static[key] = _Entry(static, requested_at, None)
+        self.log(f"PairDetailsCache: fetched pair {key} at block {block_number}")
+        return details
@@ -1,46 +1,233 @@
-import aiohttp
-from typing import Tuple
+import asyncio
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+from .exceptions import StalePriceError
+from .http_pool import HttpPool, get_default_http_pool
+from .metrics import LatencyStats
+
+# Snapshots younger than this are served from memory instead of downloading
+# the whole latest-prices payload again
+DEFAULT_PRICE_MAX_AGE_MS = 1000
+
+
+class PriceSnapshot:
+    """
+    One latest-prices payload, indexed by (from, to) and by feed_id so lookups
+    don't scan the whole price list.
+    """
+
+    __slots__ = ('prices', 'by_pair', 'by_feed')
+
+    def __init__(self, prices):
+        self.prices = prices
+        self.by_pair = {}
+        self.by_feed = {}
+        for price_data in prices:
+            self.by_pair[(price_data.get('from'), price_data.get('to'))] = price_data
+            feed_id = price_data.get('feed_id')
+            if feed_id is not None:
+                self.by_feed[feed_id.lower()] = price_data
+
+    def get(self, from_asset: str, to_asset: str):
+        return self.by_pair.get((from_asset, to_asset))
+
+    def get_by_feed(self, feed_id: str):
+        return self.by_feed.get(feed_id.lower())
 
 
 class Price:
-    def __init__(self, verbose=False):
+    def __init__(self, verbose=False, max_age_ms=DEFAULT_PRICE_MAX_AGE_MS, http: Optional[HttpPool] = None):
         self.verbose = verbose
+        self.http = http or get_default_http_pool()
         self.base_url = "https://metadata-backend.ostium.io"
+        self.max_age_ms = max_age_ms
+
+        self._snapshot = None
+        self._snapshot_time = None  # time.monotonic() when the snapshot was requested
+        self._inflight = None
+        self._snapshot_listeners = []
+
+        self.fetch_latency = LatencyStats()
 
     def log(self, message):
         if self.verbose:
             print(message)
 
-    async def get_latest_prices(self):
+    async def get_latest_prices(self, max_age_ms=None):
         """
         Fetches the latest prices from the Ostium metadata-backend service.
-        Returns a dictionary of price data.
+        Returns a list of price data.
+
+        The last snapshot is reused while it is younger than max_age_ms (defaults to
+        the max_age_ms the instance was created with, 0 forces a refetch). Concurrent
+        callers that miss the cache share a single in-flight request.
+        """
+        snapshot = await self.get_snapshot(max_age_ms)
+        return snapshot.prices
+
+    async def get_snapshot(self, max_age_ms=None) -> PriceSnapshot:
+        """Same as get_latest_prices() but returns the indexed PriceSnapshot"""
+        if max_age_ms is None:
+            max_age_ms = self.max_age_ms
+
+        if self._is_fresh(max_age_ms):
+            return self._snapshot
+
+        return await self._refresh()
+
+    def add_snapshot_listener(self, listener):
+        """Registers listener(snapshot), called synchronously after every fetched snapshot"""
+        if listener not in self._snapshot_listeners:
+            self._snapshot_listeners.append(listener)
+
+    def remove_snapshot_listener(self, listener):
+        if listener in self._snapshot_listeners:
+            self._snapshot_listeners.remove(listener)
+
+    def get_cached_snapshot(self):
+        """Last fetched PriceSnapshot regardless of its age, None if nothing was fetched yet"""
+        return self._snapshot
+
+    def invalidate(self):
+        """Drops the cached snapshot so the next lookup refetches"""
+        self._snapshot = None
+        self._snapshot_time = None
+
+    def get_snapshot_age_ms(self):
+        """Age of the cached snapshot in milliseconds, None if nothing was fetched yet"""
+        if self._snapshot_time is None:
+            return None
+        return (time.monotonic() - self._snapshot_time) * 1000
+
+    def _is_fresh(self, max_age_ms):
+        if self._snapshot is None or max_age_ms <= 0:
+            return False
+        return self.get_snapshot_age_ms() < max_age_ms
+
+    def get_feed_ages(self) -> Dict[Tuple[str, str], float]:
+        """Seconds since each pair's timestampSeconds in the cached snapshot"""
+        snapshot = self._snapshot
+        if snapshot is None:
+            return {}
+        now = time.time()
+        return {pair: now - price_data['timestampSeconds']
+                for pair, price_data in snapshot.by_pair.items()
+                if price_data.get('timestampSeconds') is not None}
+
+    def get_staleness_metrics(self):
         """
-        async with aiohttp.ClientSession() as session:
-            async with session.get(f"{self.base_url}/PricePublish/latest-prices") as response:
-                if response.status == 200:
-                    return await response.json()
-                else:
-                    raise Exception(
-                        f"Failed to fetch prices: {response.status}")
+        Freshness of the cached prices, e.g:
+        {'snapshot_age_ms': 240.1, 'fetch_latency_ms': {'count': 12, 'p50': 85.2, 'p95': 140.7, 'p99': 140.7, 'max': 140.7},
+         'feed_age_seconds': {('BTC', 'USD'): 0.8, ...}}
+        """
+        return {
+            'snapshot_age_ms': self.get_snapshot_age_ms(),
+            'fetch_latency_ms': self.fetch_latency.summary(),
+            'feed_age_seconds': self.get_feed_ages(),
+        }
+
+    async def _refresh(self):
+        loop = asyncio.get_running_loop()
+        inflight = self._inflight
+
+        # A task can only be awaited from the loop it was created on
+        if inflight is None or inflight.done() or inflight.get_loop() is not loop:
+            inflight = loop.create_task(self._fetch_latest_prices())
+            self._inflight = inflight
+
+        # shield: a cancelled caller must not cancel the fetch other callers wait on
+        return await asyncio.shield(inflight)
+
+    async def _fetch_latest_prices(self):
+        requested_at = time.monotonic()
+        prices = await self._download_latest_prices()
+        self.fetch_latency.record((time.monotonic() - requested_at) * 1000)
+
+        snapshot = PriceSnapshot(prices)
+        self._snapshot = snapshot
+        self._snapshot_time = requested_at
+
+        for listener in list(self._snapshot_listeners):
+            try:
+                listener(snapshot)
+            except Exception as e:
+                self.log(f"Price: snapshot listener failed: {e}")
+        return snapshot
+
+    async def _download_latest_prices(self):
+        async with self.http.session().get(f"{self.base_url}/PricePublish/latest-prices") as response:
+            if response.status == 200:
+                return await response.json()
+            else:
+                raise Exception(
+                    f"Failed to fetch prices: {response.status}")
 
     # Returns a json, e.g: {'feed_id': '0x00039d9e45394f473ab1f050a1b963e6b05351e52d71e507509ada0c95ed75b8', 'bid': 107646.01338169997, 'mid': 107646.03680130735, 'ask': 107646.06022091472, 'isMarketOpen': True, 'isDayTradingClosed': False, 'secondsToToggleIsDayTradingClosed': -1, 'from': 'BTC', 'to': 'USD', 'timestampSeconds': 1748460056}
-    async def get_latest_price_json(self, from_asset: str, to_asset: str):
-        prices = await self.get_latest_prices()
-        for price_data in prices:
-            if (price_data.get('from') == from_asset and
-                    price_data.get('to') == to_asset):
-                self.log(f"get_latest_price_json: {price_data}")
-                return price_data
-        raise ValueError(f"No price found for pair: {from_asset}/{to_asset}")
+    #
+    # max_age_ms: maximum age of the cached snapshot (defaults to the instance's max_age_ms)
+    # max_feed_age_ms: maximum age of the price itself (by its timestampSeconds); the snapshot is
+    # refetched once if the cached one is too old and StalePriceError is raised if the feed still is
+    async def get_latest_price_json(self, from_asset: str, to_asset: str, max_age_ms=None, max_feed_age_ms=None):
+        price_data = await self._lookup(from_asset, to_asset, max_age_ms, max_feed_age_ms)
+        self.log(f"get_latest_price_json: {price_data}")
+        return price_data
+
+    # Same json as get_latest_price_json(), looked up by the pair's feed id
+    async def get_latest_price_json_by_feed(self, feed_id: str, max_age_ms=None):
+        snapshot = await self.get_snapshot(max_age_ms)
+        price_data = snapshot.get_by_feed(feed_id)
+        if price_data is None:
+            raise ValueError(f"No price found for feed: {feed_id}")
+        return price_data
 
     # Returns a mid price and isMarketOpen tuple, e.g: (97243.36503172085, True)
-    async def get_price(self, from_currency, to_currency) -> Tuple[float, bool, bool]:
+    async def get_price(self, from_currency, to_currency, max_age_ms=None, max_feed_age_ms=None) -> Tuple[float, bool, bool]:
         self.log(f"Getting price for {from_currency}/{to_currency}")
-        prices = await self.get_latest_prices()
-        for price_data in prices:
-            if (price_data.get('from') == from_currency and
-                    price_data.get('to') == to_currency):
-                return float(price_data.get('mid', 0)), price_data.get('isMarketOpen', False), price_data.get('isDayTradingClosed', False)
-        raise ValueError(
-            f"No price found for pair: {from_currency}/{to_currency}")
+        price_data = await self._lookup(from_currency, to_currency, max_age_ms, max_feed_age_ms)
+        return self._to_price_tuple(price_data)
+
+    # Resolves many pairs from a single snapshot, e.g: get_prices([('BTC', 'USD'), ('EUR', 'USD')])
+    # returns {('BTC', 'USD'): (97243.36503172085, True, False), ...} - pairs with no price are left out
+    async def get_prices(self, pairs: Iterable[Tuple[str, str]], max_age_ms=None) -> Dict[Tuple[str, str], Tuple[float, bool, bool]]:
+        snapshot = await self.get_snapshot(max_age_ms)
+        ret = {}
+        for from_currency, to_currency in pairs:
+            price_data = snapshot.get(from_currency, to_currency)
+            if price_data is not None:
+                ret[(from_currency, to_currency)] = self._to_price_tuple(price_data)
+        return ret
+
+    async def _lookup(self, from_asset, to_asset, max_age_ms=None, max_feed_age_ms: Optional[float] = None):
+        snapshot = await self.get_snapshot(max_age_ms)
+        price_data = snapshot.get(from_asset, to_asset)
+        if price_data is None:
+            raise ValueError(
+                f"No price found for pair: {from_asset}/{to_asset}")
+
+        if max_feed_age_ms is None or self._feed_age_ms(price_data) <= max_feed_age_ms:
+            return price_data
+
+        # Only pay for a refetch when the cached price is actually too old
+        snapshot = await self.get_snapshot(max_age_ms=0)
+        price_data = snapshot.get(from_asset, to_asset)
+        if price_data is None:
+            raise ValueError(
+                f"No price found for pair: {from_asset}/{to_asset}")
+
+        feed_age_ms = self._feed_age_ms(price_data)
+        if feed_age_ms > max_feed_age_ms:
+            raise StalePriceError(
+                f"Price for {from_asset}/{to_asset} is {feed_age_ms:.0f}ms old (max allowed: {max_feed_age_ms}ms)")
+        return price_data
+
+    @staticmethod
+    def _feed_age_ms(price_data):
+        timestamp = price_data.get('timestampSeconds')
+        if timestamp is None:
+            return float('inf')
+        return (time.time() - timestamp) * 1000
+
+    @staticmethod
+    def _to_price_tuple(price_data) -> Tuple[float, bool, bool]:
+        return float(price_data.get('mid', 0)), price_data.get('isMarketOpen', False), price_data.get('isDayTradingClosed', False)
@@ -0,0 +1,127 @@
+import numpy as np
+from typing import Optional, Tuple
+
+from .price import Price, PriceSnapshot
+
+# ~1 hour of 1s samples per pair, 32 bytes per sample
+DEFAULT_HISTORY_CAPACITY = 3600
+
+# Column order of the arrays returned by PriceRingBuffer
+TIMESTAMP, BID, MID, ASK = range(4)
+
+
+class PriceRingBuffer:
+    """
+    Fixed-size, array-backed buffer of (timestamp, bid, mid, ask) samples.
+    Once full, every new sample overwrites the oldest one, so memory never grows.
+    """
+
+    def __init__(self, capacity=DEFAULT_HISTORY_CAPACITY):
+        if capacity <= 0:
+            raise ValueError("capacity must be positive")
+        self.capacity = capacity
+        self._data = np.empty((capacity, 4), dtype=np.float64)
+        self._next = 0
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def append(self, timestamp, bid, mid, ask):
+        self._data[self._next] = (timestamp, bid, mid, ask)
+        self._next = (self._next + 1) % self.capacity
+        self._count = min(self._count + 1, self.capacity)
+
+    def last(self, n: Optional[int] = None) -> np.ndarray:
+        """
+        The most recent n samples (all if None) in chronological order, shape (n, 4).
+        Returns a view when the samples are contiguous in the buffer, a copy when they wrap.
+        """
+        n = self._count if n is None else min(n, self._count)
+        if n <= 0:
+            return self._data[:0]
+
+        start = (self._next - n) % self.capacity
+        if start < self._next:
+            return self._data[start:self._next]
+        return np.concatenate((self._data[start:], self._data[:self._next]))
+
+    def since(self, timestamp) -> np.ndarray:
+        """Samples with timestamp >= the given unix timestamp, in chronological order"""
+        samples = self.last()
+        first = np.searchsorted(samples[:, TIMESTAMP], timestamp, side='left')
+        return samples[first:]
+
+    def latest(self) -> Optional[np.ndarray]:
+        if self._count == 0:
+            return None
+        return self._data[(self._next - 1) % self.capacity]
+
+    @property
+    def timestamps(self) -> np.ndarray:
+        return self.last()[:, TIMESTAMP]
+
+    @property
+    def mids(self) -> np.ndarray:
+        return self.last()[:, MID]
+
+
+class PriceHistory:
+    """
+    Recent price history for every pair seen in the price snapshots, one
+    PriceRingBuffer per (from, to) pair.
+
+    A sample is only recorded when a pair's timestampSeconds advances, so polling
+    faster than the feed updates does not fill the buffers with duplicates.
+
+    Usage:
+        history = PriceHistory(capacity=3600)
+        history.attach(sdk.price)
+        ...
+        mids = history.get('BTC', 'USD').mids
+    """
+
+    def __init__(self, capacity=DEFAULT_HISTORY_CAPACITY, verbose=False):
+        self.capacity = capacity
+        self.verbose = verbose
+        self._buffers = {}
+
+    def log(self, message):
+        if self.verbose:
+            print(message)
+
+    def attach(self, price: Price):
+        """Records every snapshot fetched by price"""
+        price.add_snapshot_listener(self.update)
+        snapshot = price.get_cached_snapshot()
+        if snapshot is not None:
+            self.update(snapshot)
+
+    def detach(self, price: Price):
+        price.remove_snapshot_listener(self.update)
+
+    def update(self, snapshot: PriceSnapshot):
+        for (from_asset, to_asset), price_data in snapshot.by_pair.items():
+            timestamp = price_data.get('timestampSeconds')
+            if timestamp is None:
+                continue
+
+            buffer = self._buffers.get((from_asset, to_asset))
+            if buffer is None:
+                buffer = PriceRingBuffer(self.capacity)
+                self._buffers[(from_asset, to_asset)] = buffer
+            else:
+                latest = buffer.latest()
+                if latest is not None and timestamp <= latest[TIMESTAMP]:
+                    continue
+
+            buffer.append(timestamp,
+                          price_data.get('bid', np.nan),
+                          price_data.get('mid', np.nan),
+                          price_data.get('ask', np.nan))
+
+    def get(self, from_asset: str, to_asset: str) -> Optional[PriceRingBuffer]:
+        return self._buffers.get((from_asset, to_asset))
+
+    def pairs(self) -> Tuple[Tuple[str, str], ...]:
+        return tuple(self._buffers)
@@ -0,0 +1,236 @@
+import asyncio
+from typing import Iterable, Optional, Tuple
+
+from .price import Price, PriceSnapshot
+
+DEFAULT_STREAM_INTERVAL_SECONDS = 1.0
+DEFAULT_SUBSCRIBER_QUEUE_SIZE = 100
+
+DEFAULT_FAST_INTERVAL_SECONDS = 0.25
+DEFAULT_CLOSED_INTERVAL_SECONDS = 300.0
+
+
+class PollScheduler:
+    """
+    Picks the delay until the next price poll from the market status in the last snapshot.
+
+    - closed markets (isMarketOpen False, e.g. FX/indices on weekends, stocks overnight) are
+      polled again when secondsToToggleIsDayTradingClosed elapses, at least every
+      closed_interval as a safety net
+    - 24/7 feeds (crypto: open with no toggle time, secondsToToggleIsDayTradingClosed == -1)
+      or the explicitly listed fast_pairs are polled every fast_interval
+    - every other open market is polled every active_interval
+
+    The next poll happens at the earliest time any of the watched pairs needs one.
+    """
+
+    def __init__(self, active_interval=DEFAULT_STREAM_INTERVAL_SECONDS, fast_interval=DEFAULT_FAST_INTERVAL_SECONDS,
+                 closed_interval=DEFAULT_CLOSED_INTERVAL_SECONDS, fast_pairs: Optional[Iterable[Tuple[str, str]]] = None):
+        self.active_interval = active_interval
+        self.fast_interval = fast_interval
+        self.closed_interval = closed_interval
+        self.fast_pairs = set(fast_pairs) if fast_pairs is not None else None
+
+    def is_fast(self, price_data):
+        if self.fast_pairs is not None:
+            return (price_data.get('from'), price_data.get('to')) in self.fast_pairs
+        return price_data.get('secondsToToggleIsDayTradingClosed', -1) == -1
+
+    def pair_delay(self, price_data):
+        """Seconds until this pair needs to be polled again"""
+        if not price_data.get('isMarketOpen', False):
+            seconds_to_toggle = price_data.get('secondsToToggleIsDayTradingClosed', -1)
+            if seconds_to_toggle is not None and seconds_to_toggle > 0:
+                return min(seconds_to_toggle, self.closed_interval)
+            return self.closed_interval
+
+        if self.is_fast(price_data):
+            return self.fast_interval
+        return self.active_interval
+
+    def next_delay(self, snapshot: Optional[PriceSnapshot], pairs: Optional[Iterable[Tuple[str, str]]] = None):
+        """Delay until the next poll for the given (from, to) pairs, all pairs if None"""
+        if snapshot is None:
+            return self.active_interval
+
+        if pairs is None:
+            watched = snapshot.prices
+        else:
+            watched = [p for p in (snapshot.get(*pair) for pair in pairs) if p is not None]
+            if not watched:
+                return self.active_interval
+
+        return min((self.pair_delay(price_data) for price_data in watched), default=self.active_interval)
+
+
+class PriceStream:
+    """
+    Push-style price updates on top of Price.
+
+    A single background task polls the latest-prices snapshot every `interval` seconds,
+    diffs it against the previous one by timestampSeconds and pushes the changed price
+    records to every subscriber queue. Each queue item is a list of price jsons (same
+    shape as Price.get_latest_price_json()) - one list per poll that saw changes.
+
+    Subscriber queues are bounded: when a consumer falls behind, the oldest pending
+    item is dropped to make room for the newest one.
+
+    With a PollScheduler the cadence follows market hours instead of the fixed interval:
+    only the pairs subscribers asked for are considered, closed markets are skipped until
+    they reopen and 24/7 feeds are polled faster.
+
+    Usage:
+        stream = PriceStream(sdk.price, interval=1)  # or scheduler=PollScheduler()
+        stream.start()
+        queue = stream.subscribe(pairs=[('BTC', 'USD')])
+        changes = await queue.get()
+        ...
+        await stream.stop()
+    """
+
+    def __init__(self, price: Price, interval=DEFAULT_STREAM_INTERVAL_SECONDS, queue_size=DEFAULT_SUBSCRIBER_QUEUE_SIZE,
+                 scheduler: Optional[PollScheduler] = None, verbose=False):
+        self.price = price
+        self.interval = interval
+        self.scheduler = scheduler
+        self.queue_size = queue_size
+        self.verbose = verbose
+
+        self._subscribers = {}  # queue -> set of (from, to) pairs, None for all pairs
+        self._last_timestamps = {}  # (from, to) -> timestampSeconds of the last pushed record
+        self._last_snapshot = None
+        self._task = None
+        self._wakeup = None
+
+        self.dropped = 0  # items discarded from full subscriber queues
+
+    def log(self, message):
+        if self.verbose:
+            print(message)
+
+    def subscribe(self, pairs: Optional[Iterable[Tuple[str, str]]] = None, maxsize=None) -> asyncio.Queue:
+        """
+        Registers a new subscriber queue, optionally limited to the given (from, to) pairs.
+        If the stream already has a snapshot, the queue is primed with the current prices.
+        """
+        queue = asyncio.Queue(maxsize=maxsize or self.queue_size)
+        wanted = set(pairs) if pairs is not None else None
+        self._subscribers[queue] = wanted
+
+        if self._last_snapshot is not None:
+            current = self._filter(self._last_snapshot.prices, wanted)
+            if current:
+                self._put(queue, current)
+
+        # The poller may be sleeping until a closed market reopens - re-plan for the new pairs
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.pop(queue, None)
+
+    async def updates(self, pairs: Optional[Iterable[Tuple[str, str]]] = None):
+        """Async iterator over changed price lists, unsubscribes when the consumer stops"""
+        queue = self.subscribe(pairs)
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            self.unsubscribe(queue)
+
+    def is_running(self):
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        """Starts the poller on the running event loop"""
+        if not self.is_running():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.stop()
+
+    async def _run(self):
+        self._wakeup = asyncio.Event()
+        while True:
+            try:
+                await self.poll_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.log(f"PriceStream: poll failed: {e}")
+
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.next_delay())
+            except asyncio.TimeoutError:
+                pass
+
+    def watched_pairs(self):
+        """Union of the pairs subscribers asked for, None when any of them wants every pair"""
+        if not self._subscribers:
+            return None
+        pairs = set()
+        for wanted in self._subscribers.values():
+            if wanted is None:
+                return None
+            pairs |= wanted
+        return pairs
+
+    def next_delay(self):
+        if self.scheduler is None:
+            return self.interval
+        return self.scheduler.next_delay(self._last_snapshot, self.watched_pairs())
+
+    async def poll_once(self):
+        """Fetches one snapshot and fans out the pairs whose timestampSeconds moved"""
+        # A snapshot fetched by someone else within half a poll interval is recent enough
+        snapshot = await self.price.get_snapshot(max_age_ms=self.next_delay() * 500)
+        if snapshot is self._last_snapshot:
+            return []
+
+        changed = []
+        for price_data in snapshot.prices:
+            key = (price_data.get('from'), price_data.get('to'))
+            timestamp = price_data.get('timestampSeconds')
+            if self._last_timestamps.get(key) != timestamp:
+                self._last_timestamps[key] = timestamp
+                changed.append(price_data)
+        self._last_snapshot = snapshot
+
+        if changed:
+            for queue, wanted in list(self._subscribers.items()):
+                items = self._filter(changed, wanted)
+                if items:
+                    self._put(queue, items)
+        return changed
+
+    @staticmethod
+    def _filter(prices, wanted):
+        if wanted is None:
+            return list(prices)
+        return [p for p in prices if (p.get('from'), p.get('to')) in wanted]
+
+    def _put(self, queue: asyncio.Queue, items):
+        # Drop-oldest backpressure: a slow consumer never blocks the poller
+        while queue.full():
+            try:
+                queue.get_nowait()
+                self.dropped += 1
+            except asyncio.QueueEmpty:
+                break
+        queue.put_nowait(items)
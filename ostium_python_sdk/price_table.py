@@ -0,0 +1,96 @@
+import numpy as np
+from typing import Iterable, Tuple
+
+from .price import Price, PriceSnapshot
+
+
+class PriceTable:
+    """
+    Columnar copy of the latest prices, indexed by Ostium pair id.
+
+    bid, mid, ask, timestamp and is_market_open are NumPy arrays where element i
+    holds the price of pair id i (NaN / 0 / False until a price was seen). Pairs are
+    mapped to price feeds with the `feed` field returned by SubgraphClient.get_pairs().
+
+    Once attached to a Price instance the arrays are refreshed in place on every
+    snapshot, so views taken from them stay valid and never need to be re-fetched:
+
+        table = await sdk.get_price_table()
+        mids = table.mid[pair_ids]  # one fancy-index for many positions
+    """
+
+    def __init__(self, verbose=False):
+        self.verbose = verbose
+        self._pair_ids = np.zeros(0, dtype=np.int64)
+        self._feed_ids = []
+        self._allocate(0)
+
+    def log(self, message):
+        if self.verbose:
+            print(message)
+
+    def _allocate(self, size):
+        self.bid = np.full(size, np.nan, dtype=np.float64)
+        self.mid = np.full(size, np.nan, dtype=np.float64)
+        self.ask = np.full(size, np.nan, dtype=np.float64)
+        self.timestamp = np.zeros(size, dtype=np.int64)
+        self.is_market_open = np.zeros(size, dtype=bool)
+
+    def set_pairs(self, pairs):
+        """Maps pair ids to feeds, pairs as returned from SubgraphClient.get_pairs()"""
+        mapping = {int(pair['id']): pair['feed'].lower()
+                   for pair in pairs if pair.get('feed')}
+
+        size = max(mapping) + 1 if mapping else 0
+        if size > len(self.mid):
+            # Only reallocate when new pairs were listed; views taken before that
+            # point stay on the old (no longer refreshed) arrays
+            self._allocate(size)
+
+        self._pair_ids = np.fromiter(mapping.keys(), dtype=np.int64, count=len(mapping))
+        self._feed_ids = list(mapping.values())
+        self.log(f"PriceTable: mapped {len(mapping)} pairs to feeds")
+
+    async def load_pairs(self, subgraph):
+        self.set_pairs(await subgraph.get_pairs())
+
+    def attach(self, price: Price):
+        """Refreshes the table on every snapshot fetched by price"""
+        price.add_snapshot_listener(self.update)
+        snapshot = price.get_cached_snapshot()
+        if snapshot is not None:
+            self.update(snapshot)
+
+    def detach(self, price: Price):
+        price.remove_snapshot_listener(self.update)
+
+    def update(self, snapshot: PriceSnapshot):
+        """Writes the snapshot's prices into the arrays in place"""
+        rows = []
+        bids, mids, asks, timestamps, market_open = [], [], [], [], []
+
+        for row, feed_id in enumerate(self._feed_ids):
+            price_data = snapshot.get_by_feed(feed_id)
+            if price_data is None:
+                continue
+            rows.append(row)
+            bids.append(price_data.get('bid', np.nan))
+            mids.append(price_data.get('mid', np.nan))
+            asks.append(price_data.get('ask', np.nan))
+            timestamps.append(price_data.get('timestampSeconds', 0))
+            market_open.append(price_data.get('isMarketOpen', False))
+
+        if not rows:
+            return
+
+        idx = self._pair_ids[rows]
+        self.bid[idx] = bids
+        self.mid[idx] = mids
+        self.ask[idx] = asks
+        self.timestamp[idx] = timestamps
+        self.is_market_open[idx] = market_open
+
+    def gather(self, pair_ids: Iterable[int]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Returns (bid, mid, ask) arrays for the given pair ids, e.g. one entry per open trade"""
+        idx = np.asarray(pair_ids, dtype=np.int64)
+        return self.bid[idx], self.mid[idx], self.ask[idx]
@@ -0,0 +1,164 @@
+import asyncio
+import concurrent.futures
+import threading
+import time
+
+from web3.exceptions import TimeExhausted, TransactionNotFound
+
+DEFAULT_POLL_INTERVAL_SECONDS = 0.25
+DEFAULT_RECEIPT_TIMEOUT_SECONDS = 120
+
+
+class PendingTransaction:
+    """
+    A sent transaction: its hash right away, its result once it's mined.
+
+    `await pending` (from any event loop) or `pending.result()` (blocking) gives
+    {'receipt': ..., 'order_id': ...} - the same as perform_trade / close_trade - and
+    raises TimeExhausted if it was never mined, TransactionRevertedError if it reverted.
+    """
+
+    __slots__ = ('tx_hash', '_future')
+
+    def __init__(self, tx_hash, future: concurrent.futures.Future):
+        self.tx_hash = tx_hash
+        self._future = future
+
+    def done(self):
+        return self._future.done()
+
+    def result(self, timeout=None):
+        return self._future.result(timeout)
+
+    def add_done_callback(self, fn):
+        """fn(future) runs on the watcher thread once the transaction is settled"""
+        self._future.add_done_callback(fn)
+
+    def __await__(self):
+        return asyncio.wrap_future(self._future).__await__()
+
+
+class _WatchedTransaction:
+    __slots__ = ('future', 'settle', 'dropped', 'deadline')
+
+    def __init__(self, future, settle, dropped, deadline):
+        self.future = future
+        self.settle = settle  # receipt -> result of the future
+        self.dropped = dropped  # called when the receipt never came
+        self.deadline = deadline
+
+
+class ReceiptWatcher:
+    """
+    Polls the receipts of sent transactions in the background and settles their futures.
+
+    watch() returns a concurrent.futures.Future right away, so submitting needs no wait for
+    the receipt and the caller decides when (and whether) to block on it. Every
+    poll_interval, each pending transaction's receipt is looked up on a daemon thread (a
+    blocking Web3, so the futures outlive the event loop that sent them); a transaction
+    still unmined after timeout seconds fails with TimeExhausted. The thread stops when
+    nothing is pending and starts again with the next watch().
+
+    Usage:
+        watcher = ReceiptWatcher(w3)
+        pending = PendingTransaction(tx_hash, watcher.watch(tx_hash))
+        receipt = await pending
+    """
+
+    def __init__(self, w3, poll_interval=DEFAULT_POLL_INTERVAL_SECONDS, timeout=DEFAULT_RECEIPT_TIMEOUT_SECONDS,
+                 verbose=False):
+        self.web3 = w3
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.verbose = verbose
+
+        self._pending = {}  # tx hash -> _WatchedTransaction
+        self._thread = None
+        self._lock = threading.Lock()
+
+        self.polls = 0
+
+    def log(self, message):
+        if self.verbose:
+            print(message)
+
+    def watch(self, tx_hash, settle=None, dropped=None) -> concurrent.futures.Future:
+        """Future of settle(receipt) (of the receipt itself without settle)"""
+        future = concurrent.futures.Future()
+        with self._lock:
+            self._pending[bytes(tx_hash)] = _WatchedTransaction(
+                future, settle, dropped, time.monotonic() + self.timeout)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="ostium-receipt-watcher", daemon=True)
+                self._thread.start()
+        return future
+
+    def pending_count(self):
+        return len(self._pending)
+
+    def _run(self):
+        while True:
+            time.sleep(self.poll_interval)
+            with self._lock:
+                if not self._pending:
+                    self._thread = None
+                    return
+            self.poll_once()
+
+    def poll_once(self):
+        """Looks up the receipt of every pending transaction, settles the mined and expired ones"""
+        with self._lock:
+            pending = list(self._pending.items())
+        self.polls += 1
+
+        for tx_hash, watched in pending:
+            try:
+                receipt = self.web3.eth.get_transaction_receipt(tx_hash)
+            except TransactionNotFound:
+                if time.monotonic() > watched.deadline:
+                    self._expire(tx_hash, watched)
+                continue
+            except Exception as e:
+                self.log(f"ReceiptWatcher: receipt lookup failed for {tx_hash.hex()}: {e}")
+                continue
+            self._settle(tx_hash, watched, receipt)
+
+    def _settle(self, tx_hash, watched, receipt):
+        with self._lock:
+            self._pending.pop(tx_hash, None)
+        try:
+            result = watched.settle(receipt) if watched.settle is not None else receipt
+        except Exception as e:
+            self._set(watched.future, exception=e)
+            return
+        self._set(watched.future, result=result)
+
+    @staticmethod
+    def _set(future, result=None, exception=None):
+        # close() may have cancelled the future while it was being settled
+        try:
+            if exception is not None:
+                future.set_exception(exception)
+            else:
+                future.set_result(result)
+        except concurrent.futures.InvalidStateError:
+            pass
+
+    def _expire(self, tx_hash, watched):
+        with self._lock:
+            self._pending.pop(tx_hash, None)
+        self.log(f"ReceiptWatcher: {tx_hash.hex()} not mined after {self.timeout}s")
+        if watched.dropped is not None:
+            watched.dropped()
+        self._set(watched.future, exception=TimeExhausted(
+            f"Transaction {tx_hash.hex()} is not in the chain after {self.timeout} seconds"))
+
+    def close(self):
+        """Stops watching, transactions still pending have their futures cancelled"""
+        with self._lock:
+            pending, self._pending = list(self._pending.values()), {}
+            thread = self._thread
+        for watched in pending:
+            watched.future.cancel()
+        if thread is not None:
+            thread.join()
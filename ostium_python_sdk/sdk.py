@@ -1,4 +1,5 @@
 from dotenv import load_dotenv
+import asyncio
 import os
 from decimal import Decimal, ROUND_DOWN
 
@@ -12,8 +13,18 @@ from .constants import CHAIN_ID_ARBITRUM_MAINNET, CHAIN_ID_ARBITRUM_TESTNET, PRE
 from ostium_python_sdk.faucet import Faucet
 from .balance import Balance
 from .price import Price
-from web3 import Web3
+from .http_pool import get_default_http_pool
+from .price_table import PriceTable
+from .pair_cache import PairDetailsCache
+from .onchain_reader import OnChainTradeReader
+from .order_tracker import OrderTracker
+from .nonce_manager import NonceManager
+from .allowance import AllowanceTracker
+from .gas import FeeOracle, GasProfileCache
+from .receipt_watcher import ReceiptWatcher
+from web3 import AsyncHTTPProvider, AsyncWeb3, Web3
 from .ostium import Ostium
+from .async_ostium import AsyncOstium
 from .config import NetworkConfig
 from typing import Union
 from .subgraph import SubgraphClient
@@ -64,6 +75,16 @@ class OstiumSDK:
             print(
                 f"network_config: {'TESTNET' if self.network_config.is_testnet else 'MAINNET'}")
 
+        # Nonces are allocated locally and shared by both clients, so their transactions never collide
+        self.nonces = NonceManager(verbose=self.verbose)
+        # So is the cached USDC allowance (and its top-up policy)
+        self.allowances = AllowanceTracker(verbose=self.verbose)
+        # Gas limits learned from receipts and EIP-1559 fees kept fresh in the background
+        self.gas_profiles = GasProfileCache(verbose=self.verbose)
+        self.fee_oracle = FeeOracle(self.w3, verbose=self.verbose)
+        # Receipts of transactions sent with submit_trade / submit_close_trade, polled in the background
+        self.receipt_watcher = ReceiptWatcher(self.w3, verbose=self.verbose)
+
         # Initialize Ostium instance
         self.ostium = Ostium(
             self.w3,
@@ -72,16 +93,52 @@ class OstiumSDK:
             self.network_config.contracts["trading"],
             private_key=self.private_key,
             verbose=self.verbose,
-            use_delegation=self.use_delegation
+            use_delegation=self.use_delegation,
+            nonce_manager=self.nonces,
+            allowance_tracker=self.allowances,
+            gas_profiles=self.gas_profiles,
+            fee_oracle=self.fee_oracle,
+            receipt_watcher=self.receipt_watcher
+        )
+        # Same client on AsyncWeb3: awaits receipts instead of blocking the event loop
+        self.async_w3 = AsyncWeb3(AsyncHTTPProvider(self.rpc_url))
+        self.async_ostium = AsyncOstium(
+            self.async_w3,
+            self.network_config.contracts["usdc"],
+            self.network_config.contracts["tradingStorage"],
+            self.network_config.contracts["trading"],
+            private_key=self.private_key,
+            verbose=self.verbose,
+            use_delegation=self.use_delegation,
+            nonce_manager=self.nonces,
+            allowance_tracker=self.allowances,
+            gas_profiles=self.gas_profiles,
+            fee_oracle=self.fee_oracle,
+            receipt_watcher=self.receipt_watcher
         )
 
-        # Initialize subgraph client
+        # One keep-alive HTTP pool shared by the subgraph and price clients
+        self.http = get_default_http_pool()
+
+        # Initialize subgraph client, open trades are read from tradingStorage while it lags - opt in by
+        # configuring the pairsInfo contract, which holds the funding and rollover of the trades
+        self.onchain_trades = None
+        if self.network_config.contracts.get("pairsInfo"):
+            self.onchain_trades = OnChainTradeReader(
+                self.w3, self.network_config.contracts["tradingStorage"],
+                self.network_config.contracts["pairsInfo"], verbose=self.verbose)
         self.subgraph = SubgraphClient(
-            url=self.network_config.graph_url, verbose=self.verbose)
+            urls=self.network_config.graph_urls, verbose=self.verbose, http=self.http,
+            fallback_reader=self.onchain_trades)
+        # Pair details shared by the leverage, funding and rollover helpers
+        self.pair_details = PairDetailsCache(self.subgraph, verbose=self.verbose)
+        # Polls every order being tracked with one subgraph request
+        self.order_tracker = OrderTracker(self.subgraph, http=self.http, verbose=self.verbose)
 
         self.balance = Balance(
             self.w3, self.network_config.contracts["usdc"], verbose=self.verbose)
-        self.price = Price(verbose=self.verbose)
+        self.price = Price(verbose=self.verbose, http=self.http)
+        self._price_table = None
 
         if self.network_config.is_testnet:
             self.faucet = Faucet(self.w3, self.private_key,
@@ -93,14 +150,57 @@ class OstiumSDK:
         if self.verbose:
             print(message)
 
-    async def get_open_trades(self, trader_address=None):
+    # Closes the pooled HTTP connections of the running event loop and stops the order tracker, call on shutdown
+    async def close(self):
+        await asyncio.get_running_loop().run_in_executor(None, self.order_tracker.close)
+        await asyncio.get_running_loop().run_in_executor(None, self.fee_oracle.close)
+        await asyncio.get_running_loop().run_in_executor(None, self.receipt_watcher.close)
+        await self.http.close()
+
+    # Returns how far the subgraph indexer is behind the chain head, e.g:
+    # {'chain_block': 271234567, 'indexed_block': 271234560, 'lag_blocks': 7}
+    async def get_indexer_lag(self):
+        loop = asyncio.get_running_loop()
+        indexed_block, chain_block = await asyncio.gather(
+            self.subgraph.get_indexed_block(),
+            loop.run_in_executor(None, self.ostium.get_block_number),
+        )
+        return {
+            'chain_block': chain_block,
+            'indexed_block': indexed_block,
+            'lag_blocks': max(chain_block - indexed_block, 0),
+        }
+
+    # Returns a PriceTable (NumPy arrays indexed by pair id) kept up to date by every price snapshot
+    async def get_price_table(self, refresh_pairs=False) -> PriceTable:
+        if self._price_table is None:
+            self._price_table = PriceTable(verbose=self.verbose)
+            refresh_pairs = True
+
+        if refresh_pairs:
+            await self._price_table.load_pairs(self.subgraph)
+            self._price_table.attach(self.price)
+            await self.price.get_snapshot()
+        return self._price_table
+
+    # trader_address may also be a list of addresses: open trades of all of them are then fetched
+    # in a few batched subgraph requests and returned grouped by address, e.g:
+    #   trades_by_address, addresses = await sdk.get_open_trades(['0xabc...', '0xdef...'])
+    # pair_ids narrows a single address' trades to those pairs (cheaper when read on-chain)
+    async def get_open_trades(self, trader_address=None, pair_ids=None):
+        if isinstance(trader_address, (list, tuple, set)):
+            trader_addresses = list(trader_address)
+            self.log(f"Fetching open trades of {len(trader_addresses)} traders")
+            open_trades = await self.subgraph.get_open_trades_for_traders(trader_addresses)
+            return open_trades, trader_addresses
+
         if trader_address is None:
             trader_public_address = self.ostium.get_public_address()
         else:
             trader_public_address = trader_address
 
         self.log(f"Trader public address: {trader_public_address}")
-        open_trades = await self.subgraph.get_open_trades(trader_public_address)
+        open_trades = await self.subgraph.get_open_trades(trader_public_address, pair_ids=pair_ids)
         return open_trades, trader_public_address
 
     # if SDK instantiated with a private key, this function will return a given open trade metrics,
@@ -108,41 +208,39 @@ class OstiumSDK:
     #
     # Will thorw in case SDK instantiated with no private key
     async def get_open_trade_metrics(self, pair_id, trade_index, trader_address=None):
-        open_trades, trader_public_address = await self.get_open_trades(trader_address)
+        trader_public_address = trader_address or self.ostium.get_public_address()
+
+        # The subgraph query (trade + liqMarginThresholdP + pair leverage limits), the price
+        # snapshot and the block number are independent: fetch them concurrently
+        loop = asyncio.get_running_loop()
+        inputs, _, block_number = await asyncio.gather(
+            self.subgraph.get_open_trade_metrics_inputs(trader_public_address, pair_id, trade_index),
+            self.price.get_snapshot(),
+            loop.run_in_executor(None, self.ostium.get_block_number),
+        )
 
-        liq_margin_threshold_p = await self.subgraph.get_liq_margin_threshold_p()
+        liq_margin_threshold_p = inputs['liq_margin_threshold_p']
         self.log(
             f"SDK: get_open_trade_metrics: {liq_margin_threshold_p}, will use it for liquidation price calculation - call to get_trade_metrics()")
 
-        trade_details = None
-
-        if len(open_trades) == 0:
-            raise ValueError(f"No Open Trades for {trader_public_address}")
-
-        for t in open_trades:
-            if int(t['pair']['id']) == int(pair_id) and int(t['index']) == int(trade_index):
-                trade_details = t
-                break
-
+        trade_details = inputs['trade']
         if trade_details is None:
             raise ValueError(
                 f"Trade not found for {trader_public_address} pair {pair_id} and index {trade_index}")
 
         self.log(f"\nTrade details: {trade_details}")
-        # get the price for this trade's asset/feed
+        # get the price for this trade's asset/feed (served from the snapshot fetched above)
         price_data = await self.price.get_latest_price_json(trade_details['pair']['from'], trade_details['pair']['to'])
         self.log(
             f"\nPrice data: {price_data} (contains bid, mid, ask prices among other things)")
-        # get the block number
-        block_number = self.ostium.get_block_number()
         self.log(f"\nBlock number: {block_number}")
 
-        pair_max_leverage = await self.get_pair_max_leverage(trade_details['pair']['id'])
+        pair_max_leverage = self._pair_max_leverage(inputs['pair'])
 
         return get_trade_metrics(trade_details, price_data, block_number, pair_max_leverage, liq_margin_threshold_p, verbose=self.verbose)
 
     async def get_target_funding_rate(self, pair_id):
-        pair_details = await self.subgraph.get_pair_details(pair_id)
+        pair_details = await self.pair_details.get(pair_id)
 
         hillInflectionPoint = Decimal(
             pair_details['hillInflectionPoint']) / PRECISION_18
@@ -176,7 +274,7 @@ class OstiumSDK:
 
     # max leverage for overnight trades (Stocks) - 100 means 100x, None if not set
     async def get_pair_overnight_max_leverage(self, pair_id):
-        obj = await self.subgraph.get_pair_details(pair_id)
+        obj = await self.pair_details.get_static(pair_id)
 
         maxLeverage = int(obj['overnightMaxLeverage'])/PRECISION_2 if int(
             obj['overnightMaxLeverage']) != 0 else None
@@ -184,8 +282,11 @@ class OstiumSDK:
 
     # either by group of pair or by pair id (e.g: maxLeverage 100 means 100x)
     async def get_pair_max_leverage(self, pair_id):
-        obj = await self.subgraph.get_pair_details(pair_id)
+        obj = await self.pair_details.get_static(pair_id)
+        return self._pair_max_leverage(obj)
 
+    @staticmethod
+    def _pair_max_leverage(obj):
         maxLeverage = int(obj['maxLeverage']) / PRECISION_2 if int(
             obj['group']['maxLeverage']) == 0 else int(obj['group']['maxLeverage']) / PRECISION_2
         return maxLeverage
@@ -195,7 +296,7 @@ class OstiumSDK:
             f"Old version of function. Use get_funding_rate_for_pair_id(pair_id, period_hours=24).")
 
     async def get_rollover_rate_for_pair_id(self, pair_id, period_hours=24):
-        pair_details = await self.subgraph.get_pair_details(pair_id)
+        pair_details = await self.pair_details.get(pair_id)
         rollover_fee_per_block = Decimal(
             pair_details['rolloverFeePerBlock']) / Decimal('1e18')
         rollover = calculate_fee_per_hours(
@@ -203,9 +304,9 @@ class OstiumSDK:
         return rollover
 
     async def get_funding_rate_for_pair_id(self, pair_id, period_hours=24):
-        pair_details = await self.subgraph.get_pair_details(pair_id)
         # get the block number
         block_number = self.ostium.get_block_number()
+        pair_details = await self.pair_details.get(pair_id, block_number=block_number)
 
         # Get current price
         last_trade_price = pair_details['lastTradePrice']
@@ -256,6 +357,11 @@ class OstiumSDK:
         pairs = await self.subgraph.get_pairs()
         formatted_pairs = []
 
+        if including_current_price_and_market_status:
+            # One snapshot for all pairs rather than a lookup (and fetch) per pair
+            prices = await self.price.get_prices(
+                [(pair['from'], pair['to']) for pair in pairs])
+
         for pair in pairs:
             formatted_pair = {
                 'id': int(pair['id']),
@@ -286,19 +392,15 @@ class OstiumSDK:
 
             if including_current_price_and_market_status:
                 # Get current price and market status
-                try:
-                    price, is_market_open, is_day_trading_closed = await self.price.get_price(
-                        pair['from'],
-                        pair['to']
-                    )
+                price_tuple = prices.get((pair['from'], pair['to']))
+                if price_tuple is not None:
+                    price, is_market_open, is_day_trading_closed = price_tuple
                     if price is not None:
                         formatted_pair['price'] = price
                     if is_market_open is not None:
                         formatted_pair['isMarketOpen'] = is_market_open
                     if is_day_trading_closed is not None:
                         formatted_pair['isDayTradingClosed'] = is_day_trading_closed
-                except ValueError:
-                    pass
 
             formatted_pairs.append(formatted_pair)
 
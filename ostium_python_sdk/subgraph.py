@@ -1,134 +1,724 @@
 from gql import gql
 
 from gql import Client
-from gql.transport.aiohttp import AIOHTTPTransport
+import asyncio
+import time
 from decimal import Decimal
+from typing import List, Optional
+
+from .exceptions import IndexerLagError
+from .http_pool import HttpPool
+from .subgraph_transport import MultiEndpointGraphQLTransport
+from .models import LimitRecord, OrderRecord, PairRecord, TradeRecord
+from .subgraph_schema import validate_document
+
+# The Graph's maximum page size (`first`)
+DEFAULT_PAGE_SIZE = 1000
+# Addresses per `trader_in` filter in the multi-trader queries
+DEFAULT_TRADERS_PER_QUERY = 100
+# Open trades are joined against pairs fetched at most this long ago
+DEFAULT_PAIRS_CACHE_TTL_SECONDS = 10
+# wait_for_indexed_block() checks the indexer head this often (Arbitrum makes ~4 blocks per second)
+DEFAULT_INDEX_POLL_INTERVAL_SECONDS = 0.25
+DEFAULT_INDEX_WAIT_TIMEOUT_SECONDS = 30
+# With a fallback reader, open trades are read on-chain while the indexer is further behind
+# than this (~10s of Arbitrum blocks); the lag is rechecked at most every interval
+DEFAULT_MAX_INDEXER_LAG_BLOCKS = 40
+DEFAULT_LAG_CHECK_INTERVAL_SECONDS = 5
+DEFAULT_LAG_CHECK_TIMEOUT_SECONDS = 2
+
+# GraphQL documents are parsed once, at import, rather than on every call
+
+PAIRS_QUERY = gql("""
+query getPairs($first: Int!, $last_id: ID!) {
+  pairs(first: $first, where: {id_gt: $last_id}, orderBy: id, orderDirection: asc) {
+    id
+    from
+    to
+    feed
+    overnightMaxLeverage
+    longOI
+    shortOI
+    maxOI
+    makerFeeP
+    takerFeeP
+    makerMaxLeverage
+    curFundingLong
+    curFundingShort
+    curRollover
+    totalOpenTrades
+    totalOpenLimitOrders
+    accRollover
+    lastRolloverBlock
+    rolloverFeePerBlock
+    accFundingLong
+    accFundingShort
+    lastFundingBlock
+    maxFundingFeePerBlock
+    lastFundingRate
+    hillInflectionPoint
+    hillPosScale
+    hillNegScale
+    springFactor
+    sFactorUpScaleP
+    sFactorDownScaleP
+    lastTradePrice
+    maxLeverage
+    spreadP
+    group {
+      id
+      name
+      minLeverage
+      maxLeverage
+      maxCollateralP
+      longCollateral
+      shortCollateral
+    }
+    fee {
+      minLevPos
+    }
+  }
+}
+""")
+
+PAIR_DETAILS_QUERY = gql("""
+query getPairDetails($pair_id: ID!) {
+  pair(id: $pair_id) {
+    id
+    from
+    to
+    overnightMaxLeverage
+    longOI
+    shortOI
+    maxOI
+    makerFeeP
+    takerFeeP
+    makerMaxLeverage
+    curFundingLong
+    curFundingShort
+    curRollover
+    totalOpenTrades
+    totalOpenLimitOrders
+    accRollover
+    lastRolloverBlock
+    rolloverFeePerBlock
+    accFundingLong
+    accFundingShort
+    lastFundingBlock
+    maxFundingFeePerBlock
+    lastFundingRate
+    hillInflectionPoint
+    hillPosScale
+    hillNegScale
+    springFactor
+    sFactorUpScaleP
+    sFactorDownScaleP
+    lastTradePrice
+    maxLeverage
+    group {
+      id
+      name
+      minLeverage
+      maxLeverage
+      maxCollateralP
+      longCollateral
+      shortCollateral
+    }
+    fee {
+      minLevPos
+    }
+  }
+}
+""")
+
+LIQ_MARGIN_THRESHOLD_QUERY = gql("""
+query metaDatas {
+  metaDatas {
+    liqMarginThresholdP
+  }
+}
+""")
+
+# Fields of an open trade, shared by the single- and multi-trader queries. Only the pair id
+# is selected: SubgraphClient joins the trades against its cached pairs (see get_pairs_by_id)
+OPEN_TRADE_FIELDS = """
+fragment OpenTradeFields on Trade {
+  id
+  tradeID
+  collateral
+  leverage
+  highestLeverage
+  openPrice
+  stopLossPrice
+  takeProfitPrice
+  isOpen
+  timestamp
+  isBuy
+  notional
+  tradeNotional
+  funding
+  rollover
+  trader
+  index
+  pair {
+    id
+  }
+}
+"""
+
+# Pair fields the trade metrics need (see formulae_wrapper.get_trade_metrics)
+OPEN_TRADE_PAIR_FIELDS = """
+fragment OpenTradePairFields on Pair {
+  id
+  feed
+  from
+  to
+  accRollover
+  lastRolloverBlock
+  rolloverFeePerBlock
+  accFundingLong
+  spreadP
+  accFundingShort
+  longOI
+  shortOI
+  maxOI
+  maxLeverage
+  hillInflectionPoint
+  hillPosScale
+  hillNegScale
+  springFactor
+  sFactorUpScaleP
+  sFactorDownScaleP
+  lastFundingBlock
+  maxFundingFeePerBlock
+  lastFundingRate
+}
+"""
+
+OPEN_TRADES_QUERY = gql("""
+query trades($trader: Bytes!, $first: Int!, $last_id: ID!) {
+  trades(
+    first: $first
+    where: {isOpen: true, trader: $trader, id_gt: $last_id}
+    orderBy: id
+    orderDirection: asc
+  ) {
+    ...OpenTradeFields
+  }
+}
+""" + OPEN_TRADE_FIELDS)
+
+OPEN_TRADES_BY_TRADERS_QUERY = gql("""
+query tradesByTraders($traders: [Bytes!]!, $first: Int!, $last_id: ID!) {
+  trades(
+    first: $first
+    where: {isOpen: true, trader_in: $traders, id_gt: $last_id}
+    orderBy: id
+    orderDirection: asc
+  ) {
+    ...OpenTradeFields
+  }
+}
+""" + OPEN_TRADE_FIELDS)
+
+# Everything get_open_trade_metrics needs from the subgraph, in one request
+OPEN_TRADE_METRICS_QUERY = gql("""
+query openTradeMetrics($trader: Bytes!, $pair_id: ID!, $index: BigInt!) {
+  trade: trades(
+    first: 1
+    where: {isOpen: true, trader: $trader, index: $index, pair_: {id: $pair_id}}
+  ) {
+    ...OpenTradeFields
+  }
+  meta: metaDatas {
+    liqMarginThresholdP
+  }
+  pairLimits: pair(id: $pair_id) {
+    ...OpenTradePairFields
+    group {
+      maxLeverage
+    }
+  }
+}
+""" + OPEN_TRADE_FIELDS + OPEN_TRADE_PAIR_FIELDS)
+
+ORDERS_QUERY = gql("""
+query orders($trader: Bytes!, $first: Int!, $last_id: ID!) {
+  limits(
+    first: $first
+    where: {trader: $trader, isActive: true, id_gt: $last_id}
+    orderBy: id
+    orderDirection: asc
+  ) {
+    collateral
+    leverage
+    isBuy
+    isActive
+    id
+    openPrice
+    takeProfitPrice
+    stopLossPrice
+    trader
+    initiatedAt
+    limitType
+    pair {
+      id
+      feed
+      from
+      to
+      accRollover
+      lastRolloverBlock
+      rolloverFeePerBlock
+      accFundingLong
+      spreadP
+      accFundingShort
+      longOI
+      shortOI
+      lastFundingBlock
+      maxFundingFeePerBlock
+      lastFundingRate
+    }
+  }
+}
+""")
+
+# Fields of an executed or cancelled order, shared by the history queries
+ORDER_HISTORY_FIELDS = """
+fragment OrderHistoryFields on Order {
+  id
+  isBuy
+  trader
+  notional
+  tradeNotional
+  collateral
+  leverage
+  orderType
+  orderAction
+  price
+  initiatedAt
+  executedAt
+  executedTx
+  isCancelled
+  cancelReason
+  profitPercent
+  totalProfitPercent
+  isPending
+  amountSentToTrader
+  rolloverFee
+  fundingFee
+  pair {
+    id
+    from
+    to
+    feed
+    longOI
+    shortOI
+    group {
+      name
+    }
+  }
+}
+"""
+
+RECENT_HISTORY_QUERY = gql("""
+query ListOrdersHistory($trader: Bytes, $last_n_orders: Int) {
+  orders(
+    where: {trader: $trader, isPending: false}
+    first: $last_n_orders
+    orderBy: executedAt
+    orderDirection: desc
+  ) {
+    ...OrderHistoryFields
+  }
+}
+""" + ORDER_HISTORY_FIELDS)
+
+HISTORY_PAGE_QUERY = gql("""
+query ordersHistoryPage($trader: Bytes!, $first: Int!, $last_id: ID!) {
+  orders(
+    first: $first
+    where: {trader: $trader, isPending: false, id_gt: $last_id}
+    orderBy: id
+    orderDirection: asc
+  ) {
+    ...OrderHistoryFields
+  }
+}
+""" + ORDER_HISTORY_FIELDS)
+
+# Orders executed after the (executedAt, id) cursor, oldest first. The subgraph breaks
+# executedAt ties by id, so the cursor never skips or repeats orders of the same second
+HISTORY_SINCE_QUERY = gql("""
+query ordersHistorySince($trader: Bytes!, $first: Int!, $executed_at: BigInt!, $last_id: ID!) {
+  orders(
+    first: $first
+    where: {or: [
+      {trader: $trader, isPending: false, executedAt_gt: $executed_at},
+      {trader: $trader, isPending: false, executedAt: $executed_at, id_gt: $last_id}
+    ]}
+    orderBy: executedAt
+    orderDirection: asc
+  ) {
+    ...OrderHistoryFields
+  }
+}
+""" + ORDER_HISTORY_FIELDS)
+
+# Latest block the subgraph has indexed
+INDEXED_BLOCK_QUERY = gql("""
+query indexedBlock {
+  _meta {
+    block {
+      number
+    }
+  }
+}
+""")
+
+# Every field of an order / trade, as returned by the tracking queries
+TRACKED_ORDER_FIELDS = """
+fragment TrackedOrderFields on Order {
+  id
+  trader
+  pair {
+    id
+    from
+    to
+    feed
+  }
+  tradeID
+  limitID
+  orderType
+  orderAction
+  price
+  priceAfterImpact
+  priceImpactP
+  collateral
+  notional
+  tradeNotional
+  profitPercent
+  totalProfitPercent
+  amountSentToTrader
+  isBuy
+  initiatedAt
+  executedAt
+  initiatedTx
+  executedTx
+  initiatedBlock
+  executedBlock
+  leverage
+  isPending
+  isCancelled
+  cancelReason
+  devFee
+  vaultFee
+  oracleFee
+  liquidationFee
+  fundingFee
+  rolloverFee
+  closePercent
+}
+"""
+
+TRACKED_TRADE_FIELDS = """
+fragment TrackedTradeFields on Trade {
+  id
+  trader
+  pair {
+    id
+    from
+    to
+    feed
+  }
+  index
+  tradeID
+  tradeType
+  openPrice
+  closePrice
+  takeProfitPrice
+  stopLossPrice
+  collateral
+  notional
+  tradeNotional
+  highestLeverage
+  leverage
+  isBuy
+  isOpen
+  closeInitiated
+  funding
+  rollover
+  timestamp
+}
+"""
+
+ORDER_BY_ID_QUERY = gql("""
+query GetOrder($order_id: ID!) {
+  orders(where: {id: $order_id}) {
+    ...TrackedOrderFields
+  }
+  _meta {
+    block {
+      number
+    }
+  }
+}
+""" + TRACKED_ORDER_FIELDS)
+
+TRADE_BY_ID_QUERY = gql("""
+query GetTrade($trade_id: ID!) {
+  trades(where: {id: $trade_id}) {
+    ...TrackedTradeFields
+  }
+  _meta {
+    block {
+      number
+    }
+  }
+}
+""" + TRACKED_TRADE_FIELDS)
+
+# Orders and the trades they opened or closed, in a single request (see OrderTracker)
+ORDERS_AND_TRADES_QUERY = gql("""
+query GetOrdersAndTrades($order_ids: [ID!]!, $trade_ids: [ID!]!, $first: Int!) {
+  orders(first: $first, where: {id_in: $order_ids}) {
+    ...TrackedOrderFields
+  }
+  trades(first: $first, where: {id_in: $trade_ids}) {
+    ...TrackedTradeFields
+  }
+  _meta {
+    block {
+      number
+    }
+  }
+}
+""" + TRACKED_ORDER_FIELDS + TRACKED_TRADE_FIELDS)
 
 
 class SubgraphClient:
-    def __init__(self, url: str = None, verbose=False) -> None:
+    def __init__(self, url: str = None, verbose=False, http: Optional[HttpPool] = None,
+                 pairs_ttl=DEFAULT_PAIRS_CACHE_TTL_SECONDS, urls: Optional[List[str]] = None,
+                 hedge=True, fallback_reader=None, max_lag_blocks=DEFAULT_MAX_INDEXER_LAG_BLOCKS,
+                 lag_check_interval=DEFAULT_LAG_CHECK_INTERVAL_SECONDS) -> None:
         self.verbose = verbose
-        transport = AIOHTTPTransport(url=url)
-        self.client = Client(transport=transport,
-                             fetch_schema_from_transport=True)
+        self.pairs_ttl = pairs_ttl
+        # Queries go through the SDK's shared keep-alive HTTP pool, retried (and, with several
+        # endpoints, hedged) across url and the fallback urls
+        self.transport = MultiEndpointGraphQLTransport(
+            list(dict.fromkeys(([url] if url else []) + list(urls or []))),
+            http=http, hedge=hedge, verbose=verbose)
+        # Documents are validated locally against the query whitelist (subgraph_schema.py),
+        # so there is no introspection round trip on startup
+        self.client = Client(transport=self.transport)
+        self._validated_documents = set()
+
+        # Latest block number the subgraph reported (from any response selecting _meta)
+        self.indexed_block = None
+
+        # Optional OnChainTradeReader serving get_open_trades() while the indexer lags
+        self.fallback_reader = fallback_reader
+        self.max_lag_blocks = max_lag_blocks
+        self.lag_check_interval = lag_check_interval
+        self.lag_blocks = None  # at the last check, None when it couldn't be measured
+        self._lagging = False
+        self._lag_checked_at = None
+        self._lag_inflight = None
+        self.onchain_reads = 0
+
+        self._pairs_by_id = None
+        self._pairs_fetched_at = None  # time.monotonic() when the pairs were requested
+        self._pairs_inflight = None
 
     def log(self, message):
         if self.verbose:
             print(message)
 
+    async def _execute(self, document, variable_values=None):
+        # Validate each document once, on first use, instead of on every execution
+        if id(document) not in self._validated_documents:
+            validate_document(document)
+            self._validated_documents.add(id(document))
+        result = await self.client.execute_async(document, variable_values=variable_values)
+
+        meta = result.get('_meta') if result else None
+        if meta and meta.get('block'):
+            self.indexed_block = max(self.indexed_block or 0, meta['block']['number'])
+        return result
+
+    async def get_indexed_block(self):
+        """Number of the latest block the subgraph has indexed"""
+        await self._execute(INDEXED_BLOCK_QUERY)
+        return self.indexed_block
+
+    async def wait_for_indexed_block(self, block_number, timeout=DEFAULT_INDEX_WAIT_TIMEOUT_SECONDS,
+                                     poll_interval=DEFAULT_INDEX_POLL_INTERVAL_SECONDS):
+        """
+        Waits until the subgraph has indexed block_number (e.g. a transaction receipt's block),
+        so a following read sees that block's writes. Returns the indexed block number,
+        raises IndexerLagError after timeout seconds.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            if self.indexed_block is not None and self.indexed_block >= block_number:
+                return self.indexed_block
+            indexed_block = await self.get_indexed_block()
+            if indexed_block is not None and indexed_block >= block_number:
+                return indexed_block
+            if time.monotonic() >= deadline:
+                raise IndexerLagError(
+                    f"Subgraph is at block {indexed_block}, block {block_number} not indexed after {timeout}s")
+            await asyncio.sleep(poll_interval)
+
+    async def is_lagging(self):
+        """
+        Whether the indexer is more than max_lag_blocks behind the chain head (as seen by the
+        fallback reader's RPC), or doesn't answer within a couple of seconds. Checked at most every
+        lag_check_interval seconds, concurrent checks share one round trip.
+        """
+        if self.fallback_reader is None:
+            return False
+        if (self._lag_checked_at is not None
+                and time.monotonic() - self._lag_checked_at < self.lag_check_interval):
+            return self._lagging
+
+        loop = asyncio.get_running_loop()
+        inflight = self._lag_inflight
+        # A task can only be awaited from the loop it was created on
+        if inflight is None or inflight.done() or inflight.get_loop() is not loop:
+            inflight = loop.create_task(self._check_lag())
+            self._lag_inflight = inflight
+        # shield: a cancelled caller must not cancel the check other callers wait on
+        return await asyncio.shield(inflight)
+
+    async def _check_lag(self):
+        checked_at = time.monotonic()
+        loop = asyncio.get_running_loop()
+        indexed_block, chain_block = await asyncio.gather(
+            asyncio.wait_for(self.get_indexed_block(), DEFAULT_LAG_CHECK_TIMEOUT_SECONDS),
+            loop.run_in_executor(None, self.fallback_reader.get_block_number),
+            return_exceptions=True)
+
+        if isinstance(chain_block, BaseException):
+            # Without the chain head the on-chain path wouldn't work either
+            self.log(f"Chain head unavailable ({chain_block}), keeping subgraph reads")
+            self.lag_blocks, lagging = None, False
+        elif isinstance(indexed_block, BaseException) or indexed_block is None:
+            self.log(f"Subgraph indexed block unavailable ({indexed_block}), reading open trades on-chain")
+            self.lag_blocks, lagging = None, True
+        else:
+            self.lag_blocks = max(chain_block - indexed_block, 0)
+            lagging = self.lag_blocks > self.max_lag_blocks
+            if lagging:
+                self.log(f"Subgraph is {self.lag_blocks} blocks behind, reading open trades on-chain")
+        self._lagging = lagging
+        self._lag_checked_at = checked_at
+        return lagging
+
+    async def _paginate_pages(self, document, field, record, variable_values=None, page_size=DEFAULT_PAGE_SIZE):
+        # Keyset pagination: each page asks for ids greater than the last one seen, so
+        # deep pages cost the same as the first one (unlike `skip`) and records are
+        # yielded as each page arrives instead of being collected in memory
+        variables = dict(variable_values or {}, first=page_size, last_id="")
+        while True:
+            page = (await self._execute(document, variable_values=variables))[field]
+            if page:
+                yield record.from_list(page)
+            if len(page) < page_size:
+                return
+            variables['last_id'] = page[-1]['id']
+
+    async def _paginate(self, document, field, record, variable_values=None, page_size=DEFAULT_PAGE_SIZE):
+        async for page in self._paginate_pages(document, field, record, variable_values, page_size):
+            for record in page:
+                yield record
+
+    def iter_pairs(self, page_size=DEFAULT_PAGE_SIZE):
+        """Async iterator over every pair, fetched page_size at a time"""
+        return self._paginate(PAIRS_QUERY, 'pairs', PairRecord, page_size=page_size)
+
+    async def get_pairs_by_id(self, max_age=None):
+        """Every pair keyed by id, refetched when older than max_age seconds (default pairs_ttl)"""
+        max_age = self.pairs_ttl if max_age is None else max_age
+        if (self._pairs_by_id is not None and max_age > 0
+                and time.monotonic() - self._pairs_fetched_at < max_age):
+            return self._pairs_by_id
+
+        loop = asyncio.get_running_loop()
+        inflight = self._pairs_inflight
+        # A task can only be awaited from the loop it was created on
+        if inflight is None or inflight.done() or inflight.get_loop() is not loop:
+            inflight = loop.create_task(self._fetch_pairs_by_id())
+            self._pairs_inflight = inflight
+        # shield: a cancelled caller must not cancel the fetch other callers wait on
+        return await asyncio.shield(inflight)
+
+    async def get_cached_pairs_by_id(self):
+        """
+        The cached pairs whatever their age, fetched only when nothing was ever cached. Pairs
+        rarely change: paths that must not wait on a lagging or unreachable subgraph (exit
+        signals, on-chain reads) use these.
+        """
+        if self._pairs_by_id is not None:
+            return self._pairs_by_id
+        return await self.get_pairs_by_id()
+
+    async def _fetch_pairs_by_id(self):
+        requested_at = time.monotonic()
+        pairs = [pair async for pair in self.iter_pairs()]
+        self._pairs_by_id = {pair['id']: pair for pair in pairs}
+        self._pairs_fetched_at = requested_at
+        return self._pairs_by_id
+
+    async def _join_pairs(self, trades):
+        # Trades only carry the pair id, attach the cached pair (one shared record per pair)
+        trades = list(trades)
+        pairs = await self.get_pairs_by_id()
+        if any(trade['pair']['id'] not in pairs for trade in trades):
+            pairs = await self.get_pairs_by_id(max_age=0)  # a pair listed since the last refresh
+        for trade in trades:
+            trade['pair'] = pairs.get(trade['pair']['id'], trade['pair'])
+        return trades
+
+    async def _paginate_trades(self, document, variable_values, page_size):
+        async for page in self._paginate_pages(document, 'trades', TradeRecord, variable_values, page_size):
+            for trade in await self._join_pairs(page):
+                yield trade
+
+    def iter_open_trades(self, address, page_size=DEFAULT_PAGE_SIZE):
+        """Async iterator over the open trades of an address, in id order"""
+        return self._paginate_trades(OPEN_TRADES_QUERY, {"trader": address}, page_size)
+
+    async def iter_open_trades_for_traders(self, addresses, page_size=DEFAULT_PAGE_SIZE,
+                                           traders_per_query=DEFAULT_TRADERS_PER_QUERY):
+        """Async iterator over the open trades of all the given addresses, traders_per_query addresses per filter"""
+        # Subgraph stores Bytes lowercased
+        traders = list(dict.fromkeys(address.lower() for address in addresses))
+        for start in range(0, len(traders), traders_per_query):
+            chunk = traders[start:start + traders_per_query]
+            async for trade in self._paginate_trades(OPEN_TRADES_BY_TRADERS_QUERY, {"traders": chunk}, page_size):
+                yield trade
+
+    def iter_orders(self, trader, page_size=DEFAULT_PAGE_SIZE):
+        """Async iterator over the active limit orders of a trader, in id order"""
+        return self._paginate(ORDERS_QUERY, 'limits', LimitRecord, {"trader": trader}, page_size)
+
+    def iter_history(self, trader, page_size=DEFAULT_PAGE_SIZE):
+        """
+        Async iterator over the whole (executed or cancelled) order history of a trader,
+        in id order. Memory use stays constant however long the history is, e.g:
+
+            async for order in subgraph.iter_history(address):
+                ...
+        """
+        return self._paginate(HISTORY_PAGE_QUERY, 'orders', OrderRecord, {"trader": trader}, page_size)
+
     async def get_pairs(self):
         self.log("Fetching available pairs")
-        query = gql(
-            """
-          query getPairs {
-              pairs(first: 1000) {
-                id
-                from
-                to    
-                feed
-                overnightMaxLeverage                
-                longOI
-                shortOI
-                maxOI
-                makerFeeP
-                takerFeeP
-                makerMaxLeverage    
-                curFundingLong  
-                curFundingShort
-                curRollover
-                totalOpenTrades
-                totalOpenLimitOrders
-                accRollover
-                lastRolloverBlock
-                rolloverFeePerBlock
-                accFundingLong
-                accFundingShort
-                lastFundingBlock
-                maxFundingFeePerBlock
-                lastFundingRate              
-                hillInflectionPoint
-                hillPosScale
-                hillNegScale
-                springFactor
-                sFactorUpScaleP
-                sFactorDownScaleP
-                lastTradePrice
-                maxLeverage              
-                group {
-                  id
-                  name
-                  minLeverage
-                  maxLeverage
-                  maxCollateralP
-                  longCollateral
-                  shortCollateral
-                }
-                fee {
-                  minLevPos                
-                }
-              }
-            }
-      """
-        )
-
-        # Execute the query on the transport
-        result = await self.client.execute_async(query)
-
-        return result['pairs']
+
+        return [pair async for pair in self.iter_pairs()]
 
     async def get_pair_details(self, pair_id):
-        query = gql(
-            """
-          query getPairDetails($pair_id: ID!){
-            pair(id: $pair_id) {
-              id
-              from
-              to    
-              overnightMaxLeverage                
-              longOI
-              shortOI
-              maxOI
-              makerFeeP
-              takerFeeP
-              makerMaxLeverage    
-              curFundingLong  
-              curFundingShort
-              curRollover
-              totalOpenTrades
-              totalOpenLimitOrders
-              accRollover
-              lastRolloverBlock
-              rolloverFeePerBlock
-              accFundingLong
-              accFundingShort
-              lastFundingBlock
-              maxFundingFeePerBlock
-              lastFundingRate              
-              hillInflectionPoint
-              hillPosScale
-              hillNegScale
-              springFactor
-              sFactorUpScaleP
-              sFactorDownScaleP
-              lastTradePrice
-              maxLeverage              
-              group {
-                id
-                name
-                minLeverage
-                maxLeverage
-                maxCollateralP
-                longCollateral
-                shortCollateral
-              }
-              fee {
-                minLevPos                
-              }
-          }
-          }
-          """
-        )
-        result = await self.client.execute_async(query, variable_values={"pair_id": str(pair_id)})
+        result = await self._execute(PAIR_DETAILS_QUERY, variable_values={"pair_id": str(pair_id)})
 
         # Convert Decimal fields to float or str
         if result and 'pair' in result:
@@ -136,21 +726,12 @@ class SubgraphClient:
             for key, value in pair.items():
                 if isinstance(value, Decimal):
                     pair[key] = float(value)  # or str(value) if you prefer
-            return pair
+            return PairRecord.from_dict(pair)
         else:
             raise ValueError(f"No pair details found for pair ID: {pair_id}")
 
     async def get_liq_margin_threshold_p(self):
-        query = gql(
-            """
-          query metaDatas {
-            metaDatas {              
-              liqMarginThresholdP
-            }
-          }
-          """
-        )
-        result = await self.client.execute_async(query)
+        result = await self._execute(LIQ_MARGIN_THRESHOLD_QUERY)
 
         liq_margin_threshold_p = result['metaDatas'][0]['liqMarginThresholdP']
 
@@ -160,257 +741,134 @@ class SubgraphClient:
 
         return liq_margin_threshold_p
 
-    async def get_open_trades(self, address):
+    async def get_open_trades(self, address, pair_ids=None):
+        """
+        Open trades of an address, optionally only in the given pairs. While the indexer lags
+        (see is_lagging) they are read from the tradingStorage contract by the fallback reader.
+        """
         # self.log(f"Fetching open trades for address: {address}")
-        query = gql(
-            """
-          query trades($trader: Bytes!) {
-        trades(        
-          where: { isOpen: true, trader: $trader }
-        ) {
-          tradeID
-          collateral
-          leverage
-          highestLeverage
-          openPrice
-          stopLossPrice
-          takeProfitPrice
-          isOpen
-          timestamp
-          isBuy
-          notional
-          tradeNotional
-          funding
-          rollover
-          trader
-          index
-          pair {
-            id
-            feed
-            from
-            to
-            accRollover
-            lastRolloverBlock
-            rolloverFeePerBlock
-            accFundingLong
-            spreadP
-            accFundingShort
-            longOI
-            shortOI
-            maxOI
-            maxLeverage
-            hillInflectionPoint
-            hillPosScale
-            hillNegScale
-            springFactor
-            sFactorUpScaleP
-            sFactorDownScaleP
-            lastFundingBlock
-            maxFundingFeePerBlock
-            lastFundingRate
-            maxLeverage
-          }
+        if await self.is_lagging():
+            return await self._get_open_trades_onchain(address, pair_ids)
+        trades = [trade async for trade in self.iter_open_trades(address)]
+        if pair_ids is not None:
+            pair_ids = {str(pair_id) for pair_id in pair_ids}
+            trades = [trade for trade in trades if trade['pair']['id'] in pair_ids]
+        return trades
+
+    async def _get_open_trades_onchain(self, address, pair_ids=None):
+        # During an incident the cached pairs are good enough to join against
+        pairs = await self.get_cached_pairs_by_id()
+        if pair_ids is None:
+            pair_ids = pairs.keys()
+        self.onchain_reads += 1
+        trades = await self.fallback_reader.get_open_trades(address, pair_ids)
+        for trade in trades:
+            trade['pair'] = pairs.get(trade['pair']['id'], trade['pair'])
+        return trades
+
+    async def iter_history_since(self, trader, executed_at=0, last_id="", page_size=DEFAULT_PAGE_SIZE):
+        """
+        Async iterator over the orders of a trader executed after the (executedAt, id) cursor,
+        oldest first - pass the last order seen to only pull newer ones
+        """
+        variables = {"trader": trader.lower(), "first": page_size,
+                     "executed_at": str(executed_at), "last_id": last_id}
+        while True:
+            page = OrderRecord.from_list(
+                (await self._execute(HISTORY_SINCE_QUERY, variable_values=variables))['orders'])
+            for order in page:
+                yield order
+            if len(page) < page_size:
+                return
+            variables['executed_at'] = str(page[-1]['executedAt'])
+            variables['last_id'] = page[-1]['id']
+
+    async def get_open_trades_for_traders(self, addresses):
+        """
+        Open trades of many addresses in a handful of requests instead of one per address.
+        Returns a dict keyed by the given addresses, e.g:
+            {'0xAbC...': [trade, ...], '0xdef...': []}
+        """
+        by_trader = {address.lower(): [] for address in addresses}
+        async for trade in self.iter_open_trades_for_traders(addresses):
+            by_trader.setdefault(trade['trader'].lower(), []).append(trade)
+        return {address: by_trader[address.lower()] for address in addresses}
+
+    async def get_open_trade_metrics_inputs(self, trader, pair_id, trade_index):
+        """
+        The open trade, liqMarginThresholdP and pair leverage limits in a single request, e.g:
+            {'trade': {...} or None, 'liq_margin_threshold_p': '...', 'pair': {'id': '0', 'maxLeverage': ..., 'group': {...}}}
+        """
+        result = await self._execute(OPEN_TRADE_METRICS_QUERY, variable_values={
+            "trader": trader.lower(), "pair_id": str(pair_id), "index": str(trade_index)})
+
+        pair = PairRecord.from_dict(result['pairLimits'])
+        trade = TradeRecord.from_dict(result['trade'][0]) if result['trade'] else None
+        if trade is not None:
+            # Pair data fetched with the trade, fresher than the cached pairs
+            trade['pair'] = pair
+        return {
+            'trade': trade,
+            'liq_margin_threshold_p': result['meta'][0]['liqMarginThresholdP'],
+            'pair': pair,
         }
-      }
-          """
-        )
-        result = await self.client.execute_async(query, variable_values={"trader": address})
-        return result['trades']
 
     async def get_orders(self, trader):
-        query = gql(
-            """
-          query orders($trader: Bytes!) {
-            limits(
-              where: { trader: $trader, isActive: true }
-              orderBy: initiatedAt
-              orderDirection: asc
-            ) {
-              collateral
-              leverage
-              isBuy
-              isActive
-              id
-              openPrice
-              takeProfitPrice
-              stopLossPrice
-              trader
-              initiatedAt
-              limitType
-              pair {
-                id
-                feed
-                from
-                to
-                accRollover
-                lastRolloverBlock
-                rolloverFeePerBlock
-                accFundingLong
-                spreadP
-                accFundingShort
-                longOI
-                shortOI
-                lastFundingBlock
-                maxFundingFeePerBlock
-                lastFundingRate
-              }
-            }
-          }
-          """
-        )
-        result = await self.client.execute_async(query, variable_values={"trader": trader})
-
-        return result['limits']
+        orders = [order async for order in self.iter_orders(trader)]
+        # Pages come in id order, callers expect the oldest order first
+        orders.sort(key=lambda order: order.initiatedAt)
+        return orders
 
     async def get_recent_history(self, trader, last_n_orders=10):
-        query = gql(
-            """
-        query ListOrdersHistory($trader: Bytes, $last_n_orders: Int) {
-          orders(
-            where: { trader: $trader, isPending: false}
-            first: $last_n_orders
-            orderBy: executedAt
-            orderDirection: desc
-          ) {
-            id
-            isBuy
-            trader
-            notional
-            tradeNotional
-            collateral
-            leverage
-            orderType
-            orderAction
-            price
-            initiatedAt
-            executedAt
-            executedTx
-            isCancelled
-            cancelReason
-            profitPercent
-            totalProfitPercent
-            isPending
-            amountSentToTrader
-            rolloverFee
-            fundingFee
-            pair {
-              id
-              from
-              to
-              feed
-              longOI
-              shortOI
-              group {
-                  name
-              }
-            }
-          }
-        }
-        """
-        )
-        result = await self.client.execute_async(query, variable_values={"trader": trader, "last_n_orders": last_n_orders})
+        result = await self._execute(RECENT_HISTORY_QUERY, variable_values={"trader": trader, "last_n_orders": last_n_orders})
 
-        return list(reversed(result['orders']))  # Reverse the final list
+        return OrderRecord.from_list(reversed(result['orders']))  # Reverse the final list
 
     async def get_order_by_id(self, order_id):
         """
         Get an order by its ID
         """
-        query = gql(
-            """
-            query GetOrder($order_id: ID!) {
-              orders(where: {id: $order_id}) {
-                id
-                trader
-                pair {
-                  id
-                  from
-                  to
-                  feed
-                }
-                tradeID
-                limitID
-                orderType
-                orderAction
-                price
-                priceAfterImpact
-                priceImpactP
-                collateral
-                notional
-                tradeNotional
-                profitPercent
-                totalProfitPercent
-                amountSentToTrader
-                isBuy
-                initiatedAt
-                executedAt
-                initiatedTx
-                executedTx
-                initiatedBlock
-                executedBlock
-                leverage
-                isPending
-                isCancelled
-                cancelReason
-                devFee
-                vaultFee
-                oracleFee
-                liquidationFee
-                fundingFee
-                rolloverFee
-                closePercent
-              }
-            }
-            """
-        )
-
-        result = await self.client.execute_async(query, variable_values={"order_id": str(order_id)})
+
+        result = await self._execute(ORDER_BY_ID_QUERY, variable_values={"order_id": str(order_id)})
 
         if result and 'orders' in result and len(result['orders']) > 0:
-            return result['orders'][0]
+            return OrderRecord.from_dict(result['orders'][0])
         return None
 
     async def get_trade_by_id(self, trade_id):
         """
         Get a trade by its ID
         """
-        query = gql(
-            """
-            query GetTrade($trade_id: ID!) {
-              trades(where: {id: $trade_id}) {
-                id
-                trader
-                pair {
-                  id
-                  from
-                  to
-                  feed
-                }
-                index
-                tradeID
-                tradeType
-                openPrice
-                closePrice
-                takeProfitPrice
-                stopLossPrice
-                collateral
-                notional
-                tradeNotional
-                highestLeverage
-                leverage
-                isBuy
-                isOpen
-                closeInitiated
-                funding
-                rollover
-                timestamp
-              }
-            }
-            """
-        )
-
-        result = await self.client.execute_async(query, variable_values={"trade_id": str(trade_id)})
+
+        result = await self._execute(TRADE_BY_ID_QUERY, variable_values={"trade_id": str(trade_id)})
 
         if result and 'trades' in result and len(result['trades']) > 0:
-            return result['trades'][0]
+            return TradeRecord.from_dict(result['trades'][0])
         return None
+
+    async def get_orders_and_trades(self, order_ids, trade_ids=()):
+        """
+        Orders and trades by id in one request, each as a dict keyed by id, e.g:
+        orders, trades = await subgraph.get_orders_and_trades(['123', '124'], ['45'])
+
+        The trade of a settled order whose tradeID wasn't in trade_ids is fetched with a
+        second request, so every settled order comes back with its trade when it has one.
+        """
+        orders, trades = await self._get_orders_and_trades(order_ids, trade_ids)
+        missing = {str(order['tradeID']) for order in orders.values()
+                   if not order.get('isPending', True) and order.get('tradeID')} - set(trades)
+        missing -= {str(trade_id) for trade_id in trade_ids}
+        if missing:
+            _, more_trades = await self._get_orders_and_trades([], missing)
+            trades.update(more_trades)
+        return orders, trades
+
+    async def _get_orders_and_trades(self, order_ids, trade_ids):
+        result = await self._execute(ORDERS_AND_TRADES_QUERY, variable_values={
+            "order_ids": [str(order_id) for order_id in order_ids],
+            "trade_ids": [str(trade_id) for trade_id in trade_ids],
+            "first": DEFAULT_PAGE_SIZE,
+        })
+        orders = {order['id']: order for order in OrderRecord.from_list(result.get('orders') or [])}
+        trades = {trade['id']: trade for trade in TradeRecord.from_list(result.get('trades') or [])}
+        return orders, trades
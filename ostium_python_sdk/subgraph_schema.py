@@ -0,0 +1,254 @@
+"""
+Local whitelist of the subgraph fields the SDK queries, used to validate its GraphQL
+documents without introspecting the subgraph on the first query.
+
+QUERY_WHITELIST_SDL is hand-written, not generated from the subgraph: it declares only
+the entities, fields, filters and arguments subgraph.py uses, with the types they have
+in the deployed subgraph. A document that validates against it only uses whitelisted
+fields - a typo or an unlisted field fails at import/test time - but the subgraph itself
+is not checked: a field renamed or removed upstream still fails at query time.
+
+Extend it together with any new query (tests/test_subgraph_schema.py checks every
+document in subgraph.py against it), copying the field types from the subgraph's
+schema.graphql.
+"""
+from graphql import DocumentNode, GraphQLError, build_schema, validate
+
+QUERY_WHITELIST_SDL = """
+scalar BigInt
+scalar BigDecimal
+scalar Bytes
+
+enum OrderDirection {
+  asc
+  desc
+}
+
+type Group {
+  id: ID!
+  name: String!
+  minLeverage: BigInt!
+  maxLeverage: BigInt!
+  maxCollateralP: BigInt!
+  longCollateral: BigInt!
+  shortCollateral: BigInt!
+}
+
+type Fee {
+  id: ID!
+  minLevPos: BigInt!
+}
+
+type Pair {
+  id: ID!
+  from: String!
+  to: String!
+  feed: Bytes!
+  group: Group!
+  fee: Fee!
+  overnightMaxLeverage: BigInt!
+  longOI: BigInt!
+  shortOI: BigInt!
+  maxOI: BigInt!
+  makerFeeP: BigInt!
+  takerFeeP: BigInt!
+  makerMaxLeverage: BigInt!
+  curFundingLong: BigInt!
+  curFundingShort: BigInt!
+  curRollover: BigInt!
+  totalOpenTrades: BigInt!
+  totalOpenLimitOrders: BigInt!
+  accRollover: BigInt!
+  lastRolloverBlock: BigInt!
+  rolloverFeePerBlock: BigInt!
+  accFundingLong: BigInt!
+  accFundingShort: BigInt!
+  lastFundingBlock: BigInt!
+  maxFundingFeePerBlock: BigInt!
+  lastFundingRate: BigInt!
+  hillInflectionPoint: BigInt!
+  hillPosScale: BigInt!
+  hillNegScale: BigInt!
+  springFactor: BigInt!
+  sFactorUpScaleP: BigInt!
+  sFactorDownScaleP: BigInt!
+  lastTradePrice: BigInt!
+  maxLeverage: BigInt!
+  spreadP: BigInt!
+}
+
+type Trade {
+  id: ID!
+  tradeID: BigInt!
+  trader: Bytes!
+  pair: Pair!
+  index: BigInt!
+  tradeType: String!
+  openPrice: BigInt!
+  closePrice: BigInt
+  takeProfitPrice: BigInt!
+  stopLossPrice: BigInt!
+  collateral: BigInt!
+  notional: BigInt!
+  tradeNotional: BigInt!
+  highestLeverage: BigInt!
+  leverage: BigInt!
+  isBuy: Boolean!
+  isOpen: Boolean!
+  closeInitiated: BigInt
+  funding: BigInt!
+  rollover: BigInt!
+  timestamp: BigInt!
+}
+
+type Order {
+  id: ID!
+  trader: Bytes!
+  pair: Pair!
+  tradeID: BigInt
+  limitID: BigInt
+  orderType: String!
+  orderAction: String!
+  price: BigInt
+  priceAfterImpact: BigInt
+  priceImpactP: BigInt
+  collateral: BigInt!
+  notional: BigInt
+  tradeNotional: BigInt
+  profitPercent: BigInt
+  totalProfitPercent: BigInt
+  amountSentToTrader: BigInt
+  isBuy: Boolean!
+  initiatedAt: BigInt!
+  executedAt: BigInt
+  initiatedTx: Bytes!
+  executedTx: Bytes
+  initiatedBlock: BigInt!
+  executedBlock: BigInt
+  leverage: BigInt!
+  isPending: Boolean!
+  isCancelled: Boolean!
+  cancelReason: String
+  devFee: BigInt
+  vaultFee: BigInt
+  oracleFee: BigInt
+  liquidationFee: BigInt
+  fundingFee: BigInt
+  rolloverFee: BigInt
+  closePercent: BigInt
+}
+
+type Limit {
+  id: ID!
+  trader: Bytes!
+  pair: Pair!
+  collateral: BigInt!
+  leverage: BigInt!
+  isBuy: Boolean!
+  isActive: Boolean!
+  openPrice: BigInt!
+  takeProfitPrice: BigInt!
+  stopLossPrice: BigInt!
+  initiatedAt: BigInt!
+  limitType: String!
+}
+
+type _Block_ {
+  number: Int!
+  hash: Bytes
+  timestamp: Int
+}
+
+type _Meta_ {
+  block: _Block_!
+  deployment: String!
+  hasIndexingErrors: Boolean!
+}
+
+type MetaData {
+  id: ID!
+  liqMarginThresholdP: BigInt!
+}
+
+input Pair_filter {
+  id: ID
+  id_gt: ID
+}
+
+input Trade_filter {
+  id: ID
+  id_gt: ID
+  id_in: [ID!]
+  trader: Bytes
+  trader_in: [Bytes!]
+  index: BigInt
+  pair_: Pair_filter
+  isOpen: Boolean
+}
+
+input Order_filter {
+  id: ID
+  id_gt: ID
+  id_in: [ID!]
+  trader: Bytes
+  isPending: Boolean
+  executedAt: BigInt
+  executedAt_gt: BigInt
+  or: [Order_filter]
+}
+
+input Limit_filter {
+  id: ID
+  id_gt: ID
+  trader: Bytes
+  isActive: Boolean
+}
+
+enum Pair_orderBy {
+  id
+}
+
+enum Trade_orderBy {
+  id
+  timestamp
+}
+
+enum Order_orderBy {
+  id
+  initiatedAt
+  executedAt
+}
+
+enum Limit_orderBy {
+  id
+  initiatedAt
+}
+
+type Query {
+  pair(id: ID!): Pair
+  pairs(first: Int, skip: Int, where: Pair_filter, orderBy: Pair_orderBy, orderDirection: OrderDirection): [Pair!]!
+  trades(first: Int, skip: Int, where: Trade_filter, orderBy: Trade_orderBy, orderDirection: OrderDirection): [Trade!]!
+  orders(first: Int, skip: Int, where: Order_filter, orderBy: Order_orderBy, orderDirection: OrderDirection): [Order!]!
+  limits(first: Int, skip: Int, where: Limit_filter, orderBy: Limit_orderBy, orderDirection: OrderDirection): [Limit!]!
+  metaDatas(first: Int, skip: Int): [MetaData!]!
+  _meta: _Meta_
+}
+"""
+
+_schema = None
+
+
+def get_query_whitelist():
+    """GraphQLSchema of the whitelist, built on first use"""
+    global _schema
+    if _schema is None:
+        _schema = build_schema(QUERY_WHITELIST_SDL)
+    return _schema
+
+
+def validate_document(document: DocumentNode):
+    """Raises GraphQLError if the document queries anything outside the whitelist"""
+    errors = validate(get_query_whitelist(), document)
+    if errors:
+        raise GraphQLError(
+            "Subgraph query is outside the local query whitelist: " + "; ".join(e.message for e in errors))
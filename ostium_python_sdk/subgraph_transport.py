@@ -0,0 +1,182 @@
+import asyncio
+import random
+import time
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+from gql.transport.async_transport import AsyncTransport
+from gql.transport.exceptions import TransportProtocolError, TransportServerError
+from graphql import DocumentNode, ExecutionResult, OperationType
+from graphql.language import OperationDefinitionNode
+
+from .http_pool import HttpPool, PooledGraphQLTransport
+from .metrics import LatencyStats
+
+DEFAULT_RETRIES = 2
+DEFAULT_BACKOFF_SECONDS = 0.2
+DEFAULT_MAX_BACKOFF_SECONDS = 2.0
+# Until an endpoint has enough samples for a meaningful p95, hedge after this delay
+DEFAULT_HEDGE_DELAY_SECONDS = 1.0
+DEFAULT_HEDGE_MIN_SAMPLES = 20
+DEFAULT_HEDGE_MIN_DELAY_SECONDS = 0.05
+# A failing endpoint is ranked last for this long (times its consecutive failures, capped)
+DEFAULT_COOLDOWN_SECONDS = 5.0
+DEFAULT_MAX_COOLDOWN_SECONDS = 60.0
+
+
+class SubgraphEndpoint:
+    """One subgraph URL with its latency distribution and failure state"""
+
+    def __init__(self, url: str, http: Optional[HttpPool] = None):
+        self.url = url
+        self.transport = PooledGraphQLTransport(url, http=http)
+        self.latency = LatencyStats()
+        self.failures = 0  # consecutive
+        self.cooldown_until = 0.0  # time.monotonic()
+
+    def is_cooling_down(self, now=None):
+        return (now or time.monotonic()) < self.cooldown_until
+
+    def summary(self):
+        return {'latency_ms': self.latency.summary(), 'failures': self.failures,
+                'cooling_down': self.is_cooling_down()}
+
+
+def _is_read_only(document: DocumentNode):
+    return all(definition.operation == OperationType.QUERY
+               for definition in document.definitions if isinstance(definition, OperationDefinitionNode))
+
+
+def is_retryable(error: Exception):
+    """Transport failures worth another attempt: network errors, timeouts, 5xx and 429"""
+    if isinstance(error, TransportServerError):
+        return error.code is None or error.code >= 500 or error.code == 429
+    return isinstance(error, (TransportProtocolError, aiohttp.ClientError, asyncio.TimeoutError, OSError))
+
+
+class MultiEndpointGraphQLTransport(AsyncTransport):
+    """
+    gql AsyncTransport spreading subgraph queries over several equivalent endpoints.
+
+    - endpoints are ranked by their median latency, endpoints that just failed last
+    - a failed attempt is retried (up to `retries` times) on the next endpoint after a
+      full-jitter exponential backoff; GraphQL errors and 4xx responses are not retried
+    - read-only queries are hedged: when the chosen endpoint hasn't answered within its
+      p95 latency, the same query is sent to the next endpoint and the first answer wins
+
+    With a single URL it still retries, but never hedges.
+    """
+
+    def __init__(self, urls: List[str], http: Optional[HttpPool] = None, retries=DEFAULT_RETRIES,
+                 backoff=DEFAULT_BACKOFF_SECONDS, max_backoff=DEFAULT_MAX_BACKOFF_SECONDS, hedge=True,
+                 hedge_delay=DEFAULT_HEDGE_DELAY_SECONDS, hedge_min_samples=DEFAULT_HEDGE_MIN_SAMPLES,
+                 verbose=False):
+        if not urls:
+            raise ValueError("At least one subgraph URL is required")
+        self.endpoints = [SubgraphEndpoint(url, http=http) for url in dict.fromkeys(urls)]
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.hedge = hedge
+        self.hedge_delay = hedge_delay
+        self.hedge_min_samples = hedge_min_samples
+        self.verbose = verbose
+
+        self.hedged = 0  # duplicate requests sent
+        self.retried = 0
+
+    def log(self, message):
+        if self.verbose:
+            print(message)
+
+    async def connect(self):
+        pass
+
+    async def close(self):
+        pass
+
+    def subscribe(self, document, variable_values=None, operation_name=None):
+        raise NotImplementedError("Subscriptions are not supported over HTTP")
+
+    def ranked_endpoints(self):
+        now = time.monotonic()
+        return sorted(self.endpoints,
+                      key=lambda e: (e.is_cooling_down(now), e.latency.percentile(50) or 0))
+
+    def get_stats(self):
+        """Per-endpoint latency and health, e.g: {'https://...': {'latency_ms': {...}, 'failures': 0, ...}}"""
+        return {endpoint.url: endpoint.summary() for endpoint in self.endpoints}
+
+    def _hedge_after(self, endpoint):
+        if len(endpoint.latency) < self.hedge_min_samples:
+            return self.hedge_delay
+        return max(endpoint.latency.percentile(95) / 1000, DEFAULT_HEDGE_MIN_DELAY_SECONDS)
+
+    async def execute(self, document: DocumentNode, variable_values: Optional[Dict[str, Any]] = None,
+                      operation_name: Optional[str] = None) -> ExecutionResult:
+        hedge = self.hedge and len(self.endpoints) > 1 and _is_read_only(document)
+
+        tried = []
+        for attempt in range(self.retries + 1):
+            # Endpoints not tried yet for this query first, each group by rank
+            ranked = self.ranked_endpoints()
+            candidates = [e for e in ranked if e not in tried] + [e for e in ranked if e in tried]
+            primary = candidates[0]
+            secondary = candidates[1] if hedge else None
+            tried.append(primary)
+            try:
+                return await self._attempt(primary, secondary, document, variable_values, operation_name)
+            except Exception as e:
+                if attempt == self.retries or not is_retryable(e):
+                    raise
+                delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+                self.retried += 1
+                self.log(f"Subgraph request to {primary.url} failed ({e}), retrying in {delay:.2f}s")
+                await asyncio.sleep(delay)
+
+    async def _attempt(self, primary, secondary, document, variable_values, operation_name):
+        tasks = [asyncio.ensure_future(self._send(primary, document, variable_values, operation_name))]
+        sent = [(primary, time.monotonic())]
+        try:
+            if secondary is not None:
+                done, _ = await asyncio.wait(tasks, timeout=self._hedge_after(primary))
+                if not done:
+                    self.hedged += 1
+                    self.log(f"Subgraph request to {primary.url} is slow, hedging on {secondary.url}")
+                    tasks.append(asyncio.ensure_future(
+                        self._send(secondary, document, variable_values, operation_name)))
+                    sent.append((secondary, time.monotonic()))
+
+            # First successful answer wins, fail only when every request failed
+            error = None
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task, (endpoint, started_at) in zip(tasks, sent):
+                if not task.done():
+                    # Lost the hedge race: it took at least this long, so a slow endpoint
+                    # drops in the ranking even though it never answered
+                    endpoint.latency.record((time.monotonic() - started_at) * 1000)
+                    task.cancel()
+                elif not task.cancelled():
+                    task.exception()  # the losing request's error is expected, mark it retrieved
+
+    async def _send(self, endpoint, document, variable_values, operation_name):
+        started_at = time.monotonic()
+        try:
+            result = await endpoint.transport.execute(document, variable_values, operation_name)
+        except Exception:
+            endpoint.failures += 1
+            endpoint.cooldown_until = time.monotonic() + min(
+                DEFAULT_COOLDOWN_SECONDS * endpoint.failures, DEFAULT_MAX_COOLDOWN_SECONDS)
+            raise
+        endpoint.latency.record((time.monotonic() - started_at) * 1000)
+        endpoint.failures = 0
+        endpoint.cooldown_until = 0.0
+        return result
@@ -4,6 +4,7 @@ from web3 import Web3
 from ast import literal_eval
 
 from .constants import MAX_PROFIT_P, MAX_STOP_LOSS_P
+from .models import LimitRecord, SubgraphRecord, TradeRecord
 
 
 def format_with_precision(number, precision):
@@ -42,6 +43,12 @@ def calculate_fee_per_hours(cur_funding_rate, hours=24, round_to_precision=5):
     return round(rate, round_to_precision)
 
 
+def encode_abi(contract, fn_name, args, kwargs=None):
+    """Calldata of contract.fn_name(*args, **kwargs), through the public encoder of web3 7+ (encode_abi) or web3 6 (encodeABI)"""
+    encode = getattr(contract, 'encode_abi', None) or contract.encodeABI
+    return encode(fn_name, args=list(args), kwargs=kwargs or None)
+
+
 def get_tp_sl_prices(trade_params):
     tp_price = 0
     sl_price = 0
@@ -56,19 +63,20 @@ def get_tp_sl_prices(trade_params):
 
 
 def get_order_details(order_details):
-    open_price = Web3.from_wei(int(order_details['openPrice']), 'ether')
+    # The subgraph's LimitRecord as is, a plain dict parsed once
+    order = LimitRecord.from_dict(order_details)
+    open_price = Web3.from_wei(order.openPrice, 'ether')
 
-    limit_order_created_time = datetime.fromtimestamp(
-        int(order_details['initiatedAt']))
+    limit_order_created_time = datetime.fromtimestamp(order.initiatedAt)
 
-    leverage = Web3.from_wei(int(order_details['leverage']), 'kwei')*10
-    collateral = Web3.from_wei(int(order_details['collateral']), 'mwei')
-    is_long = order_details['isBuy']
-    limit_type = order_details['limitType']
-    pairIndex, index = parse_limit_order_id(order_details['id'])
+    leverage = Web3.from_wei(order.leverage, 'kwei')*10
+    collateral = Web3.from_wei(order.collateral, 'mwei')
+    is_long = order.isBuy
+    limit_type = order.limitType
+    pairIndex, index = parse_limit_order_id(order.id)
 
-    sl_price = Web3.from_wei(int(order_details['stopLossPrice']), 'ether')
-    tp_price = Web3.from_wei(int(order_details['takeProfitPrice']), 'ether')
+    sl_price = Web3.from_wei(order.stopLossPrice, 'ether')
+    tp_price = Web3.from_wei(order.takeProfitPrice, 'ether')
 
     atLeastTradeNotional = 0
     if open_price:
@@ -78,16 +86,18 @@ def get_order_details(order_details):
 
 
 def get_trade_details(trade_details):
-    open_price = Web3.from_wei(int(trade_details['openPrice']), 'ether')
-    sl_price = Web3.from_wei(int(trade_details['stopLossPrice']), 'ether')
-    tp_price = Web3.from_wei(int(trade_details['takeProfitPrice']), 'ether')
-    tradeNotional = Web3.from_wei(int(trade_details['tradeNotional']), 'ether')
-    trans_time = datetime.fromtimestamp(int(trade_details['timestamp']))
-    leverage = Web3.from_wei(int(trade_details['leverage']), 'kwei')*10
-    collateral = Web3.from_wei(int(trade_details['collateral']), 'mwei')
-    is_long = trade_details['isBuy']
-    pairIndex = trade_details['pair']['id']
-    index = trade_details['index']
+    # The subgraph's TradeRecord as is, a plain dict parsed once
+    trade = TradeRecord.from_dict(trade_details)
+    open_price = Web3.from_wei(trade.openPrice, 'ether')
+    sl_price = Web3.from_wei(trade.stopLossPrice, 'ether')
+    tp_price = Web3.from_wei(trade.takeProfitPrice, 'ether')
+    tradeNotional = Web3.from_wei(trade.tradeNotional, 'ether')
+    trans_time = datetime.fromtimestamp(trade.timestamp)
+    leverage = Web3.from_wei(trade.leverage, 'kwei')*10
+    collateral = Web3.from_wei(trade.collateral, 'mwei')
+    is_long = trade.isBuy
+    pairIndex = trade['pair']['id']
+    index = trade['index']
 
     return open_price, round(tradeNotional, 18), trans_time, leverage, collateral, pairIndex, index, is_long, sl_price, tp_price
 
@@ -218,4 +228,67 @@ def convert_decimals(obj):
         return str(obj)  # or float(obj) if you prefer
     return obj
 
+
+# Order / trade fields scaled by format_entity_values
+ENTITY_PRICE_FIELDS = (
+    'price', 'priceAfterImpact', 'openPrice', 'closePrice',
+    'takeProfitPrice', 'stopLossPrice'
+)
+ENTITY_COLLATERAL_FIELDS = (
+    'collateral', 'notional', 'tradeNotional', 'amountSentToTrader',
+    'devFee', 'vaultFee', 'oracleFee', 'liquidationFee', 'fundingFee', 'rolloverFee'
+)
+ENTITY_PERCENTAGE_FIELDS = (
+    'profitPercent', 'totalProfitPercent', 'priceImpactP', 'leverage', 'highestLeverage',
+    'closePercent'
+)
+
+
+def format_entity_values(entity, price_fields=ENTITY_PRICE_FIELDS, collateral_fields=ENTITY_COLLATERAL_FIELDS,
+                         percentage_fields=ENTITY_PERCENTAGE_FIELDS):
+    """
+    Format values in an entity (order or trade) to proper decimal representations
+
+    Args:
+        entity: The entity (order or trade) to format values for
+        price_fields: Field names that represent prices (18 decimals)
+        collateral_fields: Field names that represent collateral/token amounts (6 decimals)
+        percentage_fields: Field names that represent percentages (2 decimals)
+
+    Returns:
+        A new dictionary with formatted values, None for no entity
+    """
+    if not entity:
+        return None
+
+    formatted_entity = {}
+
+    # A record's scaled fields are read as its parsed ints, not through their strings
+    typed = isinstance(entity, SubgraphRecord)
+    for key in entity:
+        if key in price_fields:
+            decimals = 18
+        elif key in collateral_fields:
+            decimals = 6
+        elif key in percentage_fields:
+            decimals = 2
+        else:
+            formatted_entity[key] = entity[key]
+            continue
+
+        value = getattr(entity, key) if typed and key in entity.INT_FIELDS else entity[key]
+        if value is None:
+            formatted_entity[key] = value
+            continue
+
+        if isinstance(value, (int, str, Decimal)):
+            try:
+                formatted_entity[key] = float(value) / 10**decimals
+            except (ValueError, TypeError):
+                formatted_entity[key] = value
+        else:
+            formatted_entity[key] = value
+
+    return formatted_entity
+
 # timestamp is a string in seconds as returned from graph
@@ -1,8 +1,13 @@
 import os
 import pytest
 from dotenv import load_dotenv
+from eth_account import Account
+from hexbytes import HexBytes
+from web3 import AsyncHTTPProvider, AsyncWeb3, Web3
 from ostium_python_sdk import OstiumSDK
+from ostium_python_sdk.async_ostium import AsyncOstium
 from ostium_python_sdk.config import NetworkConfig
+from ostium_python_sdk.ostium import Ostium
 
 # Public RPC endpoints for Arbitrum Sepolia
 PUBLIC_RPC_URLS = {
@@ -10,6 +15,11 @@ PUBLIC_RPC_URLS = {
     'arbitrum_sepolia_alchemy': 'https://arb-sepolia.g.alchemy.com/v2/demo'
 }
 
+# Key and contract addresses of the clients sending to an in-memory node (fake_client)
+PRIVATE_KEY = "0x" + "11" * 32
+CONTRACT = "0x" + "22" * 20
+ADDRESS = Account.from_key(PRIVATE_KEY).address
+
 
 @pytest.fixture(scope="session")
 def rpc_url():
@@ -37,3 +47,66 @@ def mock_sdk():
     """Initialize SDK with mock configuration for unit tests"""
     config = NetworkConfig.testnet()
     return OstiumSDK(config)
+
+
+def tx_hash(n):
+    return HexBytes(n.to_bytes(32, 'big'))
+
+
+def close_trade_tx():
+    return {'to': CONTRACT, 'data': '0x', 'gas': 21000, 'gasPrice': 1, 'value': 0, 'chainId': 42161}
+
+
+class RecordingAccount:
+    """eth.account signing as usual, recording the nonce of every signed transaction"""
+
+    def __init__(self):
+        self.nonces = []
+
+    def from_key(self, key):
+        return Account.from_key(key)
+
+    def sign_transaction(self, tx, private_key):
+        self.nonces.append(tx['nonce'])
+        return Account.sign_transaction(tx, private_key)
+
+
+@pytest.fixture
+def fake_client():
+    """
+    Factory of Ostium / AsyncOstium clients sending to an in-memory node: transactions are
+    signed by a RecordingAccount (web3.eth.account), send_raw_transaction records them in
+    client.sent and returns tx_hash(n) for the n-th one, and closes are a fixed transaction
+    built without RPC unless build_transactions. Tests override the rest they need, e.g:
+        client = fake_client(AsyncOstium, allowance_tracker=AllowanceTracker(...))
+    """
+    def make(client_class=Ostium, w3=None, build_transactions=False, **kwargs):
+        is_async = issubclass(client_class, AsyncOstium)
+        if w3 is None:
+            w3 = AsyncWeb3(AsyncHTTPProvider("http://127.0.0.1:1")) if is_async else Web3()
+        client = client_class(w3, CONTRACT, CONTRACT, CONTRACT, PRIVATE_KEY, **kwargs)
+        client.sent = []
+        eth = client.web3.eth
+        eth.account = RecordingAccount()
+
+        def send_raw_transaction(raw_transaction):
+            client.sent.append(raw_transaction)
+            return tx_hash(len(client.sent))
+
+        if is_async:
+            async def async_send_raw_transaction(raw_transaction):
+                return send_raw_transaction(raw_transaction)
+
+            async def build_transaction(function, account, trader_address=None, action="trade"):
+                return close_trade_tx()
+
+            eth.send_raw_transaction = async_send_raw_transaction
+            if not build_transactions:
+                client._build_transaction = build_transaction
+        else:
+            eth.send_raw_transaction = send_raw_transaction
+            if not build_transactions:
+                client._close_trade_tx = lambda account, pair_id, trade_index, close_percentage, trader_address: close_trade_tx()
+        return client
+
+    return make
@@ -0,0 +1,126 @@
+import asyncio
+import threading
+
+import pytest
+
+from ostium_python_sdk.allowance import AllowanceTracker
+from ostium_python_sdk.async_ostium import AsyncOstium
+
+from .conftest import ADDRESS
+
+
+def test_reserve_spends_the_cached_allowance():
+    allowances = AllowanceTracker(approve_amount=100, top_up_below=30)
+    assert not allowances.reserve(ADDRESS, 10)  # unknown until read
+
+    allowances.sync(ADDRESS, 50)
+    assert allowances.reserve(ADDRESS, 20)
+    assert not allowances.reserve(ADDRESS, 40)  # short: nothing is taken
+    assert allowances.remaining(ADDRESS) == 30
+
+
+def test_one_top_up_at_a_time_below_the_threshold():
+    allowances = AllowanceTracker(approve_amount=100, top_up_below=30)
+    allowances.sync(ADDRESS, 30)
+    assert not allowances.start_top_up(ADDRESS)
+
+    allowances.reserve(ADDRESS, 10)
+    assert allowances.start_top_up(ADDRESS)
+    assert not allowances.start_top_up(ADDRESS)
+
+    allowances.approved(ADDRESS)
+    allowances.finish_top_up(ADDRESS, succeeded=True)
+    assert allowances.remaining(ADDRESS) == 100
+
+    # a failed approve forgets the count, it's read from the chain again
+    allowances.reserve(ADDRESS, 80)
+    assert allowances.start_top_up(ADDRESS)
+    allowances.finish_top_up(ADDRESS, succeeded=False)
+    assert not allowances.is_synced(ADDRESS)
+
+
+@pytest.fixture
+def ostium(fake_client):
+    def make(chain_allowance):
+        """Ostium whose allowance reads and approvals are recorded instead of sent"""
+        client = fake_client(allowance_tracker=AllowanceTracker(approve_amount=100, top_up_below=30))
+        client.reads = 0
+        client.top_ups = []
+        client.top_up_done = threading.Event()
+
+        def read_allowance(owner):
+            client.reads += 1
+            client.allowances.sync(owner, chain_allowance)
+
+        def top_up_allowance(account):
+            client.top_ups.append(threading.current_thread().name)
+            client.allowances.approved(account.address)
+            client.allowances.finish_top_up(account.address, True)
+            client.top_up_done.set()
+            return True
+
+        client._read_allowance = read_allowance
+        client._top_up_allowance = top_up_allowance
+        return client
+
+    return make
+
+
+def test_trades_read_the_allowance_once_and_top_up_in_the_background(ostium):
+    client = ostium(chain_allowance=60)
+    account = client._get_account()
+
+    client._reserve_allowance(account, 20, use_delegation=False)
+    assert client.reads == 1 and client.top_ups == []
+
+    # crossing the threshold doesn't hold up the trade: the approve is sent from another thread
+    client._reserve_allowance(account, 20, use_delegation=False)
+    assert client.top_up_done.wait(1)
+    assert client.reads == 1
+    assert client.top_ups == ["ostium-allowance-top-up"]
+    assert client.allowances.remaining(ADDRESS) == 100
+
+
+def test_async_top_up_outlives_the_callers_loop(fake_client):
+    """A per-request loop is closed once the trade is sent: the approve is sent from a thread of its own"""
+    client = fake_client(AsyncOstium, allowance_tracker=AllowanceTracker(approve_amount=100, top_up_below=30))
+    client.allowances.sync(ADDRESS, 40)
+    blocking = client._blocking_client()
+    top_ups = []
+    top_up_done = threading.Event()
+
+    def top_up_allowance(account):
+        top_ups.append(threading.current_thread().name)
+        client.allowances.approved(account.address)
+        client.allowances.finish_top_up(account.address, True)
+        top_up_done.set()
+        return True
+
+    blocking._top_up_allowance = top_up_allowance
+
+    asyncio.run(client._reserve_allowance(client._get_account(), 20, use_delegation=False))
+
+    assert top_up_done.wait(1)
+    assert top_ups == ["ostium-allowance-top-up"]
+    assert blocking.nonces is client.nonces and blocking.web3 is client.receipt_watcher.web3
+    assert client.allowances.remaining(ADDRESS) == 100
+
+
+def test_short_allowance_is_read_again_then_approved_inline(ostium):
+    client = ostium(chain_allowance=10)
+    account = client._get_account()
+
+    client._reserve_allowance(account, 50, use_delegation=False)
+
+    assert client.reads == 2
+    assert client.top_ups == [threading.current_thread().name]
+    assert client.allowances.remaining(ADDRESS) == 50
+
+
+def test_delegated_trades_never_approve(ostium):
+    client = ostium(chain_allowance=10)
+    trader = "0x" + "33" * 20
+
+    with pytest.raises(Exception, match="Sufficient allowance"):
+        client._reserve_allowance(client._get_account(), 50, use_delegation=True, trader_address=trader)
+    assert client.top_ups == []
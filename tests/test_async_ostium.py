@@ -0,0 +1,71 @@
+import asyncio
+
+import pytest
+from hexbytes import HexBytes
+from web3.datastructures import AttributeDict
+
+from ostium_python_sdk.async_ostium import AsyncOstium
+from ostium_python_sdk.ostium import PRICE_REQUESTED_TOPIC
+
+from .conftest import ADDRESS
+
+
+@pytest.fixture
+def ostium(fake_client):
+    """AsyncOstium whose RPC calls are answered in memory, each receipt taking a little while"""
+    ostium = fake_client(AsyncOstium)
+    eth = ostium.web3.eth
+
+    async def get_transaction_count(address, block_identifier='latest'):
+        assert block_identifier == 'pending'
+        await asyncio.sleep(0)
+        return 5 + len(ostium.sent)
+
+    async def wait_for_transaction_receipt(tx_hash):
+        await asyncio.sleep(0.05)
+        order_id = int.from_bytes(tx_hash, 'big') + 100
+        return AttributeDict({'status': 1, 'gasUsed': 21000, 'logs': [{'topics': [HexBytes(PRICE_REQUESTED_TOPIC), HexBytes(order_id.to_bytes(32, 'big'))]}]})
+
+    eth.get_transaction_count = get_transaction_count
+    eth.wait_for_transaction_receipt = wait_for_transaction_receipt
+    return ostium
+
+
+@pytest.mark.asyncio
+async def test_concurrent_closes_get_consecutive_nonces_and_overlap(ostium):
+    """Nonces come from the local allocator so they don't collide, the receipts are awaited concurrently"""
+    loop = asyncio.get_running_loop()
+
+    started_at = loop.time()
+    results = await asyncio.gather(*[ostium.close_trade(pair_id, 0) for pair_id in range(3)])
+    elapsed = loop.time() - started_at
+
+    assert [result['order_id'] for result in results] == [101, 102, 103]
+    assert ostium.web3.eth.account.nonces == [5, 6, 7]
+    assert elapsed < 0.15  # three 50ms receipts, not one after the other
+
+
+@pytest.mark.asyncio
+async def test_get_public_address_is_shared_with_ostium(ostium):
+    assert ostium.get_public_address() == ADDRESS
+
+
+@pytest.mark.asyncio
+async def test_cancelled_send_resyncs_the_nonces(ostium):
+    """A submit cancelled during the send may or may not have reached the node: the nonces are read again"""
+    sending = asyncio.Event()
+
+    async def send_raw_transaction(raw_transaction):
+        sending.set()
+        await asyncio.sleep(60)
+
+    ostium.web3.eth.send_raw_transaction = send_raw_transaction
+    tx = await ostium._build_transaction(None, None)
+    submit = asyncio.ensure_future(ostium._submit(tx, ostium._get_account()))
+    await sending.wait()
+    submit.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await submit
+
+    assert not ostium.nonces.is_synced(ADDRESS)
+    assert await ostium._allocate_nonce(ADDRESS) == 5
@@ -0,0 +1,141 @@
+import pytest
+from web3 import AsyncHTTPProvider, AsyncWeb3, HTTPProvider, Web3
+from web3.datastructures import AttributeDict
+from web3.exceptions import ContractLogicError
+
+from ostium_python_sdk.async_ostium import AsyncOstium
+from ostium_python_sdk.exceptions import TransactionRevertedError
+from ostium_python_sdk.gas import FeeOracle, GasProfileCache
+from ostium_python_sdk.ostium import Ostium
+
+from .conftest import CONTRACT, PRIVATE_KEY
+
+TRADER = "0x" + "33" * 20
+
+
+def test_gas_limit_is_the_largest_recent_gas_used_plus_margin():
+    profiles = GasProfileCache(margin=0.5, window=2)
+    assert profiles.limit('openTrade') is None
+
+    for gas_used in (1000, 3000, 2000):
+        profiles.record('openTrade', gas_used)
+    assert profiles.limit('openTrade') == 4500
+
+    profiles.record('openTrade', 1000)  # 3000 left the window
+    assert profiles.limit('openTrade') == 3000
+
+
+def test_receipts_teach_profiles_and_out_of_gas_drops_them():
+    profiles = GasProfileCache(margin=0)
+    profiles.submitted(b'\x01', 'updateSl', 100000)
+    profiles.observe(b'\x01', AttributeDict({'status': 1, 'gasUsed': 60000}))
+    assert profiles.limit('updateSl') == 60000
+
+    # a revert is not representative, running out of gas means the profile is too low
+    profiles.submitted(b'\x02', 'updateSl', 60000)
+    profiles.observe(b'\x02', AttributeDict({'status': 0, 'gasUsed': 30000}))
+    assert profiles.limit('updateSl') == 60000
+    profiles.submitted(b'\x03', 'updateSl', 60000)
+    profiles.observe(b'\x03', AttributeDict({'status': 0, 'gasUsed': 60000}))
+    assert profiles.limit('updateSl') is None
+
+
+class FakeEth:
+    def fee_history(self, block_count, newest_block, reward_percentiles):
+        return {'baseFeePerGas': [10, 12, 15], 'reward': [[1], [3], [2]]}
+
+
+class FakeWeb3:
+    eth = FakeEth()
+
+
+def test_fee_oracle_fees_from_fee_history():
+    oracle = FeeOracle(FakeWeb3(), base_fee_multiplier=2)
+    oracle.refresh()
+    assert oracle._fees == {'maxFeePerGas': 32, 'maxPriorityFeePerGas': 2}
+    oracle.close()
+
+
+def test_cached_transaction_needs_no_rpc():
+    """The provider is unreachable: building only works without estimation or fee lookups"""
+    oracle = FeeOracle(FakeWeb3(), refresh_interval=60)
+    oracle.refresh()
+    ostium = Ostium(Web3(HTTPProvider("http://127.0.0.1:1")), CONTRACT, CONTRACT, CONTRACT, PRIVATE_KEY,
+                    use_delegation=True, fee_oracle=oracle)
+    ostium._chain_id = 42161
+    ostium.gas_profiles.record('delegatedAction(closeTradeMarket)', 200000)
+    try:
+        tx = ostium._close_trade_tx(ostium._get_account(), 1, 0, 100, TRADER)
+    finally:
+        oracle.close()
+
+    assert tx['gas'] == 250000
+    assert tx['maxFeePerGas'] == 32
+    assert ostium._gas_key(tx['data']) == 'delegatedAction(closeTradeMarket)'
+
+
+@pytest.fixture
+def reverting_ostium(fake_client):
+    def make(client_class, w3):
+        """Client with a warm gas profile whose closes are mined reverted, the replay failing with IsPaused()"""
+        oracle = FeeOracle(FakeWeb3(), refresh_interval=60)
+        oracle.refresh()
+        ostium = fake_client(client_class, w3, build_transactions=True, fee_oracle=oracle)
+        ostium._chain_id = 42161
+        ostium.gas_profiles.record('closeTradeMarket', 200000)
+        ostium.nonces.sync(ostium.get_public_address(), 0)
+        ostium.replays = []
+        eth = ostium.web3.eth
+
+        def wait_for_transaction_receipt(transaction_hash):
+            return AttributeDict({'status': 0, 'gasUsed': 90000, 'blockNumber': 42, 'logs': []})
+
+        def get_transaction(transaction_hash):
+            return AttributeDict({'from': ostium.get_public_address(), 'to': CONTRACT, 'input': '0x0f373369',
+                                  'value': 0, 'gas': 250000})
+
+        def call(transaction, block_identifier):
+            ostium.replays.append(block_identifier)
+            raise ContractLogicError("execution reverted", data="0x1309a563")
+
+        if client_class is AsyncOstium:
+            wait_for_transaction_receipt, get_transaction, call = (
+                asyncify(wait_for_transaction_receipt), asyncify(get_transaction), asyncify(call))
+        eth.wait_for_transaction_receipt = wait_for_transaction_receipt
+        eth.get_transaction = get_transaction
+        eth.call = call
+        return ostium, oracle
+
+    return make
+
+
+def asyncify(function):
+    async def coroutine(*args):
+        return function(*args)
+    return coroutine
+
+
+def test_reverted_close_with_cached_gas_raises_the_replayed_reason(reverting_ostium):
+    """No estimate catches the revert anymore: the status 0 receipt must"""
+    ostium, oracle = reverting_ostium(Ostium, Web3(HTTPProvider("http://127.0.0.1:1")))
+    try:
+        with pytest.raises(TransactionRevertedError, match="1309a563") as raised:
+            ostium.close_trade(1, 0)
+        results = ostium.close_trades([(1, 0)])
+    finally:
+        oracle.close()
+
+    assert raised.value.receipt['status'] == 0
+    assert ostium.replays == [42, 42]
+    assert results[0]['receipt'] is None and '1309a563' in results[0]['error']
+
+
+@pytest.mark.asyncio
+async def test_async_reverted_close_raises_the_replayed_reason(reverting_ostium):
+    ostium, oracle = reverting_ostium(AsyncOstium, AsyncWeb3(AsyncHTTPProvider("http://127.0.0.1:1")))
+    try:
+        with pytest.raises(TransactionRevertedError, match="1309a563"):
+            await ostium.close_trade(1, 0)
+    finally:
+        oracle.close()
+    assert ostium.replays == [42]
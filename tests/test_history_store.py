@@ -0,0 +1,58 @@
+import pytest
+
+from ostium_python_sdk.history_store import OrderHistoryStore
+
+
+class FakeSubgraph:
+    def __init__(self, orders):
+        self.orders = orders
+        self.cursors = []
+
+    async def iter_history_since(self, trader, executed_at=0, last_id=""):
+        self.cursors.append((executed_at, last_id))
+        for order in sorted(self.orders, key=lambda o: (int(o['executedAt']), o['id'])):
+            if (int(order['executedAt']), order['id']) > (executed_at, last_id):
+                yield order
+
+
+def order(order_id, executed_at):
+    return {'id': order_id, 'executedAt': str(executed_at), 'pair': {'from': 'BTC', 'to': 'USD'}}
+
+
+@pytest.mark.asyncio
+async def test_sync_only_pulls_orders_after_the_cursor(tmp_path):
+    """The second sync resumes from the newest stored executedAt minus the overlap and reads are local"""
+    subgraph = FakeSubgraph([order('a', 100), order('b', 100), order('c', 200)])
+    store = OrderHistoryStore(subgraph, path=str(tmp_path / "history.db"), overlap=60)
+
+    assert await store.sync("0xABC") == 3
+    subgraph.orders.append(order('d', 200))
+    assert await store.sync("0xabc") == 1
+    assert subgraph.cursors == [(0, ""), (140, "")]
+
+    recent = await store.get_recent_history("0xabc", last_n_orders=2, sync=False)
+    assert [o['id'] for o in recent] == ['c', 'd']
+    assert [o['id'] for o in store.iter_orders("0xabc", since=150)] == ['c', 'd']
+    store.close()
+
+    # the cursor survives a restart
+    reopened = OrderHistoryStore(subgraph, path=str(tmp_path / "history.db"))
+    assert reopened.get_cursor("0xabc") == (200, 'd')
+    assert reopened.count("0xabc") == 4
+    reopened.close()
+
+
+@pytest.mark.asyncio
+async def test_sync_picks_up_an_order_indexed_late_with_a_smaller_id(tmp_path):
+    """An order of the cursor's second indexed after the sync, with an id below the cursor's, is still stored"""
+    subgraph = FakeSubgraph([order('0xa', 100), order('0xc', 100)])
+    store = OrderHistoryStore(subgraph, path=str(tmp_path / "history.db"))
+
+    assert await store.sync("0xabc") == 2
+    assert store.get_cursor("0xabc") == (100, '0xc')
+
+    subgraph.orders.append(order('0xb', 100))
+    assert await store.sync("0xabc") == 1
+    assert [o['id'] for o in store.iter_orders("0xabc")] == ['0xa', '0xb', '0xc']
+    assert store.count("0xabc") == 3
+    store.close()
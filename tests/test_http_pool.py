@@ -0,0 +1,77 @@
+import asyncio
+import pytest
+from aiohttp import web
+from gql import Client, gql
+from gql.transport.exceptions import TransportQueryError
+
+from ostium_python_sdk.http_pool import HttpPool, PooledGraphQLTransport
+
+
+async def start_server(handler):
+    app = web.Application()
+    app.router.add_post('/graphql', handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}/graphql"
+
+
+@pytest.mark.asyncio
+async def test_session_is_reused_within_a_loop():
+    """The same keep-alive session serves every request on one event loop"""
+    pool = HttpPool()
+    session = pool.session()
+
+    assert pool.session() is session
+    await pool.close()
+    assert session.closed
+    assert pool.session() is not session
+    await pool.close()
+
+
+def test_session_of_a_finished_asyncio_run_is_closed():
+    """Per-request loops (asyncio.run) close their session on the way out instead of leaking it"""
+    pool = HttpPool()
+
+    async def request():
+        return pool.session()
+
+    sessions = [asyncio.run(request()) for _ in range(2)]
+
+    assert all(session.closed for session in sessions)
+    assert pool._sessions == {} and pool._closers == {}
+
+
+@pytest.mark.asyncio
+async def test_graphql_transport_runs_concurrent_queries_on_one_client():
+    """A single gql Client can execute concurrently and GraphQL errors still raise"""
+    peers = set()
+
+    async def handler(request):
+        peers.add(request.transport.get_extra_info('peername'))
+        body = await request.json()
+        if 'fail' in body['query']:
+            return web.json_response({'errors': [{'message': 'boom'}]})
+        return web.json_response({'data': {'pairs': [{'id': '0'}]}})
+
+    runner, url = await start_server(handler)
+    pool = HttpPool()
+    client = Client(transport=PooledGraphQLTransport(url, http=pool))
+    try:
+        query = gql("query { pairs { id } }")
+        for _ in range(3):
+            result = await client.execute_async(query)
+            assert result == {'pairs': [{'id': '0'}]}
+        # sequential requests went over one kept-alive connection
+        assert len(peers) == 1
+
+        results = await asyncio.gather(*[client.execute_async(query) for _ in range(5)])
+        assert all(r == {'pairs': [{'id': '0'}]} for r in results)
+
+        with pytest.raises(TransportQueryError):
+            await client.execute_async(gql("query fail { pairs { id } }"))
+    finally:
+        await pool.close()
+        await runner.cleanup()
@@ -0,0 +1,39 @@
+import pytest
+
+from ostium_python_sdk.exceptions import IndexerLagError
+from ostium_python_sdk.subgraph import SubgraphClient, INDEXED_BLOCK_QUERY
+
+
+def indexer_at(blocks):
+    """SubgraphClient whose indexer reports the given block numbers, one per _meta query"""
+    subgraph = SubgraphClient(url="http://127.0.0.1:1/graphql")
+    subgraph.meta_queries = 0
+
+    async def execute_async(document, variable_values=None):
+        assert document is INDEXED_BLOCK_QUERY
+        number = blocks[min(subgraph.meta_queries, len(blocks) - 1)]
+        subgraph.meta_queries += 1
+        return {'_meta': {'block': {'number': number}}}
+
+    subgraph.client.execute_async = execute_async
+    return subgraph
+
+
+@pytest.mark.asyncio
+async def test_wait_for_indexed_block_returns_once_the_block_is_indexed():
+    """The indexer head is polled until it reaches the receipt block, then served from memory"""
+    subgraph = indexer_at([98, 99, 100, 101])
+
+    assert await subgraph.wait_for_indexed_block(100, poll_interval=0) == 100
+    assert subgraph.meta_queries == 3
+
+    assert await subgraph.wait_for_indexed_block(95) == 100
+    assert subgraph.meta_queries == 3
+
+
+@pytest.mark.asyncio
+async def test_wait_for_indexed_block_times_out():
+    subgraph = indexer_at([10])
+
+    with pytest.raises(IndexerLagError):
+        await subgraph.wait_for_indexed_block(11, timeout=0.05, poll_interval=0.01)
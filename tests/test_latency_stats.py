@@ -0,0 +1,19 @@
+from ostium_python_sdk.metrics import LatencyStats
+
+
+def test_percentiles_over_retained_samples():
+    """Nearest-rank percentiles, bounded sample window, total count kept"""
+    stats = LatencyStats(max_samples=100)
+    for latency in range(1, 201):
+        stats.record(latency)
+
+    summary = stats.summary()
+    assert len(stats) == 100
+    assert summary['count'] == 200
+    assert summary['p50'] == 150
+    assert summary['p95'] == 195
+    assert summary['max'] == 200
+
+
+def test_empty_stats():
+    assert LatencyStats().summary()['p95'] is None
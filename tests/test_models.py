@@ -0,0 +1,49 @@
+import json
+from decimal import Decimal
+
+from ostium_python_sdk.models import OrderRecord, PairRecord, TradeRecord
+from ostium_python_sdk.utils import format_entity_values, get_trade_details
+
+
+TRADE = {
+    'id': '42', 'trader': '0xabc', 'isBuy': True, 'index': '1',
+    'openPrice': '65000500000000000000000', 'collateral': '250000000', 'leverage': '1000',
+    'pair': {'id': '0', 'from': 'BTC', 'to': 'USD', 'maxLeverage': '20000'},
+}
+
+
+def test_trade_record_parses_bigints_once_and_keeps_the_dict_api():
+    """BigInt attributes are ints, scaled views are Decimals and dict-style access is unchanged"""
+    trade = TradeRecord.from_dict(TRADE)
+
+    assert trade.openPrice == 65000500000000000000000 and trade.index == 1
+    assert trade['openPrice'] == '65000500000000000000000'
+    assert trade['index'] == '1' and trade['id'] == '42'
+    assert dict(trade.items())['leverage'] == '1000'
+    assert trade.open_price == Decimal('65000.5')
+    assert trade.collateral_usd == Decimal(250) and trade.leverage_x == Decimal(10)
+    assert isinstance(trade['pair'], PairRecord) and trade['pair'].max_leverage_x == Decimal(200)
+    assert trade.get('closePrice') is None and 'closePrice' not in trade
+    assert not hasattr(trade, '__dict__')
+
+    # wire format round trip (BigInts back to strings)
+    assert json.loads(json.dumps(trade.to_dict())) == TRADE
+
+
+def test_scaled_views_follow_updates():
+    order = OrderRecord({'id': '1', 'price': '2000000000000000000', 'someAlias': 'x'})
+    assert order.execution_price == Decimal(2)
+
+    order['price'] = '3000000000000000000'
+    assert order.execution_price == Decimal(3)
+    assert order['someAlias'] == 'x' and list(order) == ['id', 'price', 'someAlias']
+
+
+def test_consumers_read_records_and_plain_dicts_alike():
+    """format_entity_values / get_trade_details read the parsed ints of records, with the same results as from dicts"""
+    trade = dict(TRADE, stopLossPrice='0', takeProfitPrice='0', tradeNotional='38461538461538', timestamp='1700000000')
+    record = TradeRecord.from_dict(trade)
+
+    assert format_entity_values(record) == format_entity_values(trade)
+    assert format_entity_values(record)['collateral'] == 250.0
+    assert get_trade_details(record) == get_trade_details(trade)
@@ -0,0 +1,132 @@
+import pytest
+from hexbytes import HexBytes
+from web3 import Web3
+from web3.datastructures import AttributeDict
+from web3.exceptions import TimeExhausted
+
+from ostium_python_sdk.nonce_manager import NonceManager, is_nonce_error
+from ostium_python_sdk.ostium import PRICE_REQUESTED_TOPIC
+
+from .conftest import ADDRESS, tx_hash
+
+
+def test_allocates_consecutive_nonces_after_sync():
+    nonces = NonceManager()
+    with pytest.raises(ValueError):
+        nonces.allocate(ADDRESS)
+
+    nonces.sync(ADDRESS, 7)
+    assert [nonces.allocate(ADDRESS) for _ in range(3)] == [7, 8, 9]
+
+    # a lagging pending count never moves the counter backwards
+    nonces.sync(ADDRESS, 8)
+    assert nonces.allocate(ADDRESS) == 10
+
+
+def test_release_gives_back_only_the_last_nonce():
+    nonces = NonceManager()
+    nonces.sync(ADDRESS, 0)
+    first, second = nonces.allocate(ADDRESS), nonces.allocate(ADDRESS)
+
+    nonces.release(ADDRESS, second)
+    assert nonces.allocate(ADDRESS) == second
+
+    # releasing an earlier nonce would leave a gap: the account is resynced instead
+    nonces.release(ADDRESS, first)
+    assert not nonces.is_synced(ADDRESS)
+    assert nonces.resets == 1
+
+
+def test_is_nonce_error():
+    assert is_nonce_error(ValueError({'code': -32000, 'message': 'nonce too low: next nonce 12, tx nonce 10'}))
+    assert not is_nonce_error(ValueError('execution reverted'))
+    assert not is_nonce_error(ValueError({'code': -32000, 'message': 'already known'}))
+
+
+@pytest.fixture
+def ostium(fake_client):
+    def make(send_errors=()):
+        """Ostium whose node reports 5 pending transactions and fails the first sends with send_errors"""
+        client = fake_client()
+        eth = client.web3.eth
+        client.count_requests = 0
+        client.sent_nonces = []
+        send_errors = list(send_errors)
+        send_raw_transaction = eth.send_raw_transaction
+
+        def get_transaction_count(address, block_identifier='latest'):
+            assert block_identifier == 'pending'
+            client.count_requests += 1
+            return 5 + len(client.sent_nonces)
+
+        def failing_send_raw_transaction(raw_transaction):
+            if send_errors:
+                raise send_errors.pop(0)
+            client.sent_nonces.append(eth.account.nonces[-1])
+            return send_raw_transaction(raw_transaction)
+
+        def wait_for_transaction_receipt(transaction_hash):
+            if transaction_hash == tx_hash(2):
+                raise TimeExhausted("not mined")
+            order_id = int.from_bytes(transaction_hash, 'big') + 100
+            return AttributeDict({'status': 1, 'gasUsed': 21000, 'logs': [{'topics': [HexBytes(PRICE_REQUESTED_TOPIC), HexBytes(order_id.to_bytes(32, 'big'))]}]})
+
+        eth.get_transaction_count = get_transaction_count
+        eth.send_raw_transaction = failing_send_raw_transaction
+        eth.wait_for_transaction_receipt = wait_for_transaction_receipt
+        return client
+
+    return make
+
+
+def test_close_trades_sends_back_to_back_with_one_nonce_lookup(ostium):
+    client = ostium()
+
+    results = client.close_trades([(0, 0), (1, 0), (2, 0)])
+
+    assert client.sent_nonces == [5, 6, 7]
+    assert client.count_requests == 1
+    assert [result['order_id'] for result in results] == [101, None, 103]
+    # the second close was dropped: its error is reported and the nonces are resynced
+    assert 'not mined' in results[1]['error']
+    assert not client.nonces.is_synced(ADDRESS)
+
+
+def test_nonce_too_low_resyncs_and_retries_once(ostium):
+    client = ostium(send_errors=[ValueError({'code': -32000, 'message': 'nonce too low'})])
+    client.nonces.sync(ADDRESS, 2)  # stale, e.g. the key was also used elsewhere
+
+    sent_hash = client._submit(client._close_trade_tx(None, 0, 0, 100, None), client._get_account())
+
+    assert sent_hash == tx_hash(1)
+    assert client.sent_nonces == [5]
+    assert client.nonces.allocate(ADDRESS) == 6
+
+
+def test_other_send_errors_release_the_nonce(ostium):
+    client = ostium(send_errors=[ValueError('insufficient funds for gas')])
+
+    with pytest.raises(ValueError):
+        client._submit(client._close_trade_tx(None, 0, 0, 100, None), client._get_account())
+
+    assert client.nonces.allocate(ADDRESS) == 5
+
+
+def test_already_known_returns_the_hash_of_the_sent_transaction(ostium):
+    """A node already holding the transaction rejects the send: its hash is the one returned"""
+    client = ostium(send_errors=[ValueError({'code': -32000, 'message': 'already known'})])
+    signed = []
+    send_raw_transaction = client.web3.eth.send_raw_transaction
+
+    def recording_send(raw_transaction):
+        signed.append(raw_transaction)
+        return send_raw_transaction(raw_transaction)
+
+    client.web3.eth.send_raw_transaction = recording_send
+
+    sent_hash = client._submit(client._close_trade_tx(None, 0, 0, 100, None), client._get_account())
+
+    # not re-signed nor resynced: the node already holds it
+    assert sent_hash == Web3.keccak(signed[0])
+    assert len(signed) == 1
+    assert client.nonces.allocate(ADDRESS) == 6
@@ -0,0 +1,186 @@
+import time
+
+import pytest
+from web3 import Web3
+from web3.providers.base import BaseProvider
+
+from ostium_python_sdk.abi.multicall3_abi import multicall3_abi, multicall3_address
+from ostium_python_sdk.abi.pairs_info_abi import pairs_info_abi
+from ostium_python_sdk.abi.trading_storage_abi import trading_storage_abi
+from ostium_python_sdk.models import PairRecord, TradeRecord
+from ostium_python_sdk.onchain_reader import OnChainTradeReader
+from ostium_python_sdk.subgraph import SubgraphClient, INDEXED_BLOCK_QUERY
+
+TRADER = "0x1111111111111111111111111111111111111111"
+EMPTY_SLOT = (0, 0, 0, 0, "0x0000000000000000000000000000000000000000", 0, 0, 0, False)
+
+
+STORAGE = Web3.to_checksum_address("0x" + "22" * 20)
+PAIRS_INFO = Web3.to_checksum_address("0x" + "33" * 20)
+
+
+class FakeTradingStorage:
+    """tradingStorage (and pairsInfo) holding a trade at slot 0 of pair 0 and slot 2 of pair 3"""
+
+    def __init__(self):
+        self.calls = []
+        self.trades = {
+            (0, 0): (100_000_000, 2 * 10 ** 18, 0, 0, TRADER, 1000, 0, 0, True),
+            (3, 2): (50_000_000, 3 * 10 ** 18, 4 * 10 ** 18, 0, TRADER, 500, 3, 2, False),
+        }
+
+    def answer(self, name, args):
+        if name == 'maxTradesPerPair':
+            return 3
+        if name == 'openTradesCount':
+            return sum(1 for pair_id, _ in self.trades if pair_id == args[1])
+        if name == 'openTrades':
+            return self.trades.get((args[1], args[2]), EMPTY_SLOT)
+        if name == 'openTradesInfo':
+            return (args[1] * 10 + args[2], 7 * 10 ** 17, 2000, 0, 0, 1700000000, False)
+        if name == 'tradeInitialAccFees':
+            return (args[1] * 100, -args[2], True)
+        raise AssertionError(f"unexpected call {name}")
+
+
+class FakeRPC(BaseProvider):
+    """Answers the eth_calls of the reader from a FakeTradingStorage, unpacking Multicall3 batches"""
+
+    def __init__(self, storage):
+        super().__init__()
+        self.storage = storage
+        self.eth_calls = []
+        w3 = Web3()
+        self.codec = w3.codec
+        self.contracts = {
+            STORAGE: w3.eth.contract(address=STORAGE, abi=trading_storage_abi),
+            PAIRS_INFO: w3.eth.contract(address=PAIRS_INFO, abi=pairs_info_abi),
+        }
+        self.multicall = w3.eth.contract(address=multicall3_address, abi=multicall3_abi)
+
+    def make_request(self, method, params):
+        if method == 'eth_chainId':
+            return {'jsonrpc': "2.0", 'id': 1, 'result': "0xa4b1"}
+        assert method == 'eth_call', method
+        transaction, block = params
+        self.eth_calls.append(transaction['to'])
+        block = block if block == "latest" else int(block, 16)
+        if Web3.to_checksum_address(transaction['to']) == multicall3_address:
+            _, batch = self.multicall.decode_function_input(transaction['data'])
+            calls = [tuple(call.values()) if isinstance(call, dict) else call for call in batch['calls']]
+            results = [(True, self._answer(target, data, block)) for target, _, data in calls]
+            result = self.codec.encode(['(bool,bytes)[]'], [results])
+        else:
+            result = self._answer(transaction['to'], transaction['data'], block)
+        return {'jsonrpc': "2.0", 'id': 1, 'result': Web3.to_hex(result)}
+
+    def _answer(self, target, data, block):
+        contract = self.contracts[Web3.to_checksum_address(target)]
+        function, args = contract.decode_function_input(data)
+        args = tuple(args.values())
+        self.storage.calls.append((function.fn_name, args, block))
+        value = self.storage.answer(function.fn_name, args)
+        outputs = [output['type'] for output in function.abi['outputs']]
+        return self.codec.encode(outputs, value if len(outputs) > 1 else [value])
+
+
+def onchain_reader(block_number=1000):
+    rpc = FakeRPC(FakeTradingStorage())
+    reader = OnChainTradeReader(Web3(rpc), STORAGE, PAIRS_INFO)
+    reader.get_block_number = lambda: block_number
+    return reader
+
+
+def lagging_subgraph(indexed_block, reader):
+    """SubgraphClient over a fake indexer at indexed_block, with cached pairs 0 to 4"""
+    subgraph = SubgraphClient(url="http://127.0.0.1:1/graphql", fallback_reader=reader, max_lag_blocks=40)
+    subgraph._pairs_by_id = {str(i): PairRecord(id=str(i), **{'from': f"P{i}", 'to': "USD"}) for i in range(5)}
+    subgraph._pairs_fetched_at = time.monotonic()
+    subgraph.documents = []
+
+    async def execute_async(document, variable_values=None):
+        subgraph.documents.append(document)
+        if document is INDEXED_BLOCK_QUERY:
+            return {'_meta': {'block': {'number': indexed_block}}}
+        return {'trades': [{'id': "1", 'trader': TRADER, 'index': "0", 'pair': {'id': "0"}}]}
+
+    subgraph.client.execute_async = execute_async
+    return subgraph
+
+
+@pytest.mark.asyncio
+async def test_reader_returns_open_trades_at_one_block():
+    """Only the occupied slots of pairs with open trades are returned, every call pinned to one block"""
+    reader = onchain_reader(block_number=1234)
+
+    trades = await reader.get_open_trades(TRADER, pair_ids=[0, 1, 3])
+
+    # the same values as the subgraph's: strings through the mapping, ints as attributes
+    assert [(trade['pair']['id'], trade['index']) for trade in trades] == [("0", "0"), ("3", "2")]
+    assert all(isinstance(trade, TradeRecord) for trade in trades)
+    assert trades[1]['tradeID'] == "32" and trades[1].tradeID == 32
+    assert trades[1].take_profit_price == 4
+    assert trades[0].highestLeverage == 2000
+    assert trades[0]['trader'] == TRADER
+
+    # the fields the subgraph also returns for an open trade
+    assert trades[0].notional == 1_000_000_000
+    assert (trades[1].rollover, trades[1].funding) == (300, -2)
+    assert trades[1]['funding'] == "-2"
+
+    # maxTradesPerPair, then one batch of counts and one of slots
+    rpc = reader.web3.provider
+    assert [Web3.to_checksum_address(to) for to in rpc.eth_calls] == [STORAGE, multicall3_address, multicall3_address]
+    # no slot reads for pair 1, which has no trades
+    assert not [call for call in rpc.storage.calls if call[0] == 'openTrades' and call[1][1] == 1]
+    assert {block for name, _, block in rpc.storage.calls if name != 'maxTradesPerPair'} == {1234}
+
+
+@pytest.mark.asyncio
+async def test_get_open_trades_reads_onchain_while_the_indexer_lags():
+    subgraph = lagging_subgraph(indexed_block=900, reader=onchain_reader(block_number=1000))
+
+    trades = await subgraph.get_open_trades(TRADER, pair_ids=[3])
+
+    assert subgraph.lag_blocks == 100
+    assert subgraph.onchain_reads == 1
+    assert [trade['id'] for trade in trades] == ["32"]
+    assert trades[0]['pair']['from'] == "P3"
+    assert subgraph.documents == [INDEXED_BLOCK_QUERY]
+
+
+@pytest.mark.asyncio
+async def test_get_open_trades_uses_the_subgraph_when_caught_up():
+    """Within max_lag_blocks the subgraph answers and the lag check is reused for lag_check_interval"""
+    subgraph = lagging_subgraph(indexed_block=990, reader=onchain_reader(block_number=1000))
+
+    trades = await subgraph.get_open_trades(TRADER)
+    await subgraph.get_open_trades(TRADER)
+
+    assert subgraph.lag_blocks == 10
+    assert subgraph.onchain_reads == 0
+    assert [trade['pair']['from'] for trade in trades] == ["P0"]
+    assert subgraph.documents.count(INDEXED_BLOCK_QUERY) == 1
+
+
+@pytest.mark.asyncio
+async def test_expired_pairs_are_used_while_the_subgraph_is_down():
+    """An exit looks its pair up and reads its trades without a single subgraph request succeeding"""
+    subgraph = lagging_subgraph(indexed_block=None, reader=onchain_reader(block_number=1000))
+    subgraph._pairs_fetched_at = time.monotonic() - 10 * subgraph.pairs_ttl
+
+    async def execute_async(document, variable_values=None):
+        subgraph.documents.append(document)
+        raise ConnectionError("subgraph unreachable")
+
+    subgraph.client.execute_async = execute_async
+
+    pairs = await subgraph.get_cached_pairs_by_id()
+    pair_ids = [pair_id for pair_id, pair in pairs.items() if f"{pair['from']}{pair['to']}" == "P3USD"]
+    trades = await subgraph.get_open_trades(TRADER, pair_ids=pair_ids)
+
+    assert pair_ids == ["3"]
+    assert [trade['id'] for trade in trades] == ["32"]
+    assert trades[0]['pair']['from'] == "P3"
+    # only the lag check tried the subgraph
+    assert subgraph.documents == [INDEXED_BLOCK_QUERY]
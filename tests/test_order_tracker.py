@@ -0,0 +1,82 @@
+import asyncio
+
+import pytest
+
+from ostium_python_sdk.order_tracker import OrderTracker
+from ostium_python_sdk.subgraph import SubgraphClient, ORDERS_AND_TRADES_QUERY
+
+
+class FakeSubgraph(SubgraphClient):
+    """SubgraphClient whose orders settle after a given number of requests"""
+
+    def __init__(self, orders, trades, settles_after):
+        super().__init__(url="http://127.0.0.1:1/graphql")
+        self.orders = orders
+        self.trades = trades
+        self.settles_after = settles_after  # order id -> requests before it's executed
+        self.requests = []
+
+    async def _execute(self, document, variable_values=None):
+        assert document is ORDERS_AND_TRADES_QUERY
+        self.requests.append(variable_values)
+        self.indexed_block = 100
+        orders = []
+        for order_id in variable_values['order_ids']:
+            if order_id in self.orders:
+                pending = len(self.requests) <= self.settles_after.get(order_id, 0)
+                orders.append(dict(self.orders[order_id], isPending=pending))
+        trades = [self.trades[trade_id] for trade_id in variable_values['trade_ids'] if trade_id in self.trades]
+        return {'orders': orders, 'trades': trades}
+
+
+def order(order_id, trade_id, action='Open'):
+    return {'id': order_id, 'tradeID': trade_id, 'orderAction': action, 'isCancelled': False,
+            'price': str(2 * 10 ** 18), 'collateral': "10000000"}
+
+
+@pytest.mark.asyncio
+async def test_pending_orders_share_one_request_per_poll():
+    """Every tracked order is resolved from the same polls, each as soon as it settles"""
+    subgraph = FakeSubgraph(
+        orders={'1': order('1', '10'), '2': order('2', '20'), '3': order('3', '30')},
+        trades={'10': {'id': '10', 'index': "0", 'isOpen': True}, '20': {'id': '20', 'index': "1", 'isOpen': True},
+                '30': {'id': '30', 'index': "2", 'isOpen': True}},
+        settles_after={'1': 0, '2': 1, '3': 2})
+    tracker = OrderTracker(subgraph, polling_interval=0.05)
+    try:
+        results = await asyncio.gather(tracker.track(1), tracker.track(2), tracker.track(3), tracker.track(3))
+    finally:
+        tracker.close()
+
+    assert [result['trade']['id'] for result in results] == ['10', '20', '30', '30']
+    assert results[0]['order']['price'] == 2.0
+    assert results[0]['order']['collateral'] == 10.0
+    # the first poll settles order 1 (its trade in a follow-up request), the next one 2 and 3
+    assert [sorted(r['order_ids']) for r in subgraph.requests if r['order_ids']] == [['1', '2', '3'], ['2', '3']]
+    assert sorted(subgraph.requests[-1]['trade_ids']) == ['20', '30']
+
+
+@pytest.mark.asyncio
+async def test_close_order_waits_for_the_trade_to_close():
+    subgraph = FakeSubgraph(orders={'5': order('5', '50', action='Close')},
+                            trades={'50': {'id': '50', 'isOpen': True}}, settles_after={})
+    tracker = OrderTracker(subgraph, polling_interval=0, max_attempts=3)
+    try:
+        result = await tracker.track(5)
+    finally:
+        tracker.close()
+
+    # the trade never closes: given up after max_attempts, with the last order seen
+    assert result['order']['id'] == '5'
+    assert result['trade'] is None
+    assert tracker.polls == 3
+
+
+@pytest.mark.asyncio
+async def test_get_orders_and_trades_fetches_the_trade_of_a_newly_settled_order():
+    subgraph = FakeSubgraph(orders={'1': order('1', '10')}, trades={'10': {'id': '10'}}, settles_after={})
+
+    orders, trades = await subgraph.get_orders_and_trades(['1'])
+
+    assert list(orders) == ['1'] and list(trades) == ['10']
+    assert [r['trade_ids'] for r in subgraph.requests] == [[], ['10']]
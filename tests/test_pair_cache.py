@@ -0,0 +1,56 @@
+import asyncio
+import pytest
+
+from ostium_python_sdk.pair_cache import PairDetailsCache
+
+
+class FakeSubgraph:
+    def __init__(self):
+        self.calls = 0
+
+    async def get_pair_details(self, pair_id):
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        return {'id': pair_id, 'maxLeverage': '10000', 'group': {'maxLeverage': '0'},
+                'longOI': str(self.calls), 'lastFundingBlock': '1000', 'lastRolloverBlock': '990'}
+
+
+@pytest.mark.asyncio
+async def test_concurrent_misses_share_one_query():
+    """Many callers missing the same pair at once trigger a single subgraph query"""
+    subgraph = FakeSubgraph()
+    cache = PairDetailsCache(subgraph)
+
+    results = await asyncio.gather(*[cache.get(0) for _ in range(10)])
+
+    assert subgraph.calls == 1
+    assert all(r is results[0] for r in results)
+    assert (await cache.get(0))['longOI'] == '1'
+    assert subgraph.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_block_lag_expires_dynamic_fields_but_not_static_ones():
+    """Moving the chain head past max_block_lag refetches the pair, static fields stay cached"""
+    subgraph = FakeSubgraph()
+    cache = PairDetailsCache(subgraph, max_block_lag=50)
+
+    await cache.get(0, block_number=2000)
+    assert (await cache.get(0, block_number=2050))['longOI'] == '1'
+    assert (await cache.get(0, block_number=2051))['longOI'] == '2'
+
+    cache.max_age = 0
+    static = await cache.get_static(0)
+    assert static['maxLeverage'] == '10000' and 'longOI' not in static
+    assert subgraph.calls == 2
+
+
+@pytest.mark.asyncio
+async def test_entry_fetched_without_a_block_only_expires_with_age():
+    """A pair idle since block 1000 is not stale at block 5000 when it was fetched just now"""
+    subgraph = FakeSubgraph()
+    cache = PairDetailsCache(subgraph, max_block_lag=50)
+
+    await cache.get(0)
+    assert (await cache.get(0, block_number=5000))['longOI'] == '1'
+    assert subgraph.calls == 1
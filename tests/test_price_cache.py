@@ -0,0 +1,111 @@
+import asyncio
+import pytest
+
+from ostium_python_sdk.exceptions import StalePriceError
+from ostium_python_sdk.price import Price
+
+PRICES = [
+    {'feed_id': '0x01', 'bid': 99.0, 'mid': 100.0, 'ask': 101.0, 'isMarketOpen': True,
+     'isDayTradingClosed': False, 'secondsToToggleIsDayTradingClosed': -1,
+     'from': 'BTC', 'to': 'USD', 'timestampSeconds': 1748460056},
+    {'feed_id': '0x02', 'bid': 1.9, 'mid': 2.0, 'ask': 2.1, 'isMarketOpen': False,
+     'isDayTradingClosed': False, 'secondsToToggleIsDayTradingClosed': 3600,
+     'from': 'EUR', 'to': 'USD', 'timestampSeconds': 1748460050},
+]
+
+
+def make_price(max_age_ms=1000, delay=0):
+    price = Price(max_age_ms=max_age_ms)
+    price.downloads = 0
+
+    async def download():
+        price.downloads += 1
+        await asyncio.sleep(delay)
+        return [dict(p) for p in PRICES]
+
+    price._download_latest_prices = download
+    return price
+
+
+@pytest.mark.asyncio
+async def test_lookups_within_max_age_are_served_from_memory():
+    """Repeated lookups inside the freshness window download once"""
+    price = make_price(max_age_ms=60_000)
+
+    for _ in range(5):
+        mid, is_open, _ = await price.get_price('BTC', 'USD')
+        assert mid == 100.0 and is_open
+
+    assert (await price.get_latest_price_json('EUR', 'USD'))['mid'] == 2.0
+    assert price.downloads == 1
+
+
+@pytest.mark.asyncio
+async def test_concurrent_misses_share_one_request():
+    """Concurrent callers that miss the cache wait on the same fetch"""
+    price = make_price(delay=0.05)
+
+    results = await asyncio.gather(*[price.get_latest_prices() for _ in range(10)])
+
+    assert price.downloads == 1
+    assert all(r is results[0] for r in results)
+
+
+@pytest.mark.asyncio
+async def test_zero_max_age_and_invalidate_force_refetch():
+    """max_age_ms=0 and invalidate() both bypass the cached snapshot"""
+    price = make_price(max_age_ms=60_000)
+
+    await price.get_latest_prices()
+    await price.get_latest_prices(max_age_ms=0)
+    price.invalidate()
+    await price.get_latest_prices()
+
+    assert price.downloads == 3
+
+
+@pytest.mark.asyncio
+async def test_get_prices_resolves_many_pairs_from_one_snapshot():
+    """Batch lookup returns found pairs only and downloads once"""
+    price = make_price(max_age_ms=60_000)
+
+    prices = await price.get_prices([('BTC', 'USD'), ('EUR', 'USD'), ('XAU', 'USD')])
+
+    assert prices == {('BTC', 'USD'): (100.0, True, False),
+                      ('EUR', 'USD'): (2.0, False, False)}
+    assert price.downloads == 1
+
+
+@pytest.mark.asyncio
+async def test_lookup_by_feed_id_and_missing_pair():
+    """feed_id lookups are case-insensitive, unknown pairs still raise ValueError"""
+    price = make_price()
+
+    assert (await price.get_latest_price_json_by_feed('0X02'))['from'] == 'EUR'
+    with pytest.raises(ValueError):
+        await price.get_price('XAU', 'USD')
+
+
+@pytest.mark.asyncio
+async def test_stale_feed_refetches_once_then_raises():
+    """A feed older than max_feed_age_ms triggers one refetch, then StalePriceError"""
+    price = make_price(max_age_ms=60_000)
+
+    await price.get_price('BTC', 'USD')
+    with pytest.raises(StalePriceError):
+        await price.get_price('BTC', 'USD', max_feed_age_ms=1000)
+
+    assert price.downloads == 2
+    assert price.get_staleness_metrics()['fetch_latency_ms']['count'] == 2
+
+
+@pytest.mark.asyncio
+async def test_fresh_feed_is_served_from_cache():
+    """No refetch when the cached price is within max_feed_age_ms"""
+    price = make_price(max_age_ms=60_000)
+
+    await price.get_price('BTC', 'USD')
+    mid, _, _ = await price.get_price('BTC', 'USD', max_feed_age_ms=10 ** 15)
+
+    assert mid == 100.0
+    assert price.downloads == 1
@@ -0,0 +1,38 @@
+import pytest
+
+from ostium_python_sdk.price import PriceSnapshot
+from ostium_python_sdk.price_history import PriceHistory, PriceRingBuffer
+
+
+def test_ring_buffer_keeps_the_newest_samples_in_order():
+    """Wrapping overwrites the oldest samples and last() stays chronological"""
+    buffer = PriceRingBuffer(capacity=3)
+    for i in range(5):
+        buffer.append(i, i - 0.5, i, i + 0.5)
+
+    assert len(buffer) == 3
+    assert list(buffer.timestamps) == [2, 3, 4]
+    assert list(buffer.last(2)[:, 2]) == [3, 4]
+    assert list(buffer.since(3)[:, 0]) == [3, 4]
+    assert buffer._data.shape == (3, 4)
+
+
+def test_ring_buffer_rejects_empty_capacity():
+    with pytest.raises(ValueError):
+        PriceRingBuffer(capacity=0)
+
+
+def test_history_records_only_advancing_timestamps():
+    """Re-polling an unchanged feed does not add duplicate samples"""
+    history = PriceHistory(capacity=10)
+
+    def snapshot(mid, timestamp):
+        return PriceSnapshot([{'from': 'BTC', 'to': 'USD', 'bid': mid - 1, 'mid': mid,
+                               'ask': mid + 1, 'timestampSeconds': timestamp}])
+
+    history.update(snapshot(100, 1))
+    history.update(snapshot(100, 1))
+    history.update(snapshot(101, 2))
+
+    assert list(history.get('BTC', 'USD').mids) == [100, 101]
+    assert history.get('ETH', 'USD') is None
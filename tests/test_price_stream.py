@@ -0,0 +1,93 @@
+import pytest
+
+from ostium_python_sdk.price import Price, PriceSnapshot
+from ostium_python_sdk.price_stream import PollScheduler, PriceStream
+
+
+def make_price(payloads):
+    price = Price(max_age_ms=0)
+    payloads = iter(payloads)
+
+    async def download():
+        return next(payloads)
+
+    price._download_latest_prices = download
+    return price
+
+
+def record(from_asset, mid, timestamp):
+    return {'feed_id': f'0x{from_asset}', 'mid': mid, 'from': from_asset, 'to': 'USD',
+            'isMarketOpen': True, 'timestampSeconds': timestamp}
+
+
+@pytest.mark.asyncio
+async def test_only_changed_pairs_are_pushed():
+    """Pairs whose timestampSeconds did not move are not fanned out"""
+    price = make_price([
+        [record('BTC', 100, 1), record('ETH', 10, 1)],
+        [record('BTC', 101, 2), record('ETH', 10, 1)],
+    ])
+    stream = PriceStream(price, interval=0)
+    everything = stream.subscribe()
+    eth_only = stream.subscribe(pairs=[('ETH', 'USD')])
+
+    await stream.poll_once()
+    await stream.poll_once()
+
+    assert [p['mid'] for p in everything.get_nowait()] == [100, 10]
+    assert [p['mid'] for p in everything.get_nowait()] == [101]
+    assert [p['from'] for p in eth_only.get_nowait()] == ['ETH']
+    assert eth_only.empty()
+
+
+@pytest.mark.asyncio
+async def test_full_queue_drops_oldest():
+    """A slow subscriber keeps the newest updates and the drop is counted"""
+    price = make_price([[record('BTC', mid, mid)] for mid in range(5)])
+    stream = PriceStream(price, interval=0)
+    queue = stream.subscribe(maxsize=2)
+
+    for _ in range(5):
+        await stream.poll_once()
+
+    assert stream.dropped == 3
+    assert [queue.get_nowait()[0]['mid'] for _ in range(2)] == [3, 4]
+
+
+@pytest.mark.asyncio
+async def test_late_subscriber_is_primed_with_current_prices():
+    """Subscribing after the first poll delivers the current snapshot"""
+    price = make_price([[record('BTC', 100, 1)]])
+    stream = PriceStream(price, interval=0)
+    await stream.poll_once()
+
+    queue = stream.subscribe()
+
+    assert queue.get_nowait()[0]['mid'] == 100
+
+
+def test_scheduler_follows_market_hours():
+    """Closed markets wait for their toggle time, 24/7 feeds poll fastest"""
+    scheduler = PollScheduler(active_interval=1, fast_interval=0.25, closed_interval=300)
+    snapshot = PriceSnapshot([
+        dict(record('BTC', 100, 1), secondsToToggleIsDayTradingClosed=-1),
+        dict(record('EUR', 1, 1), secondsToToggleIsDayTradingClosed=7200),
+        dict(record('TSLA', 200, 1), isMarketOpen=False, secondsToToggleIsDayTradingClosed=42),
+        dict(record('XAU', 2000, 1), isMarketOpen=False, secondsToToggleIsDayTradingClosed=-1),
+    ])
+
+    assert scheduler.next_delay(snapshot) == 0.25
+    assert scheduler.next_delay(snapshot, [('EUR', 'USD'), ('TSLA', 'USD')]) == 1
+    assert scheduler.next_delay(snapshot, [('TSLA', 'USD'), ('XAU', 'USD')]) == 42
+    assert scheduler.next_delay(snapshot, [('XAU', 'USD')]) == 300
+
+
+def test_stream_delay_uses_subscribed_pairs():
+    """Only the pairs subscribers asked for drive the stream's cadence"""
+    stream = PriceStream(Price(), scheduler=PollScheduler(closed_interval=300))
+    stream._last_snapshot = PriceSnapshot([
+        dict(record('TSLA', 200, 1), isMarketOpen=False, secondsToToggleIsDayTradingClosed=-1)])
+
+    stream.subscribe(pairs=[('TSLA', 'USD')])
+
+    assert stream.next_delay() == 300
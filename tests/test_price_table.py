@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from ostium_python_sdk.price import Price
+from ostium_python_sdk.price_table import PriceTable
+
+PAIRS = [{'id': '0', 'feed': '0xAA', 'from': 'BTC', 'to': 'USD'},
+         {'id': '3', 'feed': '0xbb', 'from': 'EUR', 'to': 'USD'}]
+
+
+def make_price(payloads):
+    price = Price(max_age_ms=0)
+    payloads = iter(payloads)
+
+    async def download():
+        return next(payloads)
+
+    price._download_latest_prices = download
+    return price
+
+
+def record(feed_id, mid, is_open=True):
+    return {'feed_id': feed_id, 'bid': mid - 1, 'mid': mid, 'ask': mid + 1,
+            'isMarketOpen': is_open, 'timestampSeconds': 1748460056}
+
+
+@pytest.mark.asyncio
+async def test_arrays_are_indexed_by_pair_id_and_refreshed_in_place():
+    """Views taken before a snapshot see the new prices afterwards"""
+    price = make_price([[record('0xaa', 100), record('0xbb', 2, is_open=False)],
+                        [record('0xaa', 110)]])
+    table = PriceTable()
+    table.set_pairs(PAIRS)
+    table.attach(price)
+    mid_view = table.mid
+
+    await price.get_latest_prices()
+    assert mid_view[0] == 100 and mid_view[3] == 2
+    assert np.isnan(mid_view[1])
+    assert list(table.is_market_open[[0, 3]]) == [True, False]
+
+    await price.get_latest_prices()
+    assert mid_view[0] == 110 and mid_view[3] == 2
+
+
+@pytest.mark.asyncio
+async def test_gather_fancy_indexes_many_positions():
+    """gather() returns bid/mid/ask arrays aligned with the given pair ids"""
+    price = make_price([[record('0xaa', 100), record('0xbb', 2)]])
+    table = PriceTable()
+    table.set_pairs(PAIRS)
+    table.attach(price)
+    await price.get_latest_prices()
+
+    bid, mid, ask = table.gather([3, 0, 0])
+
+    assert list(mid) == [2, 100, 100]
+    assert list(ask - bid) == [2, 2, 2]
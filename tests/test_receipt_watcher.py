@@ -0,0 +1,120 @@
+import asyncio
+
+import pytest
+from hexbytes import HexBytes
+from web3.datastructures import AttributeDict
+from web3.exceptions import ContractLogicError, TimeExhausted, TransactionNotFound
+
+from ostium_python_sdk.exceptions import TransactionRevertedError
+from ostium_python_sdk.ostium import PRICE_REQUESTED_TOPIC
+from ostium_python_sdk.receipt_watcher import PendingTransaction, ReceiptWatcher
+
+from .conftest import ADDRESS, CONTRACT, tx_hash
+
+
+class FakeEth:
+    """Receipts found once mined_after lookups of a transaction were made, never for unknown ones"""
+
+    def __init__(self, mined_after, reverted=()):
+        self.mined_after = mined_after  # tx hash -> lookups before it's mined
+        self.reverted = set(reverted)
+        self.lookups = {}
+
+    def get_transaction_receipt(self, transaction_hash):
+        lookups = self.lookups[transaction_hash] = self.lookups.get(transaction_hash, 0) + 1
+        if transaction_hash not in self.mined_after or lookups <= self.mined_after[transaction_hash]:
+            raise TransactionNotFound("not mined yet")
+        order_id = int.from_bytes(transaction_hash, 'big') + 100
+        status = 0 if transaction_hash in self.reverted else 1
+        return AttributeDict({'status': status, 'gasUsed': 21000, 'blockNumber': 7, 'logs': [
+            {'topics': [HexBytes(PRICE_REQUESTED_TOPIC), HexBytes(order_id.to_bytes(32, 'big'))]}]})
+
+    def get_transaction(self, transaction_hash):
+        return AttributeDict({'from': CONTRACT, 'to': CONTRACT, 'input': '0x', 'value': 0, 'gas': 21000})
+
+    def call(self, transaction, block_identifier):
+        raise ContractLogicError("execution reverted: slippage")
+
+
+class FakeWeb3:
+    def __init__(self, mined_after, reverted=()):
+        self.eth = FakeEth(mined_after, reverted)
+
+
+@pytest.mark.asyncio
+async def test_futures_settle_as_their_receipts_arrive():
+    watcher = ReceiptWatcher(FakeWeb3({tx_hash(1): 0, tx_hash(2): 2}), poll_interval=0.01)
+    try:
+        first = PendingTransaction(tx_hash(1), watcher.watch(tx_hash(1), settle=lambda receipt: receipt['blockNumber']))
+        second = PendingTransaction(tx_hash(2), watcher.watch(tx_hash(2)))
+
+        assert await first == 7
+        assert not second.done()
+        receipt = await second
+    finally:
+        watcher.close()
+
+    assert receipt['status'] == 1
+    assert watcher.pending_count() == 0
+
+
+def test_unmined_transaction_times_out():
+    dropped = []
+    watcher = ReceiptWatcher(FakeWeb3({}), poll_interval=0.01, timeout=0.05)
+    try:
+        future = watcher.watch(tx_hash(3), dropped=lambda: dropped.append(True))
+        with pytest.raises(TimeExhausted):
+            future.result(timeout=1)
+    finally:
+        watcher.close()
+    assert dropped == [True]
+
+
+def test_settling_a_future_cancelled_by_close_is_ignored():
+    watcher = ReceiptWatcher(FakeWeb3({tx_hash(4): 0}), poll_interval=60)
+    future = watcher.watch(tx_hash(4))
+    future.cancel()  # as close() does while a poll is running
+
+    watcher.poll_once()
+
+    assert future.cancelled()
+    watcher.close()
+
+
+@pytest.fixture
+def submitting_ostium(fake_client):
+    def make(watcher):
+        """Ostium sending to a fake node, its receipts polled by watcher"""
+        ostium = fake_client(receipt_watcher=watcher)
+        ostium.nonces.sync(ADDRESS, 0)
+        return ostium
+
+    return make
+
+
+@pytest.mark.asyncio
+async def test_submit_close_trade_returns_before_the_receipt(submitting_ostium):
+    watcher = ReceiptWatcher(FakeWeb3({tx_hash(1): 3}), poll_interval=0.01)
+    ostium = submitting_ostium(watcher)
+    try:
+        pending = ostium.submit_close_trade(1, 0)
+        assert pending.tx_hash == tx_hash(1)
+        assert not pending.done()
+
+        result = await asyncio.wait_for(pending, 1)
+    finally:
+        watcher.close()
+
+    assert result['order_id'] == 101
+
+
+@pytest.mark.asyncio
+async def test_reverted_submission_fails_its_pending_transaction(submitting_ostium):
+    watcher = ReceiptWatcher(FakeWeb3({tx_hash(1): 0}, reverted=[tx_hash(1)]), poll_interval=0.01)
+    ostium = submitting_ostium(watcher)
+    try:
+        pending = ostium.submit_close_trade(1, 0)
+        with pytest.raises(TransactionRevertedError, match="slippage"):
+            await asyncio.wait_for(pending, 1)
+    finally:
+        watcher.close()
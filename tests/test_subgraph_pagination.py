@@ -0,0 +1,90 @@
+import pytest
+
+from ostium_python_sdk.subgraph import (SubgraphClient, HISTORY_PAGE_QUERY, ORDERS_QUERY, PAIRS_QUERY,
+                                        OPEN_TRADES_QUERY, OPEN_TRADES_BY_TRADERS_QUERY)
+
+
+class FakeSubgraph(SubgraphClient):
+    """SubgraphClient answering from in-memory records, keyed by the root field of each query"""
+
+    def __init__(self, records, pairs=()):
+        super().__init__(url="http://127.0.0.1:1/graphql")
+        self.records = records
+        self.pairs = list(pairs)
+        self.requests = []
+        self.pair_requests = 0
+
+    async def _execute(self, document, variable_values=None):
+        if document is PAIRS_QUERY:
+            self.pair_requests += 1
+            return {'pairs': [p for p in self.pairs if p['id'] > variable_values['last_id']]}
+
+        self.requests.append(dict(variable_values))
+        field = {HISTORY_PAGE_QUERY: 'orders', ORDERS_QUERY: 'limits', OPEN_TRADES_QUERY: 'trades',
+                 OPEN_TRADES_BY_TRADERS_QUERY: 'trades'}[document]
+        traders = variable_values.get('traders')
+        rows = sorted((dict(r) for r in self.records if r['id'] > variable_values['last_id']
+                       and (traders is None or r['trader'] in traders)), key=lambda r: r['id'])
+        return {field: rows[:variable_values['first']]}
+
+
+@pytest.mark.asyncio
+async def test_iter_history_pages_with_id_cursor():
+    """Every record is yielded once, one page at a time, each page starting after the last id"""
+    records = [{'id': f"{i:04d}"} for i in range(25)]
+    subgraph = FakeSubgraph(records)
+
+    seen = [order['id'] async for order in subgraph.iter_history("0xabc", page_size=10)]
+
+    assert seen == [r['id'] for r in records]
+    assert [r['last_id'] for r in subgraph.requests] == ["", "0009", "0019"]
+    assert all(r['trader'] == "0xabc" for r in subgraph.requests)
+
+
+@pytest.mark.asyncio
+async def test_get_orders_collects_every_page_sorted_by_initiated_at():
+    """get_orders is no longer capped at one page and keeps the oldest-first order"""
+    records = [{'id': f"{i:04d}", 'initiatedAt': str(2000 - i)} for i in range(2500)]
+    subgraph = FakeSubgraph(records)
+
+    orders = await subgraph.get_orders("0xabc")
+
+    assert len(orders) == 2500
+    assert len(subgraph.requests) == 3
+    assert [int(o['initiatedAt']) for o in orders] == sorted(int(r['initiatedAt']) for r in records)
+
+
+@pytest.mark.asyncio
+async def test_open_trades_for_traders_are_batched_and_grouped():
+    """Many traders share trader_in requests and results come back keyed by the given addresses"""
+    records = [{'id': f"{i:04d}", 'trader': f"0x{i % 3:040x}", 'pair': {'id': '0'}} for i in range(30)]
+    subgraph = FakeSubgraph(records, pairs=[{'id': '0'}])
+    addresses = [f"0x{i:040X}".replace('0X', '0x') for i in range(5)]
+
+    trades = await subgraph.get_open_trades_for_traders(addresses)
+
+    assert list(trades) == addresses
+    assert [len(trades[a]) for a in addresses] == [10, 10, 10, 0, 0]
+    assert len(subgraph.requests) == 1
+    assert subgraph.requests[0]['traders'] == [a.lower() for a in addresses]
+
+
+@pytest.mark.asyncio
+async def test_open_trades_are_joined_against_cached_pairs():
+    """Trades carry only the pair id, the pairs are fetched once per ttl and shared"""
+    records = [{'id': f"{i:04d}", 'trader': "0xabc", 'pair': {'id': str(i % 2)}} for i in range(6)]
+    subgraph = FakeSubgraph(records, pairs=[{'id': '0', 'from': 'BTC'}, {'id': '1', 'from': 'ETH'}])
+
+    trades = await subgraph.get_open_trades("0xabc")
+    assert [t['pair']['from'] for t in trades] == ['BTC', 'ETH'] * 3
+    assert trades[0]['pair'] is trades[2]['pair']
+
+    await subgraph.get_open_trades("0xabc")
+    assert subgraph.pair_requests == 1
+
+    # a pair listed after the last refresh triggers one early refetch
+    subgraph.records.append({'id': '0100', 'trader': "0xabc", 'pair': {'id': '2'}})
+    subgraph.pairs.append({'id': '2', 'from': 'SPX'})
+    trades = await subgraph.get_open_trades("0xabc")
+    assert trades[-1]['pair']['from'] == 'SPX'
+    assert subgraph.pair_requests == 2
@@ -0,0 +1,20 @@
+import pytest
+from graphql import DocumentNode, GraphQLError
+
+from ostium_python_sdk import subgraph
+from ostium_python_sdk.subgraph import gql
+from ostium_python_sdk.subgraph_schema import validate_document
+
+DOCUMENTS = {name: value for name, value in vars(subgraph).items()
+             if isinstance(value, DocumentNode)}
+
+
+@pytest.mark.parametrize("name", sorted(DOCUMENTS))
+def test_document_matches_query_whitelist(name):
+    """Every precompiled subgraph document validates against the query whitelist"""
+    validate_document(DOCUMENTS[name])
+
+
+def test_unknown_field_is_rejected():
+    with pytest.raises(GraphQLError):
+        validate_document(gql("query { pairs { id notAField } }"))
@@ -0,0 +1,82 @@
+import asyncio
+import pytest
+from aiohttp import web
+from gql import gql
+from gql.transport.exceptions import TransportServerError
+
+from ostium_python_sdk.http_pool import HttpPool
+from ostium_python_sdk.subgraph_transport import MultiEndpointGraphQLTransport
+
+
+async def start_server(handler):
+    app = web.Application()
+    app.router.add_post('/graphql', handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}/graphql"
+
+
+QUERY = gql("query { pairs { id } }")
+
+
+def answering(name, delay=0, status=200, calls=None):
+    async def handler(request):
+        if calls is not None:
+            calls.append(name)
+        await asyncio.sleep(delay)
+        if status != 200:
+            return web.Response(status=status)
+        return web.json_response({'data': {'pairs': [{'id': name}]}})
+    return handler
+
+
+@pytest.mark.asyncio
+async def test_slow_endpoint_is_hedged_on_the_next_one():
+    """A query still unanswered after the hedge delay is duplicated and the fastest answer wins"""
+    slow, slow_url = await start_server(answering('slow', delay=1))
+    fast, fast_url = await start_server(answering('fast'))
+    pool = HttpPool()
+    transport = MultiEndpointGraphQLTransport([slow_url, fast_url], http=pool, hedge_delay=0.05)
+    try:
+        result = await transport.execute(QUERY)
+        assert result.data == {'pairs': [{'id': 'fast'}]}
+        assert transport.hedged == 1
+        # the slow endpoint lost the race and is not tried first anymore
+        assert transport.ranked_endpoints()[0].url == fast_url
+    finally:
+        await pool.close()
+        await slow.cleanup()
+        await fast.cleanup()
+
+
+@pytest.mark.asyncio
+async def test_failed_endpoint_is_retried_elsewhere_and_4xx_is_not():
+    """5xx answers are retried on the next endpoint after backoff, 4xx answers raise at once"""
+    calls = []
+    broken, broken_url = await start_server(answering('broken', status=503, calls=calls))
+    healthy, healthy_url = await start_server(answering('healthy', calls=calls))
+    rejecting, rejecting_url = await start_server(answering('rejecting', status=400, calls=calls))
+    pool = HttpPool()
+    try:
+        transport = MultiEndpointGraphQLTransport([broken_url, healthy_url], http=pool, backoff=0, hedge=False)
+        result = await transport.execute(QUERY)
+        assert result.data == {'pairs': [{'id': 'healthy'}]}
+        assert calls == ['broken', 'healthy'] and transport.retried == 1
+        assert transport.get_stats()[broken_url]['cooling_down']
+
+        # the failed endpoint is ranked last now
+        calls.clear()
+        await transport.execute(QUERY)
+        assert calls == ['healthy']
+
+        transport = MultiEndpointGraphQLTransport([rejecting_url], http=pool, backoff=0)
+        with pytest.raises(TransportServerError):
+            await transport.execute(QUERY)
+        assert transport.retried == 0
+    finally:
+        await pool.close()
+        for runner in (broken, healthy, rejecting):
+            await runner.cleanup()
@@ -37,13 +37,16 @@ Signal Format Examples:
 import os
 import sys
 import asyncio
+import threading
 import json
 import logging
 import re
+import time
 from datetime import datetime
 from decimal import Decimal
 from typing import Dict, Optional, Tuple, List
 from dataclasses import dataclass
+import numpy as np
 from flask import Flask, request, jsonify
 from dotenv import load_dotenv
 
@@ -52,6 +55,9 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "."))
 
 from ostium_python_sdk import OstiumSDK
 from ostium_python_sdk.config import NetworkConfig
+from ostium_python_sdk.price_history import MID, PriceHistory
+from ostium_python_sdk.price_stream import PriceStream
+from ostium_python_sdk.history_store import OrderHistoryStore
 
 # Configure logging
 logging.basicConfig(
@@ -222,6 +228,11 @@ class OstiumTradingBot:
     def __init__(self, network_config: NetworkConfig, private_key: str, rpc_url: str):
         """Initialize the trading bot with Ostium SDK"""
         self.sdk = OstiumSDK(network_config, private_key, rpc_url, verbose=True)
+        # Open positions are read from the tradingStorage contract while the subgraph is this far behind
+        self.sdk.subgraph.max_lag_blocks = int(os.getenv('SUBGRAPH_MAX_LAG_BLOCKS', self.sdk.subgraph.max_lag_blocks))
+        # USDC approvals (in USDC): approve this much at a time, topped up in the background below the threshold
+        self.sdk.allowances.approve_amount = int(Decimal(os.getenv('USDC_APPROVE_AMOUNT', 1000000)) * 10 ** 6)
+        self.sdk.allowances.top_up_below = int(Decimal(os.getenv('USDC_TOP_UP_BELOW', 250000)) * 10 ** 6)
         self.signal_parser = TradingViewSignalParser()
         
         # Trading configuration
@@ -229,9 +240,35 @@ class OstiumTradingBot:
         self.max_leverage = 100     # Maximum leverage allowed
         self.min_collateral = 10    # Minimum collateral in USDC
         self.max_collateral = 10000 # Maximum collateral in USDC
+
+        # Price freshness for market orders (milliseconds)
+        self.price_snapshot_max_age_ms = int(os.getenv('PRICE_SNAPSHOT_MAX_AGE_MS', 250))  # reuse a cached snapshot up to this age
+        self.price_max_feed_age_ms = int(os.getenv('PRICE_MAX_FEED_AGE_MS', 10000))       # refuse to trade on older prices
         
         # Position tracking
         self.active_positions = {}  # Track active positions by signal_id
+
+        # Recent prices of every pair, fed by each price snapshot the SDK fetches - the price
+        # stream started below polls one every price_poll_interval seconds (bounded per pair,
+        # so memory stays flat over long uptimes)
+        self.price_history = PriceHistory(capacity=int(os.getenv('PRICE_HISTORY_CAPACITY', 3600)))
+        self.price_history.attach(self.sdk.price)
+        self.price_stream = PriceStream(self.sdk.price, interval=float(os.getenv('PRICE_POLL_INTERVAL_SECONDS', 1)))
+        # Market orders are refused when the price strays more than this (percent) from the
+        # median of the last price_deviation_window seconds
+        self.price_max_deviation_pct = float(os.getenv('PRICE_MAX_DEVIATION_PCT', 2))
+        self.price_deviation_window = float(os.getenv('PRICE_DEVIATION_WINDOW_SECONDS', 60))
+        self.price_deviation_min_samples = 5
+
+        # Local copy of the order history, synced incrementally from the subgraph
+        self.history_store = OrderHistoryStore(self.sdk.subgraph, path=os.getenv('ORDER_HISTORY_DB', 'ostium_history.db'))
+
+        # The SDK's I/O runs on one long-lived loop: each webhook request runs on a loop that is
+        # gone once it has answered, which would leave nothing for the keep-alive HTTP pool to
+        # reuse, and the follow-ups of submitted transactions (receipt, order tracking) outlive it
+        self.sdk_loop = asyncio.new_event_loop()
+        threading.Thread(target=self.sdk_loop.run_forever, name="ostium-sdk-io", daemon=True).start()
+        self.follow_up(self._start_price_stream())
         
         logger.info("Trading bot initialized successfully")
     
@@ -270,10 +307,10 @@ class OstiumTradingBot:
         
         return None
     
-    async def get_open_positions(self) -> List[Dict]:
-        """Get current open positions"""
+    async def get_open_positions(self, pair_ids=None) -> List[Dict]:
+        """Get current open positions, optionally only in the given pairs"""
         try:
-            open_trades, trader_address = await self.sdk.get_open_trades()
+            open_trades, trader_address = await self.sdk.get_open_trades(pair_ids=pair_ids)
             logger.info(f"Found {len(open_trades)} open positions")
             return open_trades
         except Exception as e:
@@ -293,6 +330,21 @@ class OstiumTradingBot:
             # Default to a percentage of available capital
             return min(available_capital * 0.1, available_capital)  # 10% of capital
     
+    def check_price_deviation(self, from_asset: str, to_asset: str, price: float):
+        """Raises if price is more than price_max_deviation_pct away from the median mid of the last window"""
+        history = self.price_history.get(from_asset, to_asset)
+        samples = history.since(time.time() - self.price_deviation_window) if history is not None else None
+        if samples is None or len(samples) < self.price_deviation_min_samples:
+            return  # not enough recent prices (just started, or a market that is closed)
+        
+        median = float(np.nanmedian(samples[:, MID]))
+        if not median:
+            return
+        deviation_pct = abs(price - median) / median * 100
+        if deviation_pct > self.price_max_deviation_pct:
+            raise Exception(
+                f"Price {price} of {from_asset}/{to_asset} is {deviation_pct:.2f}% away from its recent median {median}")
+    
     async def execute_trade(self, signal: TradingSignal) -> Dict:
         """Execute a trade based on the signal"""
         try:
@@ -324,7 +376,11 @@ class OstiumTradingBot:
             is_long = signal.side.lower() == 'long'
             
             # Get current price
-            current_price, _, _ = await self.sdk.price.get_price(signal.symbol[:3], signal.symbol[3:])
+            current_price, _, _ = await self.sdk.price.get_price(
+                signal.symbol[:3], signal.symbol[3:],
+                max_age_ms=self.price_snapshot_max_age_ms,
+                max_feed_age_ms=self.price_max_feed_age_ms)
+            self.check_price_deviation(signal.symbol[:3], signal.symbol[3:], current_price)
             
             # Prepare trade parameters
             trade_params = {
@@ -352,8 +408,9 @@ class OstiumTradingBot:
             
             logger.info(f"Executing trade with params: {trade_params}")
             
-            # Execute the trade
-            trade_result = self.sdk.ostium.perform_trade(trade_params, at_price=current_price)
+            # Send the trade: the webhook answers as soon as it's sent, the receipt and the
+            # resulting trade are followed up in the background
+            pending = await self.sdk.async_ostium.submit_trade(trade_params, at_price=current_price)
             
             # Store position information
             position_info = {
@@ -365,25 +422,14 @@ class OstiumTradingBot:
                 'position_size': position_size,
                 'timestamp': datetime.now().isoformat()
             }
+            self.follow_up(self._follow_up_trade(pending, position_info))
             
-            # Track the order to get the trade index
-            if trade_result.get('order_id'):
-                order_result = await self.sdk.ostium.track_order_and_trade(
-                    self.sdk.subgraph, 
-                    trade_result['order_id']
-                )
-                
-                if order_result.get('trade'):
-                    trade = order_result['trade']
-                    position_info['trade_index'] = trade.get('index', 0)
-                    self.active_positions[signal.signal_id] = position_info
-            
-            logger.info(f"Trade executed successfully. Transaction: {trade_result['receipt']['transactionHash'].hex()}")
+            logger.info(f"Trade submitted. Transaction: {pending.tx_hash.hex()}")
             
             return {
                 'success': True,
-                'transaction_hash': trade_result['receipt']['transactionHash'].hex(),
-                'order_id': trade_result.get('order_id'),
+                'status': 'submitted',
+                'transaction_hash': pending.tx_hash.hex(),
                 'position_info': position_info
             }
             
@@ -400,8 +446,13 @@ class OstiumTradingBot:
             # Find the position to close
             position = self.active_positions.get(signal.signal_id)
             if not position:
-                # Try to find by symbol if signal_id doesn't match
-                open_positions = await self.get_open_positions()
+                # Try to find by symbol if signal_id doesn't match, only reading the
+                # symbol's pairs (an on-chain read while the subgraph lags). The cached pairs
+                # are used whatever their age, so an exit never waits on the subgraph
+                pairs = await self.sdk.subgraph.get_cached_pairs_by_id()
+                pair_ids = [pair_id for pair_id, pair in pairs.items()
+                            if f"{pair['from']}{pair['to']}" == signal.symbol]
+                open_positions = await self.get_open_positions(pair_ids=pair_ids) if pair_ids else []
                 matching_position = None
                 
                 for pos in open_positions:
@@ -420,29 +471,22 @@ class OstiumTradingBot:
             
             logger.info(f"Closing position: Pair {position['pair_id']}, Index {position['trade_index']}")
             
-            # Close the position
-            close_result = self.sdk.ostium.close_trade(
+            # Close the position, the receipt and the close order are followed up in the background
+            pending = await self.sdk.async_ostium.submit_close_trade(
                 position['pair_id'], 
                 position['trade_index']
             )
             
-            # Track the close order
-            if close_result.get('order_id'):
-                order_result = await self.sdk.ostium.track_order_and_trade(
-                    self.sdk.subgraph, 
-                    close_result['order_id']
-                )
-            
-            # Remove from active positions
-            if signal.signal_id in self.active_positions:
-                del self.active_positions[signal.signal_id]
+            # Remove from active positions (put back by the follow-up if the close fails)
+            removed = self.active_positions.pop(signal.signal_id, None)
+            self.follow_up(self._follow_up_close(pending, signal.signal_id, removed))
             
-            logger.info(f"Position closed successfully. Transaction: {close_result['receipt']['transactionHash'].hex()}")
+            logger.info(f"Position close submitted. Transaction: {pending.tx_hash.hex()}")
             
             return {
                 'success': True,
-                'transaction_hash': close_result['receipt']['transactionHash'].hex(),
-                'order_id': close_result.get('order_id')
+                'status': 'submitted',
+                'transaction_hash': pending.tx_hash.hex()
             }
             
         except Exception as e:
@@ -452,6 +496,68 @@ class OstiumTradingBot:
                 'error': str(e)
             }
     
+    async def _start_price_stream(self):
+        self.price_stream.start()
+    
+    def follow_up(self, coro):
+        """Runs coro on the SDK loop, which outlives the request that submitted the transaction"""
+        return asyncio.run_coroutine_threadsafe(coro, self.sdk_loop)
+    
+    async def run(self, coro):
+        """Awaits coro run on the SDK loop, e.g. from a request's loop"""
+        return await asyncio.wrap_future(self.follow_up(coro))
+    
+    async def _follow_up_trade(self, pending, position_info):
+        """Waits for a submitted trade to be mined and executed, then records its position"""
+        tx_hash = pending.tx_hash.hex()
+        try:
+            trade_result = await pending
+            logger.info(f"Trade mined. Transaction: {tx_hash}")
+            if not trade_result.get('order_id'):
+                raise Exception("mined without an order")
+            
+            # Track the order to get the trade index (polled together with every other pending order)
+            order_result = await self.sdk.order_tracker.track(
+                trade_result['order_id'],
+                block_number=trade_result['receipt']['blockNumber']
+            )
+            if not order_result.get('trade'):
+                raise Exception(f"order {trade_result['order_id']} was not executed (cancelled or timed out)")
+            
+            position_info['trade_index'] = order_result['trade'].get('index', 0)
+            self.active_positions[position_info['signal_id']] = position_info
+        except Exception as e:
+            await self._notify_follow_up_error(f"Trade {tx_hash} failed: {e}", 'Trade Execution')
+    
+    async def _follow_up_close(self, pending, signal_id, removed_position=None):
+        """Waits for a submitted close to be mined and executed, restores the position if it fails"""
+        tx_hash = pending.tx_hash.hex()
+        try:
+            close_result = await pending
+            logger.info(f"Position close mined. Transaction: {tx_hash}")
+            if not close_result.get('order_id'):
+                raise Exception("mined without an order")
+            
+            order_result = await self.sdk.order_tracker.track(
+                close_result['order_id'],
+                block_number=close_result['receipt']['blockNumber']
+            )
+            if not order_result.get('trade'):
+                raise Exception(f"close order {close_result['order_id']} was not executed (cancelled or timed out)")
+        except Exception as e:
+            if removed_position is not None:
+                self.active_positions.setdefault(signal_id, removed_position)
+            await self._notify_follow_up_error(f"Close {tx_hash} failed: {e}", 'Position Close')
+    
+    async def _notify_follow_up_error(self, message, context):
+        # The webhook has already answered 'submitted': Discord is where a failure shows up
+        logger.error(message)
+        if discord_notifier:
+            try:
+                await discord_notifier.notify_error(message, context)
+            except Exception as e:
+                logger.error(f"Error sending error notification: {e}")
+    
     async def process_signal(self, signal_text: str) -> Dict:
         """Process a TradingView signal"""
         try:
@@ -514,19 +620,19 @@ async def webhook_handler():
         if discord_notifier:
             try:
                 signal = trading_bot.signal_parser.parse_signal(signal_text)
-                await discord_notifier.notify_signal_received({
+                await trading_bot.run(discord_notifier.notify_signal_received({
                     'symbol': signal.symbol,
                     'signal_id': signal.signal_id,
                     'signal_type': 'Exit' if signal.is_exit_signal else 'Entry',
                     'side': signal.side,
                     'position_size': signal.position_size_usd,
                     'entry_price': signal.entry_price
-                })
+                }))
             except Exception as e:
                 logger.error(f"Error sending Discord notification: {e}")
         
-        # Process the signal
-        result = await trading_bot.process_signal(signal_text)
+        # Process the signal (on the SDK loop, whose keep-alive connections outlive this request)
+        result = await trading_bot.run(trading_bot.process_signal(signal_text))
         
         if result['success']:
             # Notify Discord about successful trade
@@ -534,7 +640,7 @@ async def webhook_handler():
                 try:
                     position_info = result['result']['position_info']
                     if 'transaction_hash' in result.get('result', {}):
-                        await discord_notifier.notify_trade_opened({
+                        await trading_bot.run(discord_notifier.notify_trade_opened({
                             'symbol': position_info.get('symbol', 'Unknown'),
                             'side': position_info.get('side', 'Unknown'),
                             'position_size': position_info.get('position_size', 0),
@@ -543,7 +649,7 @@ async def webhook_handler():
                             'transaction_hash': result['result']['transaction_hash'],
                             'stop_loss': position_info.get('stop_loss'),
                             'take_profit': position_info.get('take_profit')
-                        })
+                        }))
                 except Exception as e:
                     logger.error(f"Error sending trade notification: {e}")
             
@@ -556,10 +662,10 @@ async def webhook_handler():
             # Notify Discord about error
             if discord_notifier:
                 try:
-                    await discord_notifier.notify_error(
+                    await trading_bot.run(discord_notifier.notify_error(
                         result.get('error', 'Unknown error'),
                         'Signal Processing'
-                    )
+                    ))
                 except Exception as e:
                     logger.error(f"Error sending error notification: {e}")
             
@@ -586,10 +692,10 @@ def health_check():
 async def get_positions():
     """Get current positions"""
     try:
-        open_positions = await trading_bot.get_open_positions()
+        open_positions = await trading_bot.run(trading_bot.get_open_positions())
         return jsonify({
             'success': True,
-            'positions': open_positions,
+            'positions': [position.to_dict() for position in open_positions],
             'active_signals': trading_bot.active_positions
         })
     except Exception as e:
@@ -619,9 +725,26 @@ async def initialize_bot():
         network_config = NetworkConfig.mainnet()
     else:
         network_config = NetworkConfig.testnet()
+
+    # Optional fallback subgraph endpoints (comma separated), used for retries and hedged reads
+    graph_fallback_urls = [url.strip() for url in os.getenv('GRAPH_FALLBACK_URLS', '').split(',') if url.strip()]
+    if graph_fallback_urls:
+        network_config.graph_urls = list(dict.fromkeys(network_config.graph_urls + graph_fallback_urls))
+
+    # Open positions are only read on-chain while the subgraph lags once pairsInfo is configured
+    if os.getenv('PAIRS_INFO_ADDRESS'):
+        network_config.contracts["pairsInfo"] = os.getenv('PAIRS_INFO_ADDRESS')
     
     # Initialize trading bot
     trading_bot = OstiumTradingBot(network_config, private_key, rpc_url)
+
+    # Start refreshing fees, and read (and top up if low) the USDC allowance now, so the first trade doesn't wait on them
+    trading_bot.sdk.fee_oracle.start()
+    try:
+        allowance = await trading_bot.run(trading_bot.sdk.async_ostium.prepare_allowance())
+        logger.info(f"USDC allowance: {allowance / 10 ** 6}")
+    except Exception as e:
+        logger.warning(f"Could not prepare the USDC allowance, it will be checked on the first trade: {e}")
     
     # Initialize Discord notifier if webhook URL is provided
     if discord_webhook_url: